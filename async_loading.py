@@ -0,0 +1,226 @@
+"""
+Relationship loading in async sessions.
+
+Async code can't lazy load: worker.resumes without an eager option raises
+MissingGreenlet, and inside run_sync() it quietly runs one SELECT per object.
+So in sessions of the async factories (database.async_session_factory and the
+others, refuse_implicit_lazy_loads(session_class) adds more) a relationship
+lazy load is refused before any SQL (raise_on_sql, DB_ASYNC_LAZY_LOAD) unless
+the relationship opts in:
+
+    resumes: Mapped[list["ResumeOrm"]] = relationship(info={ASYNC_LAZY: SELECT})
+
+Loads are explicit, through awaitable attributes:
+
+    resumes = await worker.awaitable_attrs.resumes
+
+With batching on (DB_ASYNC_LAZY_LOAD_BATCHING, or session.info[BATCH_LAZY_LOADS])
+awaited loads of a relationship started in the same event loop tick share one
+SELECT ... WHERE <key> IN (...), chunked like selectinload:
+
+    await asyncio.gather(*(w.awaitable_attrs.resumes for w in workers))  # 1 query, not len(workers)
+
+Composite keys and relationships with extra join criteria are loaded one by one.
+
+Code that runs through run_sync() and lazy loads on purpose opts out per session:
+
+    AsyncSession(engine, info={ALLOW_LAZY_LOADS: True})
+"""
+
+import asyncio
+from collections import defaultdict
+
+from sqlalchemy import exc, inspect, select
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_object_session, async_session
+from sqlalchemy.orm import RelationshipProperty, Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression
+from sqlalchemy.util import greenlet_spawn
+
+import config
+
+ASYNC_LAZY = "async_lazy"  # relationship(info={ASYNC_LAZY: ...}) overrides the default policy
+RAISE_ON_SQL = "raise_on_sql"
+SELECT = "select"
+
+BATCH_LAZY_LOADS = "batch_lazy_loads"  # session.info, overrides DB_ASYNC_LAZY_LOAD_BATCHING
+ALLOW_LAZY_LOADS = "allow_lazy_loads"  # session.info, lazy loads of run_sync() code are not refused
+BATCH_CHUNK_SIZE = 500  # keys an IN, same as selectinload
+
+_EXPLICIT = "async_lazy_explicit"  # session.info, awaited loads in progress
+_PENDING = "async_lazy_pending"  # session.info, relationship -> (instances, future) of this tick
+
+_flushes = set()  # running batch tasks, the loop only keeps weak references
+
+
+def lazy_policy(prop: RelationshipProperty) -> str:
+    return prop.info.get(ASYNC_LAZY, config.settings.DB_ASYNC_LAZY_LOAD)
+
+
+def _refuse_implicit_lazy_loads(orm_execute_state):
+    if not orm_execute_state.is_select:
+        return  # ORM bulk INSERT/UPDATE/DELETE have no load options
+    session = orm_execute_state.session
+    if orm_execute_state.lazy_loaded_from is None or session.info.get(_EXPLICIT) or session._flushing:
+        return  # not a lazy load, an awaited one, or the unit of work cascading
+    if session.info.get(ALLOW_LAZY_LOADS):
+        return  # run_sync() code, inside the greenlet
+    if async_session(session) is None:
+        return  # the class used without AsyncSession, sync sessions lazy load as before
+    prop = orm_execute_state.loader_strategy_path[-1]
+    if lazy_policy(prop) == RAISE_ON_SQL:
+        raise exc.InvalidRequestError(
+            f"'{prop}' is not loaded and async sessions don't lazy load ({RAISE_ON_SQL}): "
+            f"use selectinload()/joinedload() or `await obj.awaitable_attrs.{prop.key}`"
+        )
+
+
+def refuse_implicit_lazy_loads(session_class: type[Session]):
+    ## sync_session_class of an AsyncSession, not Session: the listener runs on every ORM execute
+    if not event.contains(session_class, "do_orm_execute", _refuse_implicit_lazy_loads):
+        event.listen(session_class, "do_orm_execute", _refuse_implicit_lazy_loads)
+
+
+########################################3
+# AWAITABLE ATTRIBUTES
+
+
+class AsyncLoadingAttrs(AsyncAttrs):
+    ## AsyncAttrs whose awaitable_attrs pass the raise_on_sql policy and batch relationship loads
+
+    @property
+    def awaitable_attrs(self) -> "_AwaitableAttrs":
+        return _AwaitableAttrs(self)
+
+
+class _AwaitableAttrs:
+    __slots__ = ("_instance",)
+
+    def __init__(self, instance):
+        self._instance = instance
+
+    def __getattr__(self, key: str):
+        return load_attribute(self._instance, key)
+
+
+async def load_attribute(instance, key: str):
+    state = inspect(instance)
+    if key in state.dict:
+        return state.dict[key]  # already loaded, no IO
+    session = async_object_session(instance)
+    prop = state.mapper.attrs.get(key)
+    if (
+        session is not None
+        and isinstance(prop, RelationshipProperty)
+        and session.sync_session.info.get(BATCH_LAZY_LOADS, config.settings.DB_ASYNC_LAZY_LOAD_BATCHING)
+        and _join_columns(prop) is not None
+    ):
+        return await _batched(session, prop, instance)
+    return await _explicit(session, instance, key)
+
+
+async def _explicit(session, instance, key: str):
+    if session is None:
+        return await greenlet_spawn(getattr, instance, key)  # raises DetachedInstanceError as usual
+    info = session.sync_session.info
+    info[_EXPLICIT] = info.get(_EXPLICIT, 0) + 1
+    try:
+        return await greenlet_spawn(getattr, instance, key)
+    finally:
+        info[_EXPLICIT] -= 1
+
+
+########################################3
+# BATCHING
+
+
+def _is_equality(expr) -> bool:
+    return isinstance(expr, BinaryExpression) and expr.operator is operators.eq
+
+
+def _join_columns(prop: RelationshipProperty):
+    """(parent column, column compared to it) for a single column join, None otherwise."""
+    if prop.secondary is None:
+        if len(prop.local_remote_pairs) != 1 or not _is_equality(prop.primaryjoin):
+            return None
+        return prop.local_remote_pairs[0]
+    if not (_is_equality(prop.primaryjoin) and _is_equality(prop.secondaryjoin)):
+        return None
+    ## many to many, the pair inside primaryjoin: parent column and the secondary column referring to it
+    for local, remote in prop.local_remote_pairs:
+        if remote.table is prop.secondary and local.table is not prop.secondary:
+            joined = {(c.table, c.key) for c in (prop.primaryjoin.left, prop.primaryjoin.right)}
+            if joined == {(local.table, local.key), (remote.table, remote.key)}:
+                return local, remote
+    return None
+
+
+async def _batched(session, prop: RelationshipProperty, instance):
+    pending = session.sync_session.info.setdefault(_PENDING, {})
+    if prop not in pending:
+        loop = asyncio.get_running_loop()
+        pending[prop] = ([], loop.create_future())
+        # starts after every task already scheduled in this tick had a chance to join the batch
+        task = loop.create_task(_flush(session, prop))
+        _flushes.add(task)
+        task.add_done_callback(_flushes.discard)
+    instances, future = pending[prop]
+    instances.append(instance)
+    await future
+    return inspect(instance).dict[prop.key]
+
+
+async def _flush(session, prop: RelationshipProperty):
+    instances, future = session.sync_session.info[_PENDING].pop(prop)
+    try:
+        await session.run_sync(_load_batch, prop, instances)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result(None)
+
+
+def _load_batch(session, prop: RelationshipProperty, instances: list):
+    local, remote = _join_columns(prop)
+    local_key = prop.parent.get_property_by_column(local).key
+    owners = defaultdict(list)
+    for instance in instances:
+        # may refresh an expired column, fine here: run_sync is inside the greenlet
+        owners[getattr(instance, local_key)].append(instance)
+    keys = [key for key in owners if key is not None]
+
+    loaded = defaultdict(list)
+    for start in range(0, len(keys), BATCH_CHUNK_SIZE):
+        chunk = keys[start : start + BATCH_CHUNK_SIZE]
+        if prop.secondary is None:
+            query = select(prop.mapper).where(remote.in_(chunk))
+            remote_key = prop.mapper.get_property_by_column(remote).key
+        else:
+            query = (
+                select(prop.mapper, remote)
+                .join(prop.secondary, prop.secondaryjoin)
+                .where(remote.in_(chunk))
+            )
+        if prop.order_by:
+            query = query.order_by(*prop.order_by)
+        if prop.secondary is None:
+            for target in session.scalars(query):
+                loaded[getattr(target, remote_key)].append(target)
+        else:
+            for target, key in session.execute(query):
+                loaded[key].append(target)
+
+    for key, key_owners in owners.items():
+        targets = loaded.get(key, [])
+        for owner in key_owners:
+            if prop.key in inspect(owner).dict:
+                continue  # the same object awaited twice
+            if prop.uselist:
+                set_committed_value(owner, prop.key, list(targets))
+            else:
+                set_committed_value(owner, prop.key, targets[0] if targets else None)
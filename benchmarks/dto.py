@@ -0,0 +1,104 @@
+"""
+ORM -> DTO vs column rows -> DTO for the resumes read path.
+
+    python -m benchmarks.dto --url postgresql+psycopg://... --resumes 100000 --recreate
+
+--recreate drops and recreates all tables and seeds them with COPY, without
+it the benchmark reads whatever is already in the database.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from database import Base
+from models import ResumeOrm, WorkerOrm, Workload
+from queries.dto import select_resumes_dto, select_resumes_rel_dto, select_workers_rel_dto
+from queries.orm import (
+    RESUME_COPY_COLUMNS,
+    WORKER_COPY_COLUMNS,
+    bulk_load_sync,
+)
+from schema import ResumeDTO, ResumeRelDTO, WorkersRelDTO
+
+
+def seed(engine, workers: int, resumes: int):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rnd = random.Random(42)
+    bulk_load_sync(WorkerOrm.__table__, ((f"worker {i}",) for i in range(workers)), WORKER_COPY_COLUMNS, engine=engine)
+    rows = (
+        (f"Python Developer {i}", rnd.randrange(30_000, 300_000), rnd.choice(list(Workload)), rnd.randint(1, workers))
+        for i in range(resumes)
+    )
+    bulk_load_sync(ResumeOrm.__table__, rows, RESUME_COPY_COLUMNS, engine=engine)
+
+
+def orm_resumes(session):
+    result = session.scalars(select(ResumeOrm)).all()
+    return [ResumeDTO.model_validate(r, from_attributes=True) for r in result]
+
+
+def orm_resumes_rel(session):
+    result = session.scalars(select(ResumeOrm).options(joinedload(ResumeOrm.worker))).all()
+    return [ResumeRelDTO.model_validate(r, from_attributes=True) for r in result]
+
+
+def orm_workers_rel(session):
+    result = session.scalars(select(WorkerOrm).options(selectinload(WorkerOrm.resumes))).all()
+    return [WorkersRelDTO.model_validate(w, from_attributes=True) for w in result]
+
+
+CASES = {
+    "resumes": (orm_resumes, select_resumes_dto),
+    "resumes_with_worker": (orm_resumes_rel, select_resumes_rel_dto),
+    "workers_with_resumes": (orm_workers_rel, select_workers_rel_dto),
+}
+
+
+def timed(engine, fn, repeat: int) -> tuple[float, int]:
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            size = len(fn(session))
+            best = min(best, time.perf_counter() - start)
+    return best, size
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=config.settings.DATABASE_URL_psycopg)
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--resumes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--recreate", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if args.recreate:
+        seed(engine, args.workers, args.resumes)
+    report = []
+    for name, (orm_path, dto_path) in CASES.items():
+        orm_time, size = timed(engine, orm_path, args.repeat)
+        dto_time, _ = timed(engine, dto_path, args.repeat)
+        report.append(
+            dict(
+                case=name,
+                objects=size,
+                orm_ms=round(orm_time * 1000, 1),
+                dto_ms=round(dto_time * 1000, 1),
+                speedup=round(orm_time / dto_time, 1) if dto_time else None,
+            )
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Loading strategies and report queries on the sync and async engines.
+
+    python -m benchmarks.loading --url postgresql+psycopg://... --workers 1000 --recreate
+    python -m benchmarks.loading --url sqlite:///bench.sqlite --recreate --repeat 5
+
+--recreate drops and recreates all tables and seeds them with
+queries/generator.py, without it the benchmark reads whatever is
+already in the database. The async engine gets --async-url, by default the
+same database through asyncpg / aiosqlite.
+
+Every case runs --repeat times per engine (after one warm up run) and reports
+  p50/p95/p99/max latency, ms
+  round trips a run - cursor executions, lazy loads included
+  read/written bytes a run - /proc/self/io of the process, that is the driver's
+      socket on postgres and file reads on sqlite; null off linux
+  peak_kib - python allocations of one extra run under tracemalloc
+Async cases run the same functions through AsyncSession.run_sync, so lazy
+loading works there too and the difference is the driver and greenlet hops.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from typing import Callable
+
+from sqlalchemy import create_engine, event, make_url, select
+from sqlalchemy.exc import DBAPIError, InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
+
+from async_loading import ALLOW_LAZY_LOADS
+from database import Base
+from models import ResumeOrm, WorkerOrm, Workload
+from queries.generator import SyntheticData
+from queries.statements import (
+    build_avg_compensation_for_workload,
+    build_cte_subquery_window_func,
+    build_resumes_avg_compensation,
+    build_workers_and_resumes_with_limit,
+    statement_cache,
+)
+
+REPORT_PARAMS = dict(like_language="Python", min_compensation=40_000, min_avg_compensation=70_000)
+
+
+def seed(url: str, workers: int, resumes_per_worker: int, vacancies: int, replies_per_vacancy: int) -> dict:
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    data = SyntheticData(
+        workers=workers,
+        resumes=workers * resumes_per_worker,
+        vacancies=vacancies,
+        replies=vacancies * replies_per_vacancy,
+    )
+    return {name: result.rows for name, result in data.load(url).items()}
+
+
+########################################3
+# CASES, each one loads in the given session and returns how many rows / objects it got
+
+
+def lazy(session) -> int:
+    ## N+1: one SELECT for workers and one per worker.resumes
+    workers = session.scalars(select(WorkerOrm)).all()
+    return sum(len(w.resumes) for w in workers)
+
+
+def joined(session) -> int:
+    query = select(WorkerOrm).options(joinedload(WorkerOrm.resumes))
+    workers = session.scalars(query).unique().all()
+    return sum(len(w.resumes) for w in workers)
+
+
+def selectin(session) -> int:
+    query = select(WorkerOrm).options(selectinload(WorkerOrm.resumes))
+    workers = session.scalars(query).all()
+    return sum(len(w.resumes) for w in workers)
+
+
+def parttime_contains_eager(session) -> int:
+    query = (
+        select(WorkerOrm)
+        .join(ResumeOrm, WorkerOrm.id == ResumeOrm.worker_id)
+        .filter(ResumeOrm.workload == Workload.parttime)
+        .options(contains_eager(WorkerOrm.resumes))
+    )
+    workers = session.scalars(query).unique().all()
+    return sum(len(w.resumes) for w in workers)
+
+
+def workers_and_resumes_with_limit(session) -> int:
+    query = statement_cache.get(build_workers_and_resumes_with_limit)
+    workers = session.scalars(query, dict(resumes_limit=3)).unique().all()
+    return sum(len(w.resumes) for w in workers)
+
+
+def resumes_with_all_relationship(session) -> int:
+    query = (
+        select(ResumeOrm)
+        .options(joinedload(ResumeOrm.worker))
+        .options(selectinload(ResumeOrm.vacancies_replied))
+    )
+    resumes = session.scalars(query).all()
+    return len(resumes) + sum(len(r.vacancies_replied) for r in resumes)
+
+
+def cte_window(session) -> int:
+    return len(session.execute(statement_cache.get(build_cte_subquery_window_func)).all())
+
+
+def avg_compensation_for_workload(session) -> int:
+    query = statement_cache.get(build_avg_compensation_for_workload)
+    return len(session.execute(query, REPORT_PARAMS).all())
+
+
+def resumes_avg_compensation(session) -> int:
+    query = statement_cache.get(build_resumes_avg_compensation)
+    return len(session.execute(query, REPORT_PARAMS).all())
+
+
+CASES = {
+    fn.__name__: fn
+    for fn in (
+        lazy,
+        joined,
+        selectin,
+        parttime_contains_eager,
+        workers_and_resumes_with_limit,
+        resumes_with_all_relationship,
+        cte_window,
+        avg_compensation_for_workload,
+        resumes_avg_compensation,
+    )
+}
+
+
+########################################3
+# MEASUREMENTS
+
+
+def _io() -> tuple[int, int] | None:
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    # nearest rank, good enough for tens of samples
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+def measure(run: Callable[[Callable], int], fn: Callable, round_trips: list[int], repeat: int) -> dict:
+    """run(fn) calls fn with a fresh session, round_trips[0] counts cursor executions."""
+    run(fn)  # warm up the pool and the compiled cache
+    samples = []
+    round_trips[0] = 0
+    io_before = _io()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run(fn)
+        samples.append(time.perf_counter() - start)
+    io_after = _io()
+    trips = round_trips[0]
+
+    tracemalloc.start()
+    run(fn)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    samples.sort()
+    return dict(
+        rows=rows,
+        p50_ms=round(_percentile(samples, 50) * 1000, 2),
+        p95_ms=round(_percentile(samples, 95) * 1000, 2),
+        p99_ms=round(_percentile(samples, 99) * 1000, 2),
+        max_ms=round(samples[-1] * 1000, 2),
+        round_trips=trips / repeat,
+        read_bytes=(io_after[0] - io_before[0]) // repeat if io_before else None,
+        written_bytes=(io_after[1] - io_before[1]) // repeat if io_before else None,
+        peak_kib=peak // 1024,
+    )
+
+
+def measure_case(engine_name: str, driver: str, name: str, run, fn, round_trips, repeat: int) -> dict:
+    result = dict(engine=engine_name, driver=driver, case=name)
+    try:
+        result.update(measure(run, fn, round_trips, repeat))
+    except DBAPIError as exc:
+        # e.g. sqlite can't correlate a subquery in JOIN ... ON, the rest of the cases still run
+        result["error"] = str(exc.orig)
+    except InvalidRequestError as exc:
+        # a load the session refused, still a result of the case
+        result["error"] = str(exc)
+    return result
+
+
+def count_round_trips(engine) -> list[int]:
+    counter = [0]
+
+    @event.listens_for(getattr(engine, "sync_engine", engine), "before_cursor_execute")
+    def _count(*args):
+        counter[0] += 1
+
+    return counter
+
+
+def run_sync_engine(url: str, cases: dict, repeat: int) -> list[dict]:
+    engine = create_engine(url)
+    round_trips = count_round_trips(engine)
+
+    def run(fn):
+        with Session(engine) as session:
+            return fn(session)
+
+    try:
+        return [
+            measure_case("sync", engine.dialect.driver, name, run, fn, round_trips, repeat)
+            for name, fn in cases.items()
+        ]
+    finally:
+        engine.dispose()
+
+
+def run_async_engine(url: str, cases: dict, repeat: int) -> list[dict]:
+    engine = create_async_engine(url)
+    round_trips = count_round_trips(engine)
+    loop = asyncio.new_event_loop()
+
+    async def _run(fn):
+        # the cases are sync code, their lazy loads run inside run_sync's greenlet
+        async with AsyncSession(engine, info={ALLOW_LAZY_LOADS: True}) as session:
+            return await session.run_sync(fn)
+
+    def run(fn):
+        return loop.run_until_complete(_run(fn))
+
+    try:
+        return [
+            measure_case("async", engine.dialect.driver, name, run, fn, round_trips, repeat)
+            for name, fn in cases.items()
+        ]
+    finally:
+        loop.run_until_complete(engine.dispose())
+        loop.close()
+
+
+def async_url(url: str) -> str:
+    url = make_url(url)
+    driver = "sqlite+aiosqlite" if url.get_backend_name() == "sqlite" else "postgresql+asyncpg"
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=config.settings.DATABASE_URL_psycopg)
+    parser.add_argument("--async-url", help="defaults to --url through asyncpg / aiosqlite")
+    parser.add_argument("--engines", nargs="+", choices=("sync", "async"), default=["sync", "async"])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--resumes-per-worker", type=int, default=10)
+    parser.add_argument("--vacancies", type=int, default=100)
+    parser.add_argument("--replies-per-vacancy", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--recreate", action="store_true")
+    args = parser.parse_args()
+
+    url = make_url(args.url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        parser.error("in-memory sqlite isn't shared between engines, use a file: sqlite:///bench.sqlite")
+    cases = {name: CASES[name] for name in args.cases}
+
+    report = dict(url=url.render_as_string(hide_password=True), seeded=None, results=[])
+    if args.recreate:
+        report["seeded"] = seed(
+            args.url, args.workers, args.resumes_per_worker, args.vacancies, args.replies_per_vacancy
+        )
+    if "sync" in args.engines:
+        report["results"] += run_sync_engine(args.url, cases, args.repeat)
+    if "async" in args.engines:
+        report["results"] += run_async_engine(args.async_url or async_url(args.url), cases, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+AsyncOrm queries with and without asyncpg prepared statement caching.
+
+    python -m benchmarks.prepared --url postgresql+asyncpg://... --recreate
+    python -m benchmarks.prepared --url postgresql+asyncpg://pgbouncer:6432/... --modes pgbouncer
+
+Modes, connect_args of the async engine:
+  prepared    sqlalchemy keeps 100 prepared statements per connection, the default
+  unprepared  prepared_statement_cache_size=0, every execution prepares again
+  pgbouncer   no caches and unique statement names, what DB_PGBOUNCER=true sets
+A pool of one connection makes every run reuse the same server session.
+Reports latency percentiles (benchmarks/loading.py) and the prepared
+statement metrics of each mode (prepared.py).
+"""
+
+import argparse
+import asyncio
+import json
+
+from sqlalchemy import make_url, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from benchmarks.loading import REPORT_PARAMS, count_round_trips, measure_case, seed
+from models import ResumeOrm, WorkerOrm
+from prepared import listen_prepared_events, prepared_metrics, unique_statement_name
+from queries.pagination import paginate_async
+from queries.statements import build_avg_compensation_for_workload, statement_cache
+
+MODES = {
+    "prepared": dict(prepared_statement_cache_size=100),
+    "unprepared": dict(prepared_statement_cache_size=0),
+    "pgbouncer": dict(
+        statement_cache_size=0,
+        prepared_statement_cache_size=0,
+        prepared_statement_name_func=unique_statement_name,
+    ),
+}
+
+
+########################################3
+# CASES, the bodies of AsyncOrm methods
+
+
+async def worker_by_id(session) -> int:
+    return int(await session.get(WorkerOrm, 1) is not None)
+
+
+async def select_workers(session) -> int:
+    return len((await session.scalars(select(WorkerOrm))).all())
+
+
+async def select_workers_with_awaited_resumes(session) -> int:
+    workers = (await session.scalars(select(WorkerOrm).limit(100))).all()
+    resumes = await asyncio.gather(*(worker.awaitable_attrs.resumes for worker in workers))
+    return sum(map(len, resumes))
+
+
+async def select_resumes_page(session) -> int:
+    page = await paginate_async(session, ResumeOrm, "compensation", 50, None)
+    return len(page.items)
+
+
+async def avg_compensation_for_workload(session) -> int:
+    query = statement_cache.get(build_avg_compensation_for_workload)
+    return len((await session.execute(query, REPORT_PARAMS)).all())
+
+
+CASES = {
+    fn.__name__: fn
+    for fn in (
+        worker_by_id,
+        select_workers,
+        select_workers_with_awaited_resumes,
+        select_resumes_page,
+        avg_compensation_for_workload,
+    )
+}
+
+
+def run_mode(url: str, mode: str, cases: dict, repeat: int) -> tuple[list[dict], dict]:
+    engine = create_async_engine(url, pool_size=1, max_overflow=0, connect_args=MODES[mode])
+    listen_prepared_events(engine)
+    round_trips = count_round_trips(engine)
+    loop = asyncio.new_event_loop()
+
+    async def _run(fn):
+        async with AsyncSession(engine) as session:
+            return await fn(session)
+
+    def run(fn):
+        return loop.run_until_complete(_run(fn))
+
+    try:
+        results = [
+            measure_case(mode, engine.dialect.driver, name, run, fn, round_trips, repeat)
+            for name, fn in cases.items()
+        ]
+        return results, prepared_metrics(engine)
+    finally:
+        loop.run_until_complete(engine.dispose())
+        loop.close()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=config.settings.DATABASE_URL_asyncpg)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--resumes-per-worker", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--recreate", action="store_true")
+    args = parser.parse_args()
+
+    url = make_url(args.url)
+    if url.drivername != "postgresql+asyncpg":
+        parser.error("prepared statements are compared on postgresql+asyncpg")
+    cases = {name: CASES[name] for name in args.cases}
+
+    report = dict(url=url.render_as_string(hide_password=True), seeded=None, results=[], metrics={})
+    if args.recreate:
+        sync_url = url.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+        report["seeded"] = seed(sync_url, args.workers, args.resumes_per_worker, 10, 10)
+    for mode in args.modes:
+        results, metrics = run_mode(args.url, mode, cases, args.repeat)
+        report["results"] += results
+        report["metrics"][mode] = metrics
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
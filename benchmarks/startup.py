@@ -0,0 +1,102 @@
+"""
+Cold start of a process that imports the queries and touches one engine.
+
+    python -m benchmarks.startup [--runs 20] [--importtime 15]
+
+Every run is a fresh interpreter (python -c ...), the scenarios:
+  import          import queries.orm
+  sync_engine     + database.sync_engine, psycopg gets imported
+  async_engine    + database.async_engine, asyncpg gets imported
+  both            + both engines
+No connection is opened, engines connect on first use. Reports wall time of
+the whole process and the time of the statement inside it, p50/min/max ms,
+and the drivers that ended up imported. --importtime N adds the N slowest
+imports of the `import` scenario from python -X importtime.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCENARIOS = {
+    "import": "import queries.orm",
+    "sync_engine": "import queries.orm, database; database.sync_engine",
+    "async_engine": "import queries.orm, database; database.async_engine",
+    "both": "import queries.orm, database; database.sync_engine; database.async_engine",
+}
+DRIVERS = ("psycopg", "asyncpg")
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+exec({code!r})
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(
+    ms=elapsed * 1000,
+    drivers=[d for d in {drivers!r} if d in sys.modules],
+    modules=len(sys.modules),
+)))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def run_scenario(code: str, runs: int) -> dict:
+    walls, inner = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        child = json.loads(_python("-c", _CHILD.format(code=code, drivers=DRIVERS)).stdout)
+        walls.append((time.perf_counter() - start) * 1000)
+        inner.append(child["ms"])
+    return dict(
+        wall_p50_ms=round(statistics.median(walls), 1),
+        wall_min_ms=round(min(walls), 1),
+        wall_max_ms=round(max(walls), 1),
+        p50_ms=round(statistics.median(inner), 1),
+        min_ms=round(min(inner), 1),
+        max_ms=round(max(inner), 1),
+        drivers=child["drivers"],
+        modules=child["modules"],
+    )
+
+
+def slowest_imports(code: str, top: int) -> list[dict]:
+    # "import time: self [us] | cumulative | imported package" lines on stderr
+    stderr = _python("-X", "importtime", "-c", code).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:") :].split("|"))
+        imports.append(dict(module=name.strip(), self_ms=int(self_us) / 1000, cumulative_ms=int(cumulative_us) / 1000))
+    return sorted(imports, key=lambda i: -i["cumulative_ms"])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--importtime", type=int, default=0, metavar="N")
+    args = parser.parse_args()
+
+    report = dict(python=sys.version.split()[0], runs=args.runs, results={})
+    for name in args.scenarios:
+        report["results"][name] = run_scenario(SCENARIOS[name], args.runs)
+    if args.importtime:
+        report["slowest_imports"] = slowest_imports(SCENARIOS["import"], args.importtime)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Python-side cost per call of the report statements: construction + cache key
++ compiled cache lookup, rebuilt on every call vs prebuilt once.
+
+    python -m benchmarks.statement_cache [--calls 5000]
+
+No database is needed, statements are compiled for the postgresql dialect
+through the same compiled cache path Connection.execute() uses.
+"""
+
+import argparse
+import json
+import time
+
+from sqlalchemy.dialects import postgresql
+
+from queries.statements import (
+    StatementCache,
+    build_avg_compensation_for_workload,
+    build_cte_subquery_window_func,
+    build_resumes_avg_compensation,
+    build_workers_and_resumes_with_limit,
+)
+
+BUILDERS = (
+    build_avg_compensation_for_workload,
+    build_resumes_avg_compensation,
+    build_cte_subquery_window_func,
+    build_workers_and_resumes_with_limit,
+)
+
+
+def _compile_cached(statement, dialect, compiled_cache: dict):
+    # what Connection._execute_clauseelement does before talking to the driver
+    return statement._compile_w_cache(
+        dialect=dialect,
+        compiled_cache=compiled_cache,
+        column_keys=[],
+        for_executemany=False,
+        schema_translate_map=None,
+    )
+
+
+def run(build, calls: int) -> dict:
+    dialect = postgresql.psycopg.dialect()
+    compiled_cache = {}
+    _compile_cached(build(), dialect, compiled_cache)  # warm sqlalchemy's compiled cache
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        _compile_cached(build(), dialect, compiled_cache)
+    rebuilt = (time.perf_counter() - start) / calls
+
+    statements = StatementCache()
+    start = time.perf_counter()
+    for _ in range(calls):
+        _compile_cached(statements.get(build), dialect, compiled_cache)
+    prebuilt = (time.perf_counter() - start) / calls
+
+    return dict(
+        query=build.__name__.removeprefix("build_"),
+        rebuilt_us=round(rebuilt * 1e6, 2),
+        prebuilt_us=round(prebuilt * 1e6, 2),
+        speedup=round(rebuilt / prebuilt, 1),
+        statement_cache=statements.stats(),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+    print(json.dumps([run(build, args.calls) for build in BUILDERS], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""
+Second-level cache shared by all sessions.
+
+    second_level_cache.get(session, WorkerOrm, 1)                # session.get() through the cache
+    second_level_cache.execute(session, stmt, params)            # read query rows through the cache
+    await second_level_cache.get_async(session, WorkerOrm, 1)
+    second_level_cache.stats()
+
+Entities are cached as their column values by (mapper, primary key) and come
+back attached to the session without a SELECT (merge(load=False)),
+relationships still load lazily. Query results are cached by compiled SQL +
+params, only for column selects (rows, not ORM entities).
+
+Invalidation:
+    - flushed INSERT/UPDATE/DELETE of an entity drops its key after_commit
+    - any INSERT/UPDATE/DELETE executed on an installed engine bumps the
+      version of its table, query keys contain the versions of the tables
+      they read, so old results are never looked up again
+    - ORM bulk and core UPDATE/DELETE and upserts (INSERT ... ON CONFLICT) bump
+      the entity generation of the table, entity keys contain it
+    - versions and generations bumped by a statement are bumped again when its
+      connection commits: a read from another connection in between cached the
+      rows as they were before the commit
+    - an entity read is stored only if nothing of its table was invalidated
+      since the lookup, a late store would bring the old row back
+Writes that never go through an installed engine (another service, raw COPY)
+are only picked up after the TTL. second_level_cache is installed on database's
+engines and session factories as they get built, sessions of other classes
+need install(session_class=...) for their flushes to invalidate.
+
+Backends: LRUBackend (in-process, LRU + TTL) and RedisBackend for anything
+with the redis-py get/set/delete/incr/mget API, LocalRedis is an in-process
+stand-in for it.
+"""
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from sqlalchemy import Table, event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import visitors
+
+import config
+import database
+
+
+########################################3
+# BACKENDS
+
+
+class LRUBackend:
+    def __init__(self, maxsize: int = 10_000, ttl: float | None = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl  # seconds, None - until evicted
+        self._data: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        # version counters live apart, evicting one would resurrect stale entries
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key: str):
+        with self._lock:
+            return self._get(key)
+
+    def get_many(self, keys: list[str]) -> list:
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key: str, value, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_many_counters(self, keys: list[str]) -> list[int | None]:
+        with self._lock:
+            return [self._counters.get(key) for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalRedis:
+    ## in-process stand-in for redis.Redis, just the commands RedisBackend uses
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        expires, value = self._data.get(key, (None, None))
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            self._data[key] = (None, value)
+            return value
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    ## use a volatile-* maxmemory policy, version counters have no TTL and must not be evicted
+    def __init__(self, client, ttl: float | None = 300.0, prefix: str = "slc:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kw) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package: pip install redis") from e
+        return cls(redis.Redis.from_url(url), **kw)
+
+    @staticmethod
+    def _load(raw):
+        return None if raw is None else pickle.loads(raw)
+
+    def get(self, key: str):
+        return self._load(self.client.get(self.prefix + key))
+
+    def get_many(self, keys: list[str]) -> list:
+        if not keys:
+            return []
+        return [self._load(raw) for raw in self.client.mget([self.prefix + k for k in keys])]
+
+    def set(self, key: str, value, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(int(ttl), 1) if ttl else None)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*(self.prefix + k for k in keys))
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+    def get_many_counters(self, keys: list[str]) -> list[int | None]:
+        # incr() stores plain integers, not pickles
+        if not keys:
+            return []
+        raws = self.client.mget([self.prefix + k for k in keys])
+        return [int(raw) if raw is not None else None for raw in raws]
+
+
+########################################3
+# METRICS
+
+
+class CacheMetrics:
+    REGIONS = ("entity", "query")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {region: dict(hits=0, misses=0, stores=0) for region in self.REGIONS}
+            self.invalidations = 0
+            self.table_bumps = 0
+
+    def count(self, region: str, name: str, n: int = 1):
+        with self._lock:
+            self.counters[region][name] += n
+
+    def count_invalidations(self, entities: int = 0, tables: int = 0):
+        with self._lock:
+            self.invalidations += entities
+            self.table_bumps += tables
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for region, c in self.counters.items():
+                lookups = c["hits"] + c["misses"]
+                result[region] = dict(c, hit_rate=c["hits"] / lookups if lookups else 0.0)
+            return dict(result, invalidations=self.invalidations, table_bumps=self.table_bumps)
+
+
+########################################3
+# CACHE
+
+
+def _tables(statement) -> set[str]:
+    return {t.name for t in visitors.iterate(statement) if isinstance(t, Table)}
+
+
+def _changes_rows(statement, execution_options) -> bool:
+    ## UPDATE/DELETE and upserts of existing rows, besides flushes: flushed entities are dropped one by one
+    if "compiled_cache" in execution_options:
+        return False  # ORM flushes execute with the mapper's compiled cache
+    if statement.is_insert:
+        return getattr(statement, "_post_values_clause", None) is not None  # ON CONFLICT ...
+    return True
+
+
+class SecondLevelCache:
+    def __init__(self, backend=None, ttl: float | None = None, backend_factory=None):
+        # backend_factory builds the backend on first use instead, e.g. from settings
+        self._backend = backend if backend is not None or backend_factory else LRUBackend()
+        self._backend_factory = backend_factory
+        self.ttl = ttl  # None - backend default
+        self.metrics = CacheMetrics()
+        self.enabled = True
+        # session.info keys, per cache so that several caches can be installed at once
+        self._wrote_key = f"slc_wrote_{id(self)}"
+        self._changed_key = f"slc_changed_{id(self)}"
+        self._written_key = f"slc_written_{id(self)}"  # connection info, table -> entity generation bumped
+        self._session_classes: set[type[Session]] = set()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self._backend_factory()
+        return self._backend
+
+    ## keys
+
+    def _counters(self, keys: list[str]) -> list[int]:
+        return [value or 0 for value in self.backend.get_many_counters(keys)]
+
+    def _entity_versions(self, mapper) -> tuple[int, int]:
+        # (generation, invalidations) of the table, the generation is a part of entity keys
+        table = mapper.local_table.name
+        generation, invalidations = self._counters([f"g:{table}", f"i:{table}"])
+        return generation, invalidations
+
+    def _entity_key(self, mapper, identity: tuple, generation: int | None = None) -> str:
+        if generation is None:
+            generation, _ = self._entity_versions(mapper)
+        return f"e:{mapper.class_.__name__}:{generation}:{identity!r}"
+
+    def _query_key(self, session: Session, statement, params) -> str:
+        tables = sorted(_tables(statement))
+        versions = self._counters([f"v:{t}" for t in tables])
+        compiled = statement.compile(dialect=session.get_bind().dialect)
+        digest = hashlib.sha1(
+            repr((str(compiled), sorted(compiled.params.items()), sorted((params or {}).items()))).encode()
+        ).hexdigest()
+        return f"q:{','.join(f'{t}@{v}' for t, v in zip(tables, versions))}:{digest}"
+
+    ## entities
+
+    @staticmethod
+    def _identity(mapper, pk) -> tuple:
+        return tuple(pk) if isinstance(pk, (tuple, list)) else (pk,)
+
+    def _cacheable(self, session: Session, obj) -> bool:
+        # state that may not be committed yet must not leak into other sessions
+        return (
+            obj is not None
+            and not session.info.get(self._wrote_key)
+            and obj not in session.dirty
+            and obj not in session.new
+        )
+
+    @staticmethod
+    def _dump(mapper, obj) -> dict:
+        loaded = inspect(obj).dict
+        return {attr.key: loaded[attr.key] for attr in mapper.column_attrs if attr.key in loaded}
+
+    @staticmethod
+    def _build(mapper, values: dict):
+        obj = mapper.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        return obj
+
+    def _lookup(self, session: Session, model, pk):
+        ## ((key, table versions at the lookup), merged instance or None)
+        mapper = inspect(model)
+        identity = self._identity(mapper, pk)
+        in_session = session.identity_map.get(mapper.identity_key_from_primary_key(identity))
+        if in_session is not None:
+            return None, in_session
+        versions = self._entity_versions(mapper)
+        key = self._entity_key(mapper, identity, versions[0])
+        values = self.backend.get(key)
+        if values is None:
+            self.metrics.count("entity", "misses")
+            return (key, versions), None
+        self.metrics.count("entity", "hits")
+        return (key, versions), self._build(mapper, values)
+
+    def _store(self, session: Session, slot: tuple, model, obj):
+        key, versions = slot
+        mapper = inspect(model)
+        # invalidated while the row was read: it may be the old one
+        if self._cacheable(session, obj) and self._entity_versions(mapper) == versions:
+            self.backend.set(key, self._dump(mapper, obj), self.ttl)
+            self.metrics.count("entity", "stores")
+
+    def get(self, session: Session, model, pk):
+        if not self.enabled:
+            return session.get(model, pk)
+        slot, obj = self._lookup(session, model, pk)
+        if slot is None:
+            return obj
+        if obj is not None:
+            return session.merge(obj, load=False)
+        obj = session.get(model, pk)
+        self._store(session, slot, model, obj)
+        return obj
+
+    async def get_async(self, session, model, pk):
+        if not self.enabled:
+            return await session.get(model, pk)
+        slot, obj = self._lookup(session.sync_session, model, pk)
+        if slot is None:
+            return obj
+        if obj is not None:
+            return await session.merge(obj, load=False)
+        obj = await session.get(model, pk)
+        self._store(session.sync_session, slot, model, obj)
+        return obj
+
+    ## read queries
+
+    def _check_columns_only(self, statement):
+        for description in getattr(statement, "column_descriptions", ()):
+            entity = description.get("entity")
+            if entity is not None and description.get("expr") is entity:
+                raise ValueError(f"only column selects are cached, got entity {entity.__name__}")
+
+    def execute(self, session: Session, statement, params: dict | None = None) -> list:
+        if not self.enabled:
+            return session.execute(statement, params).all()
+        self._check_columns_only(statement)
+        key = self._query_key(session, statement, params)
+        rows = self.backend.get(key)
+        if rows is not None:
+            self.metrics.count("query", "hits")
+            return rows
+        self.metrics.count("query", "misses")
+        rows = session.execute(statement, params).all()
+        if not session.info.get(self._wrote_key):
+            self.backend.set(key, rows, self.ttl)
+            self.metrics.count("query", "stores")
+        return rows
+
+    async def execute_async(self, session, statement, params: dict | None = None) -> list:
+        if not self.enabled:
+            return (await session.execute(statement, params)).all()
+        self._check_columns_only(statement)
+        key = self._query_key(session.sync_session, statement, params)
+        rows = self.backend.get(key)
+        if rows is not None:
+            self.metrics.count("query", "hits")
+            return rows
+        self.metrics.count("query", "misses")
+        rows = (await session.execute(statement, params)).all()
+        if not session.sync_session.info.get(self._wrote_key):
+            self.backend.set(key, rows, self.ttl)
+            self.metrics.count("query", "stores")
+        return rows
+
+    ## invalidation
+
+    def invalidate_tables(self, tables: Iterable[str]):
+        tables = set(tables)
+        for table in tables:
+            self.backend.incr(f"v:{table}")
+        self.metrics.count_invalidations(tables=len(tables))
+
+    def invalidate_entities(self, mapper_identities: Iterable[tuple[Any, tuple]]):
+        mapper_identities = list(mapper_identities)
+        for table in {mapper.local_table.name for mapper, _ in mapper_identities}:
+            self.backend.incr(f"i:{table}")
+        keys = [self._entity_key(mapper, identity) for mapper, identity in mapper_identities]
+        self.backend.delete(*keys)
+        self.metrics.count_invalidations(entities=len(keys))
+
+    def invalidate_generation(self, table: str):
+        ## every cached entity of the table, for UPDATE/DELETE outside of flushes
+        self.backend.incr(f"g:{table}")
+        self.metrics.count_invalidations(tables=1)
+
+    def invalidate_mapper(self, mapper):
+        self.invalidate_generation(mapper.local_table.name)
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot()
+        if isinstance(self.backend, LRUBackend):
+            stats["size"] = len(self.backend)
+        return stats
+
+    ########################################3
+    # EVENTS
+
+    def install(self, *engines, session_class: type[Session] | None = None):
+        for engine in engines:
+            self.install_engine(engine)
+        if session_class is not None:
+            self.install_sessions(session_class)
+        return self
+
+    def install_engine(self, engine):
+        self._listen_engine(getattr(engine, "sync_engine", engine))
+
+    def install_sessions(self, session_class: type[Session]):
+        ## a sessionmaker's own class (database.session_class()), not Session: the listeners run on every execute
+        if session_class not in self._session_classes:
+            self._session_classes.add(session_class)
+            self._listen_sessions(session_class)
+
+    def install_session_factory(self, factory):
+        self.install_sessions(database.session_class(factory))
+
+    def _listen_engine(self, engine):
+        @event.listens_for(engine, "after_execute")
+        def _after_execute(conn, clauseelement, multiparams, params, execution_options, result):
+            # flushes and core INSERT/UPDATE/DELETE alike
+            if not getattr(clauseelement, "is_dml", False):
+                return
+            table = clauseelement.table.name
+            changes_rows = _changes_rows(clauseelement, execution_options)
+            self.invalidate_tables([table])
+            if changes_rows:
+                self.invalidate_generation(table)
+            written = conn.info.setdefault(self._written_key, {})
+            written[table] = written.get(table, False) or changes_rows
+
+        @event.listens_for(engine, "commit")
+        def _commit(conn):
+            written = conn.info.pop(self._written_key, {})
+            if written:
+                self.invalidate_tables(written)
+            for table, changes_rows in written.items():
+                if changes_rows:
+                    self.invalidate_generation(table)
+
+        @event.listens_for(engine, "rollback")
+        def _rollback(conn):
+            conn.info.pop(self._written_key, None)
+
+    def _listen_sessions(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def _after_flush(session, flush_context):
+            session.info[self._wrote_key] = True
+            changed = session.info.setdefault(self._changed_key, set())
+            # still the pre-flush lists here, new objects were never cached
+            for obj in (*session.dirty, *session.deleted):
+                state = inspect(obj)
+                if state.key is not None:
+                    changed.add((state.mapper, state.key[1]))
+
+        @event.listens_for(session_class, "after_commit")
+        def _after_commit(session):
+            changed = session.info.pop(self._changed_key, set())
+            session.info.pop(self._wrote_key, None)
+            if changed:
+                self.invalidate_entities(changed)
+
+        @event.listens_for(session_class, "after_rollback")
+        def _after_rollback(session):
+            # entries stored before the rollback hold committed data, nothing changed
+            session.info.pop(self._changed_key, None)
+            session.info.pop(self._wrote_key, None)
+
+        @event.listens_for(session_class, "do_orm_execute")
+        def _bulk_write(orm_execute_state):
+            if orm_execute_state.is_select or orm_execute_state.is_relationship_load:
+                return
+            orm_execute_state.session.info[self._wrote_key] = True
+            for mapper in orm_execute_state.all_mappers:
+                self.invalidate_mapper(mapper)
+
+
+def _backend_from_settings():
+    settings = config.settings
+    if settings.CACHE_BACKEND == "redis":
+        return RedisBackend.from_url(settings.CACHE_REDIS_URL, ttl=settings.CACHE_TTL)
+    if settings.CACHE_BACKEND == "local_redis":
+        return RedisBackend(LocalRedis(), ttl=settings.CACHE_TTL)
+    if settings.CACHE_BACKEND == "memory":
+        return LRUBackend(maxsize=settings.CACHE_MAXSIZE, ttl=settings.CACHE_TTL)
+    raise ValueError(f"unknown CACHE_BACKEND {settings.CACHE_BACKEND!r}")
+
+
+## the backend reads config.settings on first use, backends get CACHE_TTL
+second_level_cache = SecondLevelCache(backend_factory=_backend_from_settings)
+## engines and session factories are built on first use, see database.py
+database.on_build("sync_engine", second_level_cache.install_engine)
+database.on_build("async_engine", second_level_cache.install_engine)
+for _name in database.SESSION_FACTORIES:
+    database.on_build(_name, second_level_cache.install_session_factory)
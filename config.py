@@ -1,13 +1,68 @@
+import functools
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
-class Settings(BaseSettings):
+class SchemaSettings(BaseSettings):
+    ## settings that shape tables and mappers, models.py reads them on import:
+    ## no connection settings needed for that, the rest of .env is ignored here
+
+    ## monthly range partitions of resumes by created_at, see partitions.py
+    ## only for new databases (create_tables), an existing resumes table is not converted
+    DB_PARTITION_RESUMES: bool = False
+
+    DB_EAGER_DEFAULTS: bool = False  # RETURNING of server defaults (created_at, updated_at) on flush
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+
+class Settings(SchemaSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     POSTGRES_HOST: str
     POSTGRES_PORT: int
 
+    ## connection pool, same knobs for sync and async engines
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = -1  # seconds, -1 - never recycle
+    DB_POOL_PRE_PING: bool = False
+    DB_POOL_USE_LIFO: bool = False  # LIFO lets idle connections above the load time out server-side
+    DB_ECHO: bool = False  # log every statement, both engines
+
+    ## prepared statements, see prepared.py
+    DB_PGBOUNCER: bool = False  # transaction pooling in front of postgres: nothing stays prepared
+    DB_ASYNCPG_PREPARED_STATEMENT_CACHE_SIZE: int = 100  # per connection, 0 - prepare every execution
+    DB_ASYNCPG_STATEMENT_CACHE_SIZE: int = 100  # asyncpg's own cache, executemany and raw connections
+    DB_PSYCOPG_PREPARE_THRESHOLD: int = 5  # executions of a query before psycopg prepares it, -1 - never
+    DB_PSYCOPG_PREPARED_MAX: int = 100  # prepared statements per psycopg connection
+
+    ## read replicas, comma separated host or host:port, same user/password/db as the primary
+    POSTGRES_REPLICA_HOSTS: str = ""
+    DB_REPLICA_STRATEGY: str = "round_robin"  # or least_connections
+    DB_REPLICA_HEALTH_INTERVAL: float = 10.0  # seconds
+
+    ## partitions of resumes, DB_PARTITION_RESUMES is a SchemaSettings one
+    DB_PARTITION_MONTHS_AHEAD: int = 3  # future partitions kept ready for inserts
+    DB_PARTITION_RETAIN_MONTHS: int = 0  # older partitions get detached and archived, 0 - keep all
+    DB_PARTITION_ARCHIVE_SCHEMA: str = "archive"
+
+    ## second-level cache, see cache.py
+    CACHE_BACKEND: str = "memory"  # memory, redis or local_redis (in-process redis stand-in)
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_TTL: float = 300.0  # seconds
+    CACHE_MAXSIZE: int = 10_000  # entries, memory backend only
+
+    ## relationship loading in async sessions, see async_loading.py
+    DB_ASYNC_LAZY_LOAD: str = "raise_on_sql"  # or select - lazy load like sync sessions
+    DB_ASYNC_LAZY_LOAD_BATCHING: bool = True  # awaited loads of one tick share an IN query
+
+    ## unit of work writes, see write_mode.py, DB_EAGER_DEFAULTS is a SchemaSettings one
+    DB_WRITE_BATCH_SIZE: int = 5000  # rows a multi-row INSERT ... RETURNING in write sessions
+    DB_WRITE_ALIGN_UPDATES: bool = False  # write sessions pad UPDATEs to one column set, see write_mode.py
+
     @property
     def DATABASE_URL_asyncpg(self):
         # this long string is DSN
@@ -18,7 +73,50 @@ class Settings(BaseSettings):
         # this long string is DSN
         return f"postgresql+psycopg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
-    model_config = SettingsConfigDict(enf_file=".env")
+    def _replica_dsns(self, driver: str) -> list[str]:
+        dsns = []
+        for host in filter(None, (h.strip() for h in self.POSTGRES_REPLICA_HOSTS.split(","))):
+            host, _, port = host.partition(":")
+            dsns.append(
+                f"postgresql+{driver}://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{host}:{port or self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+            )
+        return dsns
+
+    @property
+    def DATABASE_URLS_replicas_asyncpg(self) -> list[str]:
+        return self._replica_dsns("asyncpg")
+
+    @property
+    def DATABASE_URLS_replicas_psycopg(self) -> list[str]:
+        return self._replica_dsns("psycopg")
+
+    @property
+    def pool_options(self) -> dict:
+        # kwargs for create_engine / create_async_engine
+        return dict(
+            pool_size=self.DB_POOL_SIZE,
+            max_overflow=self.DB_MAX_OVERFLOW,
+            pool_timeout=self.DB_POOL_TIMEOUT,
+            pool_recycle=self.DB_POOL_RECYCLE,
+            pool_pre_ping=self.DB_POOL_PRE_PING,
+            pool_use_lifo=self.DB_POOL_USE_LIFO,
+        )
+
+    model_config = SettingsConfigDict(env_file=".env", extra="forbid")
+
+
+@functools.cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+@functools.cache
+def get_schema_settings() -> SchemaSettings:
+    return SchemaSettings()
 
 
-settings = Settings()
+def __getattr__(name: str):
+    # config.settings reads the environment and .env on first use, not on import
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,33 +1,354 @@
-import itertools
-from typing import Annotated
-from sqlalchemy import String, create_engine
+import asyncio
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Annotated, Any, Callable
+from sqlalchemy import String, create_engine, event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 import config
+from async_loading import AsyncLoadingAttrs, refuse_implicit_lazy_loads
+from prepared import asyncpg_connect_args, listen_prepared_events, psycopg_connect_args
+from routing import ReplicaSet, RoutingSession
+from write_mode import write_engine, write_session_options
 
 
-sync_engine = create_engine(
-    url=config.settings.DATABASE_URL_psycopg,
-    echo=False,
-    # pool_size = 5,
-    # max_overflow=10
-)
+########################################3
+# POOL TELEMETRY
+# tells apart "waiting for a pooled connection" from "waiting for the database"
+
+
+class PoolMetrics:
+    # upper bounds of wait-time buckets in milliseconds, last bucket is +inf
+    WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.connects = 0
+            self.overflow_events = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.wait_histogram = [0] * (len(self.WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, seconds: float):
+        ## includes opening a new connection when the pool is empty but may overflow
+        bucket = bisect.bisect_left(self.WAIT_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            self.wait_histogram[bucket] += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def on_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_connect(self, overflow: bool):
+        with self._lock:
+            self.connects += 1
+            self.overflow_events += overflow
+
+    def on_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"<={b}ms" for b in self.WAIT_BUCKETS_MS] + [f">{self.WAIT_BUCKETS_MS[-1]}ms"]
+            waits = sum(self.wait_histogram)
+            return dict(
+                checkouts=self.checkouts,
+                checkins=self.checkins,
+                checked_out=self.checked_out,
+                max_checked_out=self.max_checked_out,
+                connects=self.connects,
+                overflow_events=self.overflow_events,
+                timeouts=self.timeouts,
+                avg_wait_ms=(self.total_wait / waits * 1000) if waits else 0.0,
+                max_wait_ms=self.max_wait * 1000,
+                wait_histogram=dict(zip(labels, self.wait_histogram)),
+            )
+
+
+class _MeteredPoolMixin:
+    # no pool event fires before a checkout starts waiting, so the wait is timed around _do_get
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.on_timeout()
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() recreates the pool, keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncAdaptedQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _listen_pool_events(engine):
+    # works for AsyncEngine too, pool events live on its sync_engine
+    engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        engine.pool.metrics.on_checkout()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        engine.pool.metrics.on_checkin()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        engine.pool.metrics.on_connect(overflow=engine.pool.overflow() > 0)
+
+
+def pool_metrics(engine) -> dict:
+    engine = getattr(engine, "sync_engine", engine)
+    pool = engine.pool
+    return dict(
+        pool=pool.status(),
+        size=pool.size(),
+        overflow=pool.overflow(),
+        **pool.metrics.snapshot(),
+    )
+########################################3
+
+
+## engines and session factories are built on first access (database.sync_engine, get_sync_engine(),
+## `from database import sync_engine` inside a function): importing database opens no pool and
+## imports no driver, a process that only uses psycopg never loads asyncpg and the other way round
+
+
+_builders: dict[str, Callable] = {}
+_on_build: dict[str, list[Callable]] = defaultdict(list)
+_build_lock = threading.RLock()  # builders use each other
+
+
+def _lazy(build):
+    _builders[build.__name__.removeprefix("_build_")] = build
+    return build
+
+
+def __getattr__(name: str):
+    # module attributes not built yet, once built they are plain globals
+    build = _builders.get(name)
+    if build is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _build_lock:
+        if name not in globals():
+            value = globals()[name] = build()
+            for callback in _on_build.pop(name, ()):
+                callback(value)
+    return globals()[name]
+
+
+def on_build(name: str, callback: Callable[[Any], None]):
+    ## callback(value) when name gets built, right away if it already is; for event listeners
+    if name not in _builders:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _build_lock:
+        if name in globals():
+            callback(globals()[name])
+        else:
+            _on_build[name].append(callback)
+
+
+def is_built(name: str) -> bool:
+    return name in globals()
+
+
+def get_sync_engine():
+    return __getattr__("sync_engine")
+
+
+def get_async_engine():
+    return __getattr__("async_engine")
 
-async_engine = create_async_engine(
-    url=config.settings.DATABASE_URL_asyncpg,
-    echo=True,
+
+def _sync_engine(url: str):
+    engine = create_engine(
+        url=url,
+        echo=config.settings.DB_ECHO,
+        poolclass=MeteredQueuePool,
+        connect_args=psycopg_connect_args(),
+        **config.settings.pool_options,
+    )
+    _listen_pool_events(engine)
+    listen_prepared_events(engine)
+    return engine
+
+
+def _async_engine(url: str):
+    engine = create_async_engine(
+        url=url,
+        echo=config.settings.DB_ECHO,
+        poolclass=MeteredAsyncAdaptedQueuePool,
+        connect_args=asyncpg_connect_args(),
+        **config.settings.pool_options,
+    )
+    _listen_pool_events(engine)
+    listen_prepared_events(engine)
+    return engine
+
+
+@_lazy
+def _build_sync_engine():
+    return _sync_engine(config.settings.DATABASE_URL_psycopg)
+
+
+@_lazy
+def _build_async_engine():
+    return _async_engine(config.settings.DATABASE_URL_asyncpg)
+
+
+########################################3
+# SESSION FACTORIES
+## every factory has its own Session subclass (sessionmaker makes one, async ones get one below):
+## session event listeners go on it with session_class(factory) and stay with that factory
+
+SESSION_FACTORIES = (
+    "session_factory",
+    "async_session_factory",
+    "write_session_factory",
+    "async_write_session_factory",
+    "routing_session_factory",
+    "async_routing_session_factory",
 )
+ASYNC_SESSION_FACTORIES = tuple(name for name in SESSION_FACTORIES if name.startswith("async_"))
+
+
+def session_class(factory) -> type[Session]:
+    # the sync Session class a sessionmaker / async_sessionmaker creates
+    if isinstance(factory, async_sessionmaker):
+        return factory.kw.get("sync_session_class", factory.class_.sync_session_class)
+    return factory.class_
+
+
+def _own_session_class(base: type[Session] = Session) -> type[Session]:
+    return type(base.__name__, (base,), {})
+
+
+@_lazy
+def _build_session_factory():
+    return sessionmaker(bind=get_sync_engine())
+
+
+@_lazy
+def _build_async_session_factory():
+    return async_sessionmaker(bind=get_async_engine(), sync_session_class=_own_session_class())
+
+
+## many-row flushes: DB_WRITE_BATCH_SIZE rows an INSERT, no autoflush, flush reports, see write_mode.py
+@_lazy
+def _build_write_session_factory():
+    return sessionmaker(bind=write_engine(get_sync_engine()), **write_session_options())
+
+
+@_lazy
+def _build_async_write_session_factory():
+    return async_sessionmaker(
+        bind=write_engine(get_async_engine()), sync_session_class=_own_session_class(), **write_session_options()
+    )
 
-session_factory = sessionmaker(bind=sync_engine)
 
-async_session_factory = async_sessionmaker(bind=async_engine)
+## read replicas, empty unless POSTGRES_REPLICA_HOSTS is set, then routing sessions only use the primary
+@_lazy
+def _build_replica_engines():
+    return [_sync_engine(url) for url in config.settings.DATABASE_URLS_replicas_psycopg]
+
+
+@_lazy
+def _build_async_replica_engines():
+    return [_async_engine(url) for url in config.settings.DATABASE_URLS_replicas_asyncpg]
+
+
+@_lazy
+def _build_replicas():
+    return ReplicaSet(__getattr__("replica_engines"), strategy=config.settings.DB_REPLICA_STRATEGY)
+
+
+@_lazy
+def _build_async_replicas():
+    return ReplicaSet(__getattr__("async_replica_engines"), strategy=config.settings.DB_REPLICA_STRATEGY)
+
+
+def start_replica_health_checks():
+    # daemon thread, set() the returned event to stop it
+    return __getattr__("replicas").start_health_checks(config.settings.DB_REPLICA_HEALTH_INTERVAL)
+
+
+def start_async_replica_health_checks() -> asyncio.Task:
+    # call from the running event loop, cancel() the task to stop it
+    return asyncio.create_task(
+        __getattr__("async_replicas").run_health_checks(config.settings.DB_REPLICA_HEALTH_INTERVAL)
+    )
+
+
+@_lazy
+def _build_routing_session_factory():
+    return sessionmaker(class_=RoutingSession, primary=get_sync_engine(), replicas=__getattr__("replicas"))
+
+
+@_lazy
+def _build_async_routing_session_factory():
+    return async_sessionmaker(
+        sync_session_class=_own_session_class(RoutingSession),
+        primary=get_async_engine().sync_engine,
+        replicas=__getattr__("async_replicas"),
+    )
+
+
+## async sessions don't lazy load, see async_loading.py
+for _name in ASYNC_SESSION_FACTORIES:
+    on_build(_name, lambda factory: refuse_implicit_lazy_loads(session_class(factory)))
 
 
 str_255 = Annotated[str, 255]
 
 
-class Base(DeclarativeBase):
+def repr_fields(cls) -> tuple[str, ...]:
+    # first max_cols columns and the class' additional_print_fields
+    return (*cls.__table__.columns.keys()[: cls.max_cols], *cls.additional_print_fields)
+
+
+## AsyncLoadingAttrs: `await obj.awaitable_attrs.<relationship>`, see async_loading.py
+class Base(AsyncLoadingAttrs, DeclarativeBase):
     type_annotation_map = {
         str_255: String(255),
     }
@@ -35,12 +356,16 @@ class Base(DeclarativeBase):
     # can now use this type in subclasses like
     # name: Mapped[str_255]
     additional_print_fields: tuple[str] = ()
+    _repr_fields: tuple[str, ...] = ()  # per class, set when its mapper is configured
 
     def __repr__(self):
-        cols = [
-            f"{col}={getattr(self, col)}"
-            for col in itertools.chain(
-                self.__table__.columns.keys()[:3], self.additional_print_fields
-            )
-        ]
+        ## reads the instance dict only: never lazy loads, an expired or deferred attribute shows as <unloaded>
+        loaded = self.__dict__
+        missing = "<unloaded>" if self._sa_instance_state.key is not None else None
+        cols = [f"{col}={loaded.get(col, missing)}" for col in self._repr_fields]
         return f"<{self.__class__.__name__}, {', '.join(cols)}>"
+
+
+@event.listens_for(Base, "mapper_configured", propagate=True)
+def _build_repr_plan(mapper, cls):
+    cls._repr_fields = repr_fields(cls)
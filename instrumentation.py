@@ -0,0 +1,268 @@
+"""
+Opt-in query timing and N+1 detection.
+
+    instrument()  # hooks sync_engine and async_engine once, when they get built
+    with query_trace("select workers") as trace:
+        SyncOrm.select_workers_with_lazy_relationship()
+    print(trace.report())
+
+Nothing is recorded outside of query_trace(), and a trace that loses the
+sampling draw costs one contextvar lookup per statement.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar["QueryTrace | None"] = contextvars.ContextVar(
+    "current_query_trace", default=None
+)
+
+## execution option set on lazy loads by the do_orm_execute hook, read back in cursor events
+LAZY_LOAD_OPTION = "_instrumentation_lazy_load"
+
+## frames from these are skipped when looking for the calling code location
+_SKIP_PATHS = (
+    os.path.dirname(sqlalchemy.__file__),
+    os.path.dirname(asyncio.__file__),
+    contextlib.__file__,
+    os.path.abspath(__file__),
+)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\((?:[^()]*)\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    # same shape -> same text: literals, IN lists and whitespace collapsed
+    statement = _POSTCOMPILE.sub("(?)", statement)
+    statement = _IN_LISTS.sub("IN (?)", statement)
+    statement = _LITERALS.sub("?", statement)
+    return _SPACES.sub(" ", statement).strip()
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.blake2b(normalize_statement(statement).encode(), digest_size=8).hexdigest()
+
+
+def _caller_location() -> str:
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_SKIP_PATHS):
+            return f"{filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+@dataclass
+class QueryRecord:
+    fingerprint: str
+    statement: str
+    duration: float  # seconds
+    rows: int
+    location: str
+    lazy_load: str | None = None  # "WorkerOrm.resumes" for relationship lazy loads
+
+
+@dataclass
+class NPlusOne:
+    relationship: str
+    fingerprint: str
+    count: int
+    location: str
+    suggestion: str
+
+
+@dataclass
+class QueryTrace:
+    name: str
+    n_plus_one_threshold: int = 3
+    records: list[QueryRecord] = field(default_factory=list)
+
+    def add(self, record: QueryRecord):
+        self.records.append(record)
+
+    @property
+    def total_time(self) -> float:
+        return sum(r.duration for r in self.records)
+
+    def n_plus_one(self) -> list[NPlusOne]:
+        groups: dict[tuple[str, str], list[QueryRecord]] = defaultdict(list)
+        for record in self.records:
+            if record.lazy_load:
+                groups[(record.lazy_load, record.fingerprint)].append(record)
+        return [
+            NPlusOne(
+                relationship=relationship,
+                fingerprint=fp,
+                count=len(records),
+                location=records[0].location,
+                suggestion=_suggest_loader(relationship),
+            )
+            for (relationship, fp), records in groups.items()
+            if len(records) >= self.n_plus_one_threshold
+        ]
+
+    def report(self) -> dict:
+        by_fingerprint: dict[str, list[QueryRecord]] = defaultdict(list)
+        for record in self.records:
+            by_fingerprint[record.fingerprint].append(record)
+        return dict(
+            name=self.name,
+            queries=len(self.records),
+            total_ms=self.total_time * 1000,
+            statements=[
+                dict(
+                    fingerprint=fp,
+                    statement=normalize_statement(records[0].statement),
+                    count=len(records),
+                    total_ms=sum(r.duration for r in records) * 1000,
+                    rows=sum(max(r.rows, 0) for r in records),
+                    locations=sorted({r.location for r in records}),
+                )
+                for fp, records in sorted(
+                    by_fingerprint.items(), key=lambda item: -sum(r.duration for r in item[1])
+                )
+            ],
+            n_plus_one=[vars(issue) for issue in self.n_plus_one()],
+        )
+
+
+## relationship key -> uselist, filled when the lazy load is seen
+_relationship_uselist: dict[str, bool] = {}
+
+
+def _suggest_loader(relationship: str) -> str:
+    # collections -> selectinload (one extra IN query), scalars -> joinedload (same query)
+    loader = "selectinload" if _relationship_uselist.get(relationship, True) else "joinedload"
+    return f".options({loader}({relationship}))"
+
+
+@contextmanager
+def query_trace(name: str = "trace", sample_rate: float = 1.0, n_plus_one_threshold: int = 3):
+    """Record every statement executed in this context (thread / asyncio task)."""
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        yield None
+        return
+    trace = QueryTrace(name, n_plus_one_threshold=n_plus_one_threshold)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        for issue in trace.n_plus_one():
+            logger.warning(
+                "N+1 in %s: %s lazy loaded %d times at %s, use %s",
+                trace.name,
+                issue.relationship,
+                issue.count,
+                issue.location,
+                issue.suggestion,
+            )
+
+
+def current_trace() -> QueryTrace | None:
+    return _current_trace.get()
+
+
+########################################3
+# EVENT HOOKS
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace.get() is None:
+        return
+    conn.info.setdefault("_instrumentation_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    starts = conn.info.get("_instrumentation_start")
+    if not starts:
+        return  # trace started between before and after
+    duration = time.perf_counter() - starts.pop()
+    lazy_load = context.execution_options.get(LAZY_LOAD_OPTION) if context else None
+    trace.add(
+        QueryRecord(
+            fingerprint=fingerprint(statement),
+            statement=statement,
+            duration=duration,
+            rows=cursor.rowcount,
+            location=_caller_location(),
+            lazy_load=lazy_load,
+        )
+    )
+
+
+def _handle_error(context):
+    # a failed statement never gets to after_cursor_execute, its start would pair with the next one
+    if context.connection is None or context.execution_context is None or _current_trace.get() is None:
+        return
+    starts = context.connection.info.get("_instrumentation_start")
+    if starts:
+        starts.pop()
+
+
+def _do_orm_execute(orm_execute_state):
+    if _current_trace.get() is None:
+        return
+    if not (orm_execute_state.is_relationship_load and orm_execute_state.lazy_loaded_from):
+        return
+    path = orm_execute_state.loader_strategy_path
+    prop = path[-1] if path is not None and len(path) else None
+    prop = getattr(prop, "prop", prop)
+    if prop is None or not hasattr(prop, "uselist"):
+        return
+    relationship = f"{prop.parent.class_.__name__}.{prop.key}"
+    _relationship_uselist[relationship] = prop.uselist
+    orm_execute_state.update_execution_options(**{LAZY_LOAD_OPTION: relationship})
+
+
+_instrumented: set[int] = set()
+
+
+def _instrument_engine(engine):
+    engine = getattr(engine, "sync_engine", engine)
+    if id(engine) in _instrumented:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    _instrumented.add(id(engine))
+
+
+def instrument(*engines):
+    """Hook cursor events on given engines (default: sync_engine and async_engine once built)."""
+    if engines:
+        for engine in engines:
+            _instrument_engine(engine)
+    else:
+        import database
+
+        # engines are built on first use, instrumenting doesn't build them or import the drivers
+        database.on_build("sync_engine", _instrument_engine)
+        database.on_build("async_engine", _instrument_engine)
+    if not event.contains(Session, "do_orm_execute", _do_orm_execute):
+        # AsyncSession runs on a sync Session, so this covers both
+        event.listen(Session, "do_orm_execute", _do_orm_execute)
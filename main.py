@@ -14,7 +14,8 @@ from queries.orm import SyncOrm, AsyncOrm
 # SyncCore.update_worker(worker_id=2, new_username="pipidaster where are you")
 # SyncCore.select_workers()
 
-SyncOrm.create_tables()
+SyncOrm.migrate()
+# SyncOrm.create_tables()  # drops all data
 SyncOrm.toggle_echo()
 SyncOrm.insert_data()
 # SyncOrm.update_worker()
@@ -0,0 +1,71 @@
+"""
+Versioned schema migrations (alembic), Base.metadata is the target schema.
+
+    alembic upgrade head                          # up
+    alembic downgrade -1                          # down one revision
+    alembic check                                 # does the database match models.py?
+    alembic revision --autogenerate -m "message"  # write the next script from the diff
+    alembic upgrade head --sql                    # print the SQL instead of running it
+
+or from code: upgrade(), downgrade(), schema_diff(), make_migration().
+
+Databases created by the old create_tables() (Base.metadata.create_all) have no
+alembic_version table, mark them once with `alembic stamp <revision>` for the
+schema they have, 0001 for the original one.
+Generated scripts build indexes on existing tables CONCURRENTLY and add foreign
+keys NOT VALID + VALIDATE, see migrations/operations.py. Always read a
+generated script before running it: alembic doesn't see CHECK constraints or
+partitioning (DB_PARTITION_RESUMES), partitions themselves are skipped.
+"""
+
+from pathlib import Path
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+
+from partitions import is_partition_name
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+def include_name(name, type_, parent_names) -> bool:
+    # resumes_pYYYY_MM partitions are managed by partitions.py, not by models.py
+    return not (type_ == "table" and is_partition_name(name))
+
+
+def alembic_config(connection=None) -> Config:
+    cfg = Config(str(ALEMBIC_INI))
+    cfg.set_main_option("script_location", str(ALEMBIC_INI.parent / "migrations"))
+    if connection is not None:
+        # env.py migrates through this connection instead of connecting by url
+        cfg.attributes["connection"] = connection
+    return cfg
+
+
+def upgrade(revision: str = "head", connection=None, sql: bool = False):
+    command.upgrade(alembic_config(connection), revision, sql=sql)
+
+
+def downgrade(revision: str = "-1", connection=None, sql: bool = False):
+    command.downgrade(alembic_config(connection), revision, sql=sql)
+
+
+def current(connection) -> tuple[str, ...]:
+    return MigrationContext.configure(connection).get_current_heads()
+
+
+def schema_diff(connection) -> list:
+    ## what models.py has and the live database doesn't (and the other way around)
+    from database import Base
+    import models  # noqa: F401
+
+    context = MigrationContext.configure(
+        connection, opts=dict(compare_type=True, include_name=include_name)
+    )
+    return compare_metadata(context, Base.metadata)
+
+
+def make_migration(message: str, autogenerate: bool = True):
+    return command.revision(alembic_config(), message=message, autogenerate=autogenerate)
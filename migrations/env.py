@@ -0,0 +1,94 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool, text
+
+import config as app_config
+import models  # noqa: F401 - registers every table on Base.metadata
+import migrations.operations  # noqa: F401 - op.create_index_concurrently and friends
+from database import Base
+from migrations import include_name
+from migrations.operations import process_revision_directives
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+x_args = context.get_x_argument(as_dictionary=True)
+## DDL waiting for a lock blocks every query queued behind it, give up early and retry instead
+LOCK_TIMEOUT = x_args.get("lock_timeout", "5s")
+
+
+def _url() -> str:
+    return (
+        x_args.get("url")
+        or config.get_main_option("sqlalchemy.url")
+        or app_config.settings.DATABASE_URL_psycopg
+    )
+
+
+def _configure(**kw):
+    context.configure(
+        target_metadata=target_metadata,
+        compare_type=True,
+        include_name=include_name,
+        # autocommit blocks (concurrent indexes, VALIDATE) end the transaction of their own migration only
+        transaction_per_migration=True,
+        process_revision_directives=process_revision_directives,
+        **kw,
+    )
+
+
+def run_migrations_offline() -> None:
+    ## alembic upgrade head --sql, prints the script for a DBA instead of running it
+    url = _url()
+    _configure(url=url, literal_binds=True, dialect_opts={"paramstyle": "named"})
+    if url.startswith("postgresql"):
+        context.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _set_lock_timeout(connection, value: str) -> None:
+    # session level, survives the commits of autocommit blocks
+    connection.execute(text("SELECT set_config('lock_timeout', :value, false)"), dict(value=value))
+    connection.commit()
+
+
+def _run(connection) -> None:
+    previous = None
+    if connection.dialect.name == "postgresql":
+        previous = connection.execute(text("SELECT current_setting('lock_timeout')")).scalar_one()
+        _set_lock_timeout(connection, LOCK_TIMEOUT)
+    try:
+        _configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+    except BaseException:
+        if previous is not None:
+            connection.rollback()  # a failed statement aborts the transaction, the reset needs a new one
+        raise
+    finally:
+        ## a passed in connection goes back to the application's pool afterwards
+        if previous is not None:
+            _set_lock_timeout(connection, previous)
+
+
+def run_migrations_online() -> None:
+    # migrations.upgrade(connection=...) passes a connection in, the CLI connects by url
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    engine = create_engine(_url(), poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        _run(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,199 @@
+"""
+Online schema change operations for migration scripts.
+
+    op.create_index_concurrently("resumes_created_at_id_index", "resumes", ["created_at", "id"])
+    op.drop_index_concurrently("resumes_created_at_id_index", table_name="resumes")
+    op.create_check_constraint(
+        "check_compensation_positive", "resumes", "compensation >= 0", postgresql_not_valid=True
+    )
+    op.validate_constraint("check_compensation_positive", "resumes")
+
+CREATE INDEX CONCURRENTLY can't run inside a transaction block, and VALIDATE
+CONSTRAINT must not share a transaction with the ADD CONSTRAINT ... NOT VALID
+(its ACCESS EXCLUSIVE lock is held until commit), so both run in an autocommit
+block: the migration transaction is committed first and a new one begins after.
+
+`alembic revision --autogenerate` rewrites index and foreign key additions on
+existing tables into these operations, see process_revision_directives().
+"""
+
+from alembic.autogenerate import renderers
+from alembic.operations import MigrateOperation, Operations, ops
+from sqlalchemy import text
+
+
+########################################3
+# INDEXES
+
+
+@Operations.register_operation("create_index_concurrently")
+class CreateIndexConcurrentlyOp(ops.CreateIndexOp):
+    @classmethod
+    def create_index_concurrently(cls, operations, index_name, table_name, columns, **kw):
+        return operations.invoke(cls(index_name, table_name, columns, **kw))
+
+    def reverse(self):
+        return DropIndexConcurrentlyOp(
+            self.index_name, self.table_name, schema=self.schema, _reverse=self
+        )
+
+
+@Operations.register_operation("drop_index_concurrently")
+class DropIndexConcurrentlyOp(ops.DropIndexOp):
+    @classmethod
+    def drop_index_concurrently(cls, operations, index_name, table_name=None, **kw):
+        return operations.invoke(cls(index_name, table_name, **kw))
+
+    def reverse(self):
+        return CreateIndexConcurrentlyOp.from_index(self.to_index())
+
+
+def _invalid_index(operations, index_name: str) -> bool:
+    # a failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, the retry would fail on it
+    context = operations.get_context()
+    if context.as_sql or context.dialect.name != "postgresql":
+        return False
+    return bool(
+        operations.get_bind()
+        .execute(
+            text(
+                "SELECT NOT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            dict(name=index_name),
+        )
+        .scalar()
+    )
+
+
+@Operations.implementation_for(CreateIndexConcurrentlyOp)
+def create_index_concurrently(operations, operation):
+    context = operations.get_context()
+    index = operation.to_index(context)
+    index.dialect_kwargs["postgresql_concurrently"] = True
+    with context.autocommit_block():
+        if _invalid_index(operations, operation.index_name):
+            operations.impl.drop_index(index)
+        operations.impl.create_index(index)
+
+
+@Operations.implementation_for(DropIndexConcurrentlyOp)
+def drop_index_concurrently(operations, operation):
+    context = operations.get_context()
+    index = operation.to_index(context)
+    index.dialect_kwargs["postgresql_concurrently"] = True
+    with context.autocommit_block():
+        operations.impl.drop_index(index)
+
+
+########################################3
+# CONSTRAINTS
+# add with postgresql_not_valid=True (only new rows are checked, no table scan under lock),
+# then validate_constraint() scans the table holding only SHARE UPDATE EXCLUSIVE
+
+
+@Operations.register_operation("validate_constraint")
+class ValidateConstraintOp(MigrateOperation):
+    def __init__(self, constraint_name: str, table_name: str, schema: str | None = None):
+        self.constraint_name = constraint_name
+        self.table_name = table_name
+        self.schema = schema
+
+    @classmethod
+    def validate_constraint(cls, operations, constraint_name, table_name, schema=None):
+        return operations.invoke(cls(constraint_name, table_name, schema))
+
+
+@Operations.implementation_for(ValidateConstraintOp)
+def validate_constraint(operations, operation):
+    context = operations.get_context()
+    if context.dialect.name != "postgresql":
+        return  # other dialects don't have NOT VALID constraints
+    preparer = context.dialect.identifier_preparer
+    table = preparer.quote(operation.table_name)
+    if operation.schema:
+        table = f"{preparer.quote_schema(operation.schema)}.{table}"
+    with context.autocommit_block():
+        operations.impl.execute(
+            f"ALTER TABLE {table} VALIDATE CONSTRAINT {preparer.quote(operation.constraint_name)}"
+        )
+
+
+class CreateForeignKeyNotValidOp(ops.CreateForeignKeyOp):
+    ## only used by autogenerate, renders op.create_foreign_key(..., postgresql_not_valid=True)
+    pass
+
+
+########################################3
+# AUTOGENERATE
+
+
+def _render_plain(autogen_context, op, base_cls):
+    plain = base_cls.__new__(base_cls)
+    plain.__dict__.update(op.__dict__)
+    return renderers.dispatch(plain)(autogen_context, plain)
+
+
+@renderers.dispatch_for(CreateIndexConcurrentlyOp)
+def _render_create_index_concurrently(autogen_context, op):
+    rendered = _render_plain(autogen_context, op, ops.CreateIndexOp)
+    return rendered.replace("create_index(", "create_index_concurrently(", 1)
+
+
+@renderers.dispatch_for(DropIndexConcurrentlyOp)
+def _render_drop_index_concurrently(autogen_context, op):
+    rendered = _render_plain(autogen_context, op, ops.DropIndexOp)
+    return rendered.replace("drop_index(", "drop_index_concurrently(", 1)
+
+
+@renderers.dispatch_for(CreateForeignKeyNotValidOp)
+def _render_create_foreign_key_not_valid(autogen_context, op):
+    rendered = _render_plain(autogen_context, op, ops.CreateForeignKeyOp)
+    return rendered[:-1] + ", postgresql_not_valid=True)"
+
+
+@renderers.dispatch_for(ValidateConstraintOp)
+def _render_validate_constraint(autogen_context, op):
+    schema = f", schema={op.schema!r}" if op.schema else ""
+    return f"op.validate_constraint({op.constraint_name!r}, {op.table_name!r}{schema})"
+
+
+def _rewrite(op_list: list, new_tables: set[str]) -> list:
+    ## tables created or dropped by the same migration are empty or going away, plain DDL is fine there
+    rewritten = []
+    for op in op_list:
+        if isinstance(op, ops.ModifyTableOps):
+            op.ops = _rewrite(op.ops, new_tables)
+        elif op.__class__ is ops.CreateIndexOp and op.table_name not in new_tables:
+            op = CreateIndexConcurrentlyOp(
+                op.index_name, op.table_name, op.columns, schema=op.schema, unique=op.unique, **op.kw
+            )
+        elif op.__class__ is ops.DropIndexOp and op.table_name not in new_tables:
+            op = DropIndexConcurrentlyOp(
+                op.index_name, op.table_name, schema=op.schema, _reverse=op._reverse, **op.kw
+            )
+        elif (
+            op.__class__ is ops.CreateForeignKeyOp
+            and op.constraint_name  # unnamed constraints can't be validated later
+            and op.source_table not in new_tables
+        ):
+            not_valid = CreateForeignKeyNotValidOp.__new__(CreateForeignKeyNotValidOp)
+            not_valid.__dict__.update(op.__dict__)
+            rewritten.append(not_valid)
+            op = ValidateConstraintOp(op.constraint_name, op.source_table, op.kw.get("source_schema"))
+        rewritten.append(op)
+    return rewritten
+
+
+def _table_names(op_list: list, op_cls) -> set[str]:
+    return {op.table_name for op in op_list if isinstance(op, op_cls)}
+
+
+def process_revision_directives(context, revision, directives):
+    script = directives[0]
+    for upgrade_ops, downgrade_ops in zip(script.upgrade_ops_list, script.downgrade_ops_list):
+        new_tables = _table_names(upgrade_ops.ops, ops.CreateTableOp)
+        upgrade_ops.ops = _rewrite(upgrade_ops.ops, new_tables)
+        downgrade_ops.ops = _rewrite(
+            downgrade_ops.ops, _table_names(downgrade_ops.ops, ops.DropTableOp)
+        )
@@ -0,0 +1,70 @@
+"""initial schema, what create_tables() built before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+workload = sa.Enum("parttime", "fulltime", name="workload")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "workers",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "vacancies",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=False),
+        sa.Column("compensation", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "resumes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(length=255), nullable=False),
+        sa.Column("compensation", sa.Integer(), nullable=True),
+        sa.Column("workload", workload, nullable=False),
+        sa.Column("worker_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False
+        ),
+        sa.CheckConstraint("compensation >= 0", name="check_compensation_positive"),
+        sa.ForeignKeyConstraint(["worker_id"], ["workers.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("title_index", "resumes", ["title"], unique=False)
+    op.create_table(
+        "vacancies_replies",
+        sa.Column("resume_id", sa.Integer(), nullable=False),
+        sa.Column("cover_letter", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["resume_id"], ["vacancies.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("resume_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("vacancies_replies")
+    op.drop_index("title_index", table_name="resumes")
+    op.drop_table("resumes")
+    op.drop_table("vacancies")
+    op.drop_table("workers")
+    workload.drop(op.get_bind(), checkfirst=True)
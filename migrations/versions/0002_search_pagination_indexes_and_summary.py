@@ -0,0 +1,71 @@
+"""keyset pagination and title search indexes, compensation summary tables
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "aggregates_state",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("is_stale", sa.Boolean(), server_default=sa.text("true"), nullable=False),
+        sa.Column("refreshed_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.create_table(
+        "resumes_compensation_summary",
+        sa.Column(
+            "workload",
+            postgresql.ENUM("parttime", "fulltime", name="workload", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("keyword", sa.String(length=64), nullable=False),
+        sa.Column("resumes_count", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.Column("compensation_sum", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("workload", "keyword"),
+    )
+
+    ## resumes and vacancies are live tables, build without blocking writes
+    op.create_index_concurrently("resumes_compensation_id_index", "resumes", ["compensation", "id"])
+    op.create_index_concurrently("resumes_created_at_id_index", "resumes", ["created_at", "id"])
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in ("resumes", "vacancies"):
+        op.create_index_concurrently(
+            f"{table}_title_trgm_index",
+            table,
+            ["title"],
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        )
+        op.create_index_concurrently(
+            f"{table}_title_tsv_index",
+            table,
+            [sa.text("to_tsvector('simple', title)")],
+            postgresql_using="gin",
+        )
+
+
+def downgrade() -> None:
+    for table in ("vacancies", "resumes"):
+        op.drop_index_concurrently(f"{table}_title_tsv_index", table_name=table)
+        op.drop_index_concurrently(f"{table}_title_trgm_index", table_name=table)
+    op.drop_index_concurrently("resumes_created_at_id_index", table_name="resumes")
+    op.drop_index_concurrently("resumes_compensation_id_index", table_name="resumes")
+    op.drop_table("resumes_compensation_summary")
+    op.drop_table("aggregates_state")
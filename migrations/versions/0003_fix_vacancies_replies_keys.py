@@ -0,0 +1,57 @@
+"""vacancies_replies keyed by (resume_id, vacancy_id)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:10:00.000000
+
+The old table had a single resume_id column referencing vacancies.id (the
+model declared resume_id twice), so it could not hold a resume - vacancy link
+and nothing in it is worth keeping: it is recreated.
+
+A partitioned resumes (create_tables() with DB_PARTITION_RESUMES, migrations
+never partition it) has a (id, created_at) primary key, there is no unique
+resumes.id to reference and resume_id gets no foreign key, same as models.py.
+That is read from the database, not the environment the migration runs in;
+offline (--sql) resumes is taken as not partitioned.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from partitions import is_partitioned
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    partitioned = not context.is_offline_mode() and is_partitioned(op.get_bind(), "resumes")
+    op.drop_table("vacancies_replies")
+    op.create_table(
+        "vacancies_replies",
+        sa.Column("resume_id", sa.Integer(), nullable=False),
+        sa.Column("vacancy_id", sa.Integer(), nullable=False),
+        sa.Column("cover_letter", sa.String(), nullable=False),
+        *(() if partitioned else (sa.ForeignKeyConstraint(["resume_id"], ["resumes.id"], ondelete="CASCADE"),)),
+        sa.ForeignKeyConstraint(["vacancy_id"], ["vacancies.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("resume_id", "vacancy_id"),
+    )
+    # the primary key serves lookups by resume, replies of a vacancy need their own index
+    op.create_index("vacancies_replies_vacancy_id_index", "vacancies_replies", ["vacancy_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("vacancies_replies_vacancy_id_index", table_name="vacancies_replies")
+    op.drop_table("vacancies_replies")
+    op.create_table(
+        "vacancies_replies",
+        sa.Column("resume_id", sa.Integer(), nullable=False),
+        sa.Column("cover_letter", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["resume_id"], ["vacancies.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("resume_id"),
+    )
@@ -0,0 +1,48 @@
+"""unique natural keys for upserts: workers.username, resumes (worker_id, title)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:15:00.000000
+
+Both are new constraints, not just indexes: workers.username was free to
+repeat before, from here on two workers can't share one and inserting a
+duplicate fails. upsert() relies on it for ON CONFLICT (username); code that
+needs repeated usernames passes its own conflict_target to upsert() and drops
+this index.
+
+Fails on existing duplicates, merge them first. A failed concurrent build
+leaves an INVALID index that create_index_concurrently drops on the retry.
+A partitioned resumes (see 0003) can't have the resumes one, a unique index
+there must contain created_at: see queries/upsert.py.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+
+from partitions import is_partitioned
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _resumes_partitioned() -> bool:
+    # the database's resumes, offline (--sql) it's taken as not partitioned
+    return not context.is_offline_mode() and is_partitioned(op.get_bind(), "resumes")
+
+
+def upgrade() -> None:
+    op.create_index_concurrently("workers_username_key", "workers", ["username"], unique=True)
+    if not _resumes_partitioned():
+        op.create_index_concurrently(
+            "resumes_worker_id_title_key", "resumes", ["worker_id", "title"], unique=True
+        )
+
+
+def downgrade() -> None:
+    if not _resumes_partitioned():
+        op.drop_index_concurrently("resumes_worker_id_title_key", table_name="resumes")
+    op.drop_index_concurrently("workers_username_key", table_name="workers")
@@ -3,6 +3,8 @@ import enum
 from typing import Annotated
 
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     ForeignKey,
     Table,
     Column,
@@ -14,9 +16,15 @@ from sqlalchemy import (
     Enum,
     CheckConstraint,
     Index,
+    event,
 )
 from database import Base, str_255
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
+
+import config
+from partitions import ensure_partitions
 
 metadata_obj = MetaData()
 
@@ -26,6 +34,55 @@ class Workload(enum.Enum):
     fulltime = "fulltime"
 
 
+## gin_trgm_ops indexes need the extension before tables are created
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def title_search_indexes(table_name: str) -> tuple[Index, Index]:
+    # trigram index serves ILIKE '%..%' and similarity, expression index serves full text search
+    # 'simple' config because titles mix russian and english, see queries/search.py
+    return (
+        Index(
+            f"{table_name}_title_trgm_index",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            f"{table_name}_title_tsv_index",
+            text("to_tsvector('simple', title)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+## the table and mapper shape depends on them, read on import without the connection settings
+PARTITION_RESUMES = config.get_schema_settings().DB_PARTITION_RESUMES
+## False: INSERTs return only the primary key, created_at/updated_at load on first access
+## (await session.refresh(obj) in async code), True: fetched with RETURNING on flush
+EAGER_DEFAULTS = config.get_schema_settings().DB_EAGER_DEFAULTS
+
+
+class utcnow(FunctionElement):
+    # server side default in utc, the same DDL on postgres, sqlite gets tables for tests and benchmarks
+    type = TIMESTAMP()
+    inherit_cache = True
+
+
+@compiles(utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', now())"
+
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"  # utc on sqlite
+
+
 ########################################3
 # DECLARATIVE POWER!!!!
 # can generate reusable column
@@ -34,13 +91,13 @@ class Workload(enum.Enum):
 ## custom fields aliases
 pk_int_field = Annotated[int, mapped_column(primary_key=True)]
 created_at_field = Annotated[
-    datetime, mapped_column(server_default=text("TIMEZONE('utc', now())"))
+    datetime, mapped_column(server_default=utcnow())
 ]
 updated_at_field = Annotated[
     datetime,
     mapped_column(
         onupdate=(lambda: datetime.now(UTC)),
-        server_default=text("TIMEZONE('utc', now())"),
+        server_default=utcnow(),
     ),
 ]
 
@@ -49,6 +106,9 @@ updated_at_field = Annotated[
 class WorkerOrm(Base):
     __tablename__ = "workers"
 
+    ## natural key: no two workers share a username (migration 0004), upserts conflict on it, see queries/upsert.py
+    __table_args__ = (Index("workers_username_key", "username", unique=True),)
+
     # id: Mapped[int] = mapped_column(primary_key=True)
     id: Mapped[pk_int_field]
     username: Mapped[str] = mapped_column(String(255))
@@ -76,12 +136,26 @@ class ResumeOrm(Base):
 
     __table_args__ = (
         Index("title_index", "title"),
+        ## keyset pagination keys, see queries/pagination.py
+        Index("resumes_compensation_id_index", "compensation", "id"),
+        Index("resumes_created_at_id_index", "created_at", "id"),
+        *title_search_indexes("resumes"),
         CheckConstraint("compensation >= 0", "check_compensation_positive"),
+        ## natural key, a partitioned table's unique index would need created_at too
+        *(
+            ()
+            if PARTITION_RESUMES
+            else (Index("resumes_worker_id_title_key", "worker_id", "title", unique=True),)
+        ),
+        ## monthly partitions by created_at, see partitions.py
+        {"postgresql_partition_by": "RANGE (created_at)"} if PARTITION_RESUMES else {},
     )
+    # partitioned table's primary key must contain created_at, identity in the session stays id
+    __mapper_args__ = {"primary_key": ["id"], "eager_defaults": EAGER_DEFAULTS}
 
     additional_print_fields = ("worker_id",)
 
-    id: Mapped[pk_int_field]
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     # id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(String(255))
     compensation: Mapped[int | None]
@@ -94,7 +168,9 @@ class ResumeOrm(Base):
     #     server_default=text("TIMEZONE('utc', now())")
     # )
     # updated_at: Mapped[datetime] = mapped_column(onupdate=(lambda: datetime.now(datetime.UTC)))
-    created_at: Mapped[created_at_field]
+    created_at: Mapped[datetime] = mapped_column(
+        server_default=utcnow(), primary_key=PARTITION_RESUMES
+    )
     updated_at: Mapped[updated_at_field]
 
     ## relations
@@ -103,18 +179,31 @@ class ResumeOrm(Base):
     )
 
     ## many to many relation!!!
+    ## read only, replies need a cover letter: write VacancyReplyOrm rows or use queries/replies.py
     vacancies_replied: Mapped[list["VacancyOrm"]] = relationship(
         back_populates="resumes_replied",
         secondary="vacancies_replies",
+        primaryjoin="ResumeOrm.id == foreign(VacancyReplyOrm.resume_id)",
+        secondaryjoin="VacancyOrm.id == foreign(VacancyReplyOrm.vacancy_id)",
+        viewonly=True,
     )
 
     # def __repr__(self):
     #     return f"{self.id=}, {self.title=}, {self.compensation=}"
 
 
+@event.listens_for(ResumeOrm.__table__, "after_create")
+def _create_resume_partitions(target, connection, **kw):
+    # inserts fail without a partition for their month
+    if PARTITION_RESUMES and connection.dialect.name == "postgresql":
+        ensure_partitions(connection, target.name)
+
+
 class VacancyOrm(Base):
     __tablename__ = "vacancies"
 
+    __table_args__ = (*title_search_indexes("vacancies"),)
+
     id: Mapped[pk_int_field]
     title: Mapped[str_255]
     compensation: Mapped[int | None]
@@ -122,24 +211,56 @@ class VacancyOrm(Base):
     resumes_replied: Mapped[list["ResumeOrm"]] = relationship(
         back_populates="vacancies_replied",
         secondary="vacancies_replies",  ## django through table
+        primaryjoin="VacancyOrm.id == foreign(VacancyReplyOrm.vacancy_id)",
+        secondaryjoin="ResumeOrm.id == foreign(VacancyReplyOrm.resume_id)",
+        viewonly=True,
     )
 
 
 class VacancyReplyOrm(Base):
     __tablename__ = "vacancies_replies"
 
+    ## the primary key serves lookups by resume, replies of a vacancy need their own index
+    __table_args__ = (Index("vacancies_replies_vacancy_id_index", "vacancy_id"),)
+
     resume_id: Mapped[int] = mapped_column(
-        ForeignKey("resumes.id", ondelete="CASCADE"),
+        # a partitioned resumes has no unique resumes.id to reference, see partitions.py
+        *(() if PARTITION_RESUMES else (ForeignKey("resumes.id", ondelete="CASCADE"),)),
         primary_key=True,
     )
 
-    resume_id: Mapped[int] = mapped_column(
+    vacancy_id: Mapped[int] = mapped_column(
         ForeignKey("vacancies.id", ondelete="CASCADE"),
         primary_key=True,
     )
 
     cover_letter: Mapped[str]
 
+    ## association object, the many to many relations above skip cover_letter
+    resume: Mapped["ResumeOrm"] = relationship(
+        primaryjoin="ResumeOrm.id == foreign(VacancyReplyOrm.resume_id)",
+    )
+    vacancy: Mapped["VacancyOrm"] = relationship()
+
+
+## maintained aggregates, see queries/aggregates.py
+class ResumeCompensationSummaryOrm(Base):
+    __tablename__ = "resumes_compensation_summary"
+
+    workload: Mapped[Workload] = mapped_column(primary_key=True)
+    keyword: Mapped[str] = mapped_column(String(64), primary_key=True)  # lowercase title keyword
+    resumes_count: Mapped[int] = mapped_column(BigInteger, server_default=text("0"))
+    compensation_sum: Mapped[int] = mapped_column(BigInteger, server_default=text("0"))
+
+
+class AggregateStateOrm(Base):
+    __tablename__ = "aggregates_state"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # stale - rows were written behind the ORM's back (COPY, bulk insert), needs a full refresh
+    is_stale: Mapped[bool] = mapped_column(server_default=text("true"))
+    refreshed_at: Mapped[datetime | None]
+
 
 ########################################3
 
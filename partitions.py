@@ -0,0 +1,191 @@
+"""
+Monthly range partitions of resumes by created_at (DB_PARTITION_RESUMES=true).
+
+    resumes                 PARTITION BY RANGE (created_at)
+    resumes_p2026_10        FOR VALUES FROM ('2026-10-01') TO ('2026-11-01')
+    resumes_p2026_11        ...
+
+There is no default partition: DETACH ... CONCURRENTLY refuses to run while
+one exists. An insert into a month without a partition fails, so run the
+maintenance job regularly (cron, `python -m partitions`), it keeps
+DB_PARTITION_MONTHS_AHEAD future months ready and moves partitions older than
+DB_PARTITION_RETAIN_MONTHS to the DB_PARTITION_ARCHIVE_SCHEMA schema, where
+they can be dumped and dropped without touching resumes.
+
+Queries filtering on created_at only scan matching partitions, check with
+scanned_partitions(explain(...)). The primary key is (id, created_at), so
+resumes.id is unique by its sequence only and can't be a foreign key target.
+"""
+
+import re
+from datetime import UTC, date, datetime
+
+from sqlalchemy import Engine, text
+
+import config
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month() -> date:
+    # created_at is stored in UTC
+    return month_start(datetime.now(UTC).date())
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partition_name(name: str) -> bool:
+    return _PARTITION_SUFFIX.search(name) is not None
+
+
+def parent_table(name: str) -> str:
+    # resumes_p2024_05 -> resumes, other names as they are
+    return _PARTITION_SUFFIX.sub("", name)
+
+
+def _quote(conn, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+########################################3
+# CATALOG
+
+
+def is_partitioned(conn, table: str) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            dict(table=table),
+        ).scalar()
+    )
+
+
+def list_partitions(conn, table: str) -> dict[date, str]:
+    ## month -> partition name, only partitions named by partition_name()
+    rows = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ),
+        dict(table=table),
+    ).scalars()
+    partitions = {}
+    for name in rows:
+        match = _PARTITION_SUFFIX.search(name)
+        if match and name == partition_name(table, date(int(match[1]), int(match[2]), 1)):
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return dict(sorted(partitions.items()))
+
+
+def _pending_detach(conn, table: str) -> list[str]:
+    # a DETACH ... CONCURRENTLY that was interrupted leaves the partition half detached
+    return list(
+        conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:table) AND i.inhdetachpending"
+            ),
+            dict(table=table),
+        ).scalars()
+    )
+
+
+########################################3
+# MAINTENANCE
+
+
+def create_partition(conn, table: str, month: date) -> str:
+    name = partition_name(table, month)
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {_quote(conn, name)} PARTITION OF {_quote(conn, table)} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    )
+    return name
+
+
+def ensure_partitions(
+    conn,
+    table: str = "resumes",
+    months_ahead: int | None = None,
+    start: date | None = None,
+) -> list[str]:
+    """Create missing partitions from start (default this month) to months_ahead months from now."""
+    if months_ahead is None:
+        months_ahead = config.settings.DB_PARTITION_MONTHS_AHEAD
+    existing = list_partitions(conn, table)
+    month = month_start(start) if start else current_month()
+    last = add_months(current_month(), months_ahead)
+    created = []
+    while month <= last:
+        if month not in existing:
+            created.append(create_partition(conn, table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def detach_partitions(
+    engine: Engine,
+    table: str = "resumes",
+    retain_months: int | None = None,
+    archive_schema: str | None = None,
+) -> list[str]:
+    """Detach partitions older than retain_months and move them to archive_schema."""
+    if retain_months is None:
+        retain_months = config.settings.DB_PARTITION_RETAIN_MONTHS
+    if archive_schema is None:
+        archive_schema = config.settings.DB_PARTITION_ARCHIVE_SCHEMA
+    if retain_months <= 0:
+        return []
+    cutoff = add_months(current_month(), -retain_months)
+    detached = []
+    # DETACH ... CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name in _pending_detach(conn, table):
+            conn.execute(text(f"ALTER TABLE {_quote(conn, table)} DETACH PARTITION {_quote(conn, name)} FINALIZE"))
+            detached.append(name)
+        for month, name in list_partitions(conn, table).items():
+            if add_months(month, 1) <= cutoff and name not in detached:
+                conn.execute(
+                    text(f"ALTER TABLE {_quote(conn, table)} DETACH PARTITION {_quote(conn, name)} CONCURRENTLY")
+                )
+                detached.append(name)
+        if detached:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {_quote(conn, archive_schema)}"))
+            for name in detached:
+                conn.execute(text(f"ALTER TABLE {_quote(conn, name)} SET SCHEMA {_quote(conn, archive_schema)}"))
+    return detached
+
+
+def run_maintenance(engine: Engine | None = None, table: str = "resumes") -> dict:
+    if engine is None:
+        from database import sync_engine as engine
+    with engine.begin() as conn:
+        if not is_partitioned(conn, table):
+            return dict(created=[], detached=[])
+        created = ensure_partitions(conn, table)
+    return dict(created=created, detached=detach_partitions(engine, table))
+
+
+def scanned_partitions(plan: list[str], table: str = "resumes") -> set[str]:
+    ## partitions an EXPLAIN plan reads, the rest were pruned
+    pattern = re.compile(rf"\b{re.escape(table)}_p\d{{4}}_\d{{2}}\b")
+    return {match for line in plan for match in pattern.findall(line)}
+
+
+if __name__ == "__main__":
+    print(run_maintenance())
@@ -0,0 +1,170 @@
+"""
+Server side prepared statements of the postgres drivers.
+
+asyncpg runs every statement prepared: sqlalchemy keeps an LRU of
+DB_ASYNCPG_PREPARED_STATEMENT_CACHE_SIZE prepared statements per connection, a
+miss is one more round trip (Parse/Describe) before the query. psycopg prepares
+a query after DB_PSYCOPG_PREPARE_THRESHOLD executions on the same connection
+and keeps DB_PSYCOPG_PREPARED_MAX of them.
+
+Both break behind PgBouncer in transaction mode: a statement prepared on one
+server connection is executed on another ("prepared statement ... does not
+exist"), and asyncpg's numbered names collide ("... already exists").
+DB_PGBOUNCER=true turns the caches off, names asyncpg's statements uniquely
+and stops psycopg from preparing.
+
+    prepared_metrics(async_engine)  # hits, prepares, unprepared executions, errors per sqlstate
+
+asyncpg hits are read from sqlalchemy's cache before the execution. psycopg
+doesn't expose its cache, its hits are counted with the same rule per
+connection, so they are an estimate.
+"""
+
+import threading
+import uuid
+from collections import Counter, OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.engine.interfaces import ExecuteStyle
+
+import config
+
+## sqlstates of a prepared statement gone missing or taken by another one
+PREPARED_ERRORS = {
+    "26000": "prepared statement does not exist",
+    "42P05": "prepared statement already exists",
+}
+_COUNTS = "prepared_counts"  # connection record info, psycopg: statement -> executions, LRU
+_PREPARED = "prepared_names"  # connection record info, psycopg: statements prepared on it, LRU
+
+
+def unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def asyncpg_connect_args() -> dict:
+    settings = config.settings
+    if settings.DB_PGBOUNCER:
+        return dict(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=unique_statement_name,
+        )
+    return dict(
+        statement_cache_size=settings.DB_ASYNCPG_STATEMENT_CACHE_SIZE,
+        prepared_statement_cache_size=settings.DB_ASYNCPG_PREPARED_STATEMENT_CACHE_SIZE,
+    )
+
+
+def psycopg_prepare_threshold() -> int | None:
+    threshold = config.settings.DB_PSYCOPG_PREPARE_THRESHOLD
+    return None if config.settings.DB_PGBOUNCER or threshold < 0 else threshold
+
+
+def psycopg_connect_args() -> dict:
+    return dict(prepare_threshold=psycopg_prepare_threshold())
+
+
+class PreparedMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.executions = 0
+            self.hits = 0  # ran a statement prepared before on the connection
+            self.prepares = 0  # prepared it first
+            self.unprepared = 0  # psycopg below the threshold or with preparing off
+            self.errors = Counter()  # sqlstate -> count, PREPARED_ERRORS only
+
+    def observe(self, outcome: str):
+        with self._lock:
+            self.executions += 1
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def on_error(self, sqlstate: str):
+        with self._lock:
+            self.errors[sqlstate] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            prepared = self.hits + self.prepares
+            return dict(
+                executions=self.executions,
+                hits=self.hits,
+                prepares=self.prepares,
+                unprepared=self.unprepared,
+                hit_ratio=self.hits / prepared if prepared else 0.0,
+                errors={f"{code} {PREPARED_ERRORS[code]}": n for code, n in self.errors.items()},
+            )
+
+
+_metrics: dict = {}  # sync engine -> PreparedMetrics
+
+
+def _asyncpg_outcome(dbapi_connection, statement: str) -> str:
+    cache = getattr(dbapi_connection, "_prepared_statement_cache", None)
+    return "hits" if cache is not None and statement in cache else "prepares"
+
+
+def _psycopg_outcome(connection_info: dict, dbapi_connection, statement: str) -> str:
+    ## psycopg's rule: prepared after prepare_threshold executions, at most prepared_max per connection
+    threshold = dbapi_connection.prepare_threshold
+    if threshold is None:
+        return "unprepared"
+    prepared = connection_info.setdefault(_PREPARED, OrderedDict())
+    if statement in prepared:
+        prepared.move_to_end(statement)
+        return "hits"
+    counts = connection_info.setdefault(_COUNTS, OrderedDict())
+    count = counts.pop(statement, 0) + 1
+    if count <= threshold:
+        counts[statement] = count
+        _trim(counts, dbapi_connection.prepared_max)
+        return "unprepared"
+    prepared[statement] = None
+    _trim(prepared, dbapi_connection.prepared_max)
+    return "prepares"
+
+
+def _trim(lru: OrderedDict, size: int):
+    while len(lru) > size:
+        lru.popitem(last=False)
+
+
+def listen_prepared_events(engine):
+    # works for AsyncEngine too, cursor events live on its sync_engine
+    engine = getattr(engine, "sync_engine", engine)
+    if engine.dialect.name != "postgresql":
+        return
+    metrics = _metrics[engine] = PreparedMetrics()
+    driver = engine.dialect.driver
+
+    if driver == "psycopg":
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            dbapi_connection.prepared_max = config.settings.DB_PSYCOPG_PREPARED_MAX
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        dbapi_connection = conn.connection.dbapi_connection
+        if driver == "asyncpg":
+            if executemany and context.execute_style is not ExecuteStyle.INSERTMANYVALUES:
+                return  # asyncpg's executemany goes through its own statement cache
+            metrics.observe(_asyncpg_outcome(dbapi_connection, statement))
+        elif driver == "psycopg":
+            metrics.observe(_psycopg_outcome(conn.connection.info, dbapi_connection, statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(context):
+        sqlstate = getattr(context.original_exception, "sqlstate", None)
+        if sqlstate in PREPARED_ERRORS:
+            metrics.on_error(sqlstate)
+
+
+def prepared_metrics(engine) -> dict:
+    engine = getattr(engine, "sync_engine", engine)
+    metrics = _metrics.get(engine)
+    return metrics.snapshot() if metrics is not None else {}
@@ -0,0 +1,273 @@
+"""
+Maintained compensation-by-workload aggregate.
+
+resumes_compensation_summary keeps count and sum of compensation per
+(workload, title keyword) for resumes with compensation >= SUMMARY_MIN_COMPENSATION.
+ORM flushes of ResumeOrm update it incrementally in the same transaction
+(after_insert / after_update / after_delete collect the deltas, after_flush
+writes them with one statement per flush). Writes that bypass the unit of
+work and deletes of expired resumes, whose old values are unknown, mark it
+stale, and select_avg_compensation() falls back to scanning resumes
+until refresh_compensation_summary() rebuilds it.
+ORM bulk statements (session.execute(insert(ResumeOrm)...)) are caught on the
+write session factories only, track_bulk_writes(session_class) adds others;
+anything else (COPY, Core on a connection) calls mark_stale_for().
+"""
+
+from collections import defaultdict
+from datetime import UTC, datetime
+
+from sqlalchemy import Integer, Numeric, cast, delete, event, func, inspect, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+
+import database
+from models import AggregateStateOrm, ResumeCompensationSummaryOrm, ResumeOrm
+
+SUMMARY_NAME = "resumes_compensation_summary"
+SUMMARY_MIN_COMPENSATION = 40000
+SUMMARY_KEYWORDS = (
+    "python",
+    "java",
+    "data",
+    "machine learning",
+    "analyst",
+    "developer",
+    "engineer",
+    "разработчик",
+    "программист",
+)
+
+summary_table = ResumeCompensationSummaryOrm.__table__
+state_table = AggregateStateOrm.__table__
+
+
+def title_keywords(title: str | None) -> list[str]:
+    # same matching as ResumeOrm.title.icontains(keyword)
+    title = (title or "").lower()
+    return [keyword for keyword in SUMMARY_KEYWORDS if keyword in title]
+
+
+def covers(like_language: str, min_compensation: int) -> bool:
+    return like_language.lower() in SUMMARY_KEYWORDS and min_compensation == SUMMARY_MIN_COMPENSATION
+
+
+def _insert(conn, table):
+    # both dialects have INSERT ... ON CONFLICT with the same API
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+_PENDING_DELTAS = "compensation_summary_deltas"  # session.info, (connection, deltas) of the running flush
+
+
+def _add_delta(target, conn, workload, compensation, title, sign: int):
+    if workload is None or compensation is None or compensation < SUMMARY_MIN_COMPENSATION:
+        return
+    keywords = title_keywords(title)
+    if not keywords:
+        return
+    ## summed per (workload, keyword) and written in after_flush, not a statement per resume
+    _, deltas = object_session(target).info.setdefault(
+        _PENDING_DELTAS, (conn, defaultdict(lambda: [0, 0]))
+    )
+    for keyword in keywords:
+        delta = deltas[workload, keyword]
+        delta[0] += sign
+        delta[1] += sign * compensation
+
+
+def _apply_deltas(conn, deltas: dict):
+    rows = [
+        dict(keyword=keyword, workload=workload, resumes_count=count, compensation_sum=total)
+        for (workload, keyword), (count, total) in deltas.items()
+        if count or total
+    ]
+    if not rows:
+        return
+    stmt = _insert(conn, summary_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[summary_table.c.workload, summary_table.c.keyword],
+        set_=dict(
+            resumes_count=summary_table.c.resumes_count + stmt.excluded.resumes_count,
+            compensation_sum=summary_table.c.compensation_sum + stmt.excluded.compensation_sum,
+        ),
+    )
+    conn.execute(stmt, rows)
+
+
+_UNKNOWN = object()  # changed after it was expired, the old value was never loaded
+
+
+def _committed(target, key):
+    # value as it is in the database, before this flush
+    history = inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return _UNKNOWN  # never the new value, the delta would cancel out
+    return history.unchanged[0] if history.unchanged else getattr(target, key)
+
+
+########################################3
+# INCREMENTAL MAINTENANCE
+
+
+@event.listens_for(ResumeOrm, "after_insert")
+def _resume_inserted(mapper, connection, target):
+    _add_delta(target, connection, target.workload, target.compensation, target.title, +1)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+## active history: setting an expired column loads the old value first, after_update needs it
+for _attribute in (ResumeOrm.title, ResumeOrm.compensation, ResumeOrm.workload):
+    event.listen(_attribute, "set", _keep_old_value, active_history=True)
+
+
+@event.listens_for(ResumeOrm, "after_update")
+def _resume_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    if not any(attrs[key].history.has_changes() for key in ("title", "compensation", "workload")):
+        return
+    workload, compensation, title = (_committed(target, key) for key in ("workload", "compensation", "title"))
+    if _UNKNOWN in (workload, compensation, title):
+        # same as deleting an expired object, loading it now would read the new row
+        mark_stale(connection)
+        return
+    _add_delta(target, connection, workload, compensation, title, -1)
+    _add_delta(target, connection, target.workload, target.compensation, target.title, +1)
+
+
+@event.listens_for(ResumeOrm, "after_delete")
+def _resume_deleted(mapper, connection, target):
+    loaded = inspect(target).dict
+    if not all(key in loaded for key in ("title", "compensation", "workload")):
+        # deleting an expired object would need a SELECT inside the flush
+        mark_stale(connection)
+        return
+    _add_delta(target, connection, loaded["workload"], loaded["compensation"], loaded["title"], -1)
+
+
+@event.listens_for(Session, "before_flush")
+def _reset_deltas(session, flush_context, instances):
+    # left over from a flush that failed after the mapper events
+    session.info.pop(_PENDING_DELTAS, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _write_deltas(session, flush_context):
+    pending = session.info.pop(_PENDING_DELTAS, None)
+    if pending is not None:
+        _apply_deltas(*pending)  # still inside the flush, on the connection the resumes were written with
+
+
+def _bulk_resume_write(orm_execute_state):
+    # ORM bulk INSERT/UPDATE/DELETE statements skip the mapper events above
+    if orm_execute_state.is_select or orm_execute_state.is_relationship_load:
+        return
+    if inspect(ResumeOrm) in orm_execute_state.all_mappers:
+        # same connection the statement will use, a RoutingSession would pick a replica without clause
+        conn = orm_execute_state.session.connection(
+            bind_arguments={"clause": orm_execute_state.statement, **orm_execute_state.bind_arguments}
+        )
+        mark_stale(conn)
+
+
+def track_bulk_writes(session_class: type[Session]):
+    ## not on Session: any do_orm_execute listener costs every ORM execute of the class
+    if not event.contains(session_class, "do_orm_execute", _bulk_resume_write):
+        event.listen(session_class, "do_orm_execute", _bulk_resume_write)
+
+
+for _name in ("write_session_factory", "async_write_session_factory"):
+    database.on_build(_name, lambda factory: track_bulk_writes(database.session_class(factory)))
+
+
+def mark_stale(conn):
+    stmt = _insert(conn, state_table).values(name=SUMMARY_NAME, is_stale=True)
+    conn.execute(stmt.on_conflict_do_update(index_elements=[state_table.c.name], set_=dict(is_stale=True)))
+
+
+def mark_stale_for(conn, table):
+    ## for code writing resumes without the ORM, e.g. bulk COPY
+    if table is ResumeOrm.__table__:
+        mark_stale(conn)
+
+
+########################################3
+# FULL REFRESH AND READ
+
+
+def refresh_compensation_summary(conn):
+    """Rebuild the summary from resumes, one grouped scan per keyword."""
+    conn.execute(delete(summary_table))
+    for keyword in SUMMARY_KEYWORDS:
+        conn.execute(
+            summary_table.insert().from_select(
+                ["workload", "keyword", "resumes_count", "compensation_sum"],
+                select(
+                    ResumeOrm.workload,
+                    literal(keyword),
+                    func.count(),
+                    func.sum(ResumeOrm.compensation),
+                )
+                .filter(
+                    ResumeOrm.title.icontains(keyword),
+                    ResumeOrm.compensation >= SUMMARY_MIN_COMPENSATION,
+                )
+                .group_by(ResumeOrm.workload),
+            )
+        )
+    now = datetime.now(UTC)
+    stmt = _insert(conn, state_table).values(name=SUMMARY_NAME, is_stale=False, refreshed_at=now)
+    conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[state_table.c.name], set_=dict(is_stale=False, refreshed_at=now)
+        )
+    )
+
+
+def stale_flag_query():
+    return select(AggregateStateOrm.is_stale).filter(AggregateStateOrm.name == SUMMARY_NAME)
+
+
+def summary_query(keyword: str, min_avg_compensation: int):
+    avg_compensation = cast(
+        cast(ResumeCompensationSummaryOrm.compensation_sum, Numeric)
+        / ResumeCompensationSummaryOrm.resumes_count,
+        Integer,
+    )
+    return (
+        select(ResumeCompensationSummaryOrm.workload, avg_compensation.label("avg_compensation"))
+        .filter(
+            ResumeCompensationSummaryOrm.keyword == keyword.lower(),
+            ResumeCompensationSummaryOrm.resumes_count > 0,
+            avg_compensation > min_avg_compensation,
+        )
+        .order_by(ResumeCompensationSummaryOrm.workload)
+    )
+
+
+def select_avg_compensation(session: Session, live_query, params: dict):
+    ## summary when it covers the request and is fresh, live_query over resumes otherwise
+    if covers(params["like_language"], params["min_compensation"]):
+        is_stale = session.execute(stale_flag_query()).scalar()
+        if is_stale is False:
+            return session.execute(
+                summary_query(params["like_language"], params["min_avg_compensation"])
+            ).all()
+    return session.execute(live_query, params).all()
+
+
+async def select_avg_compensation_async(session, live_query, params: dict):
+    if covers(params["like_language"], params["min_compensation"]):
+        is_stale = (await session.execute(stale_flag_query())).scalar()
+        if is_stale is False:
+            result = await session.execute(
+                summary_query(params["like_language"], params["min_avg_compensation"])
+            )
+            return result.all()
+    return (await session.execute(live_query, params)).all()
@@ -0,0 +1,224 @@
+"""
+Columnar export of report queries: Arrow tables and NumPy arrays instead of Row objects.
+
+    table = to_arrow(session, compensation_query())
+    compensation_stats(table)  # avg_diff and percentiles per workload, computed in NumPy
+
+On psycopg the query runs as COPY (...) TO STDOUT (FORMAT csv) and pyarrow's
+CSV reader parses the stream into columns in C++, no Python object per row or
+value. asyncpg gets the same COPY through copy_from_query. Other drivers
+(sqlite) fetch row partitions and build the columns with pa.array.
+COPY takes no bind parameters, they are rendered as literals. Binary COPY is
+not used: pyarrow can't read postgres' binary format and parsing it in Python
+would bring the per-value loop back.
+
+Enum columns (Workload) come back dictionary encoded: int32 codes plus the names.
+pyarrow and numpy are optional: pip install pyarrow numpy
+"""
+
+from typing import Any, Mapping
+
+from sqlalchemy import literal, select, types
+from sqlalchemy.sql import visitors
+
+from models import ResumeOrm, WorkerOrm
+
+EXPORT_BATCH_SIZE = 100_000  # rows a partition on the row by row fallback
+PERCENTILES = (50, 90, 99)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError as e:
+        raise RuntimeError("columnar export needs pyarrow: pip install pyarrow numpy") from e
+    return pyarrow
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("columnar stats need numpy: pip install pyarrow numpy") from e
+    return numpy
+
+
+def compensation_query():
+    ## the columns of join_cte_subquery_window_func, the window and avg_diff are left to NumPy
+    return (
+        select(
+            ResumeOrm.worker_id,
+            WorkerOrm.username,
+            ResumeOrm.compensation,
+            ResumeOrm.workload,
+        )
+        .join(WorkerOrm, ResumeOrm.worker_id == WorkerOrm.id)
+    )
+
+
+def _arrow_type(pa, sql_type):
+    # Enum is a String subclass, check it first
+    if isinstance(sql_type, types.Enum):
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, (types.Float, types.Numeric)):
+        return pa.float64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, types.Date):
+        return pa.date32()
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    return pa.string()
+
+
+def arrow_schema(query):
+    pa = _pyarrow()
+    return pa.schema(
+        [(key, _arrow_type(pa, column.type)) for key, column in query.selected_columns.items()]
+    )
+
+
+def literal_sql(dialect, query, params: Mapping[str, Any] | None = None) -> str:
+    ## SQL with the parameters inlined; untyped bindparam()s get the type of their value to render
+    params = params or {}
+
+    def _bind(bind):
+        if bind.key in params:
+            bind.value = params[bind.key]
+            bind.required = False
+        if bind.type._isnull and bind.value is not None:
+            bind.type = literal(bind.value).type
+
+    query = visitors.cloned_traverse(query, {}, {"bindparam": _bind})
+    return str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _read_csv(data: bytes, schema):
+    pa = _pyarrow()
+    return pa.csv.read_csv(
+        pa.py_buffer(data),
+        read_options=pa.csv.ReadOptions(column_names=schema.names),
+        parse_options=pa.csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa.csv.ConvertOptions(
+            column_types=schema,
+            # postgres csv: NULL is an empty unquoted field, an empty string is ""
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+            true_values=["t"],
+            false_values=["f"],
+        ),
+    )
+
+
+def _from_partitions(partitions, schema):
+    ## fallback: rows are already python objects, only the enum members need their names
+    pa = _pyarrow()
+    batches = []
+    for rows in partitions:
+        columns = list(zip(*rows))
+        arrays = []
+        for values, column_field in zip(columns, schema):
+            if pa.types.is_dictionary(column_field.type):
+                values = [None if v is None else getattr(v, "name", v) for v in values]
+            arrays.append(pa.array(values, type=column_field.type))
+        batches.append(pa.record_batch(arrays, schema=schema))
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def to_arrow(session, query, params: Mapping[str, Any] | None = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Run a Core select (or a prebuilt statement with bindparams) into a pyarrow.Table."""
+    schema = arrow_schema(query)
+    conn = session.connection(bind_arguments=dict(clause=query))  # a replica for a routing session
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg":
+        data = bytearray()
+        dbapi_conn = conn.connection.driver_connection  # raw psycopg.Connection
+        with dbapi_conn.cursor() as cursor:
+            sql = literal_sql(conn.dialect, query, params)
+            with cursor.copy(f"COPY ({sql}) TO STDOUT (FORMAT csv)") as copy:
+                for chunk in copy:
+                    data += chunk
+        return _read_csv(bytes(data), schema)
+    result = session.execute(query, params or {})
+    return _from_partitions(result.partitions(batch_size), schema)
+
+
+async def to_arrow_async(
+    session, query, params: Mapping[str, Any] | None = None, batch_size: int = EXPORT_BATCH_SIZE
+):
+    schema = arrow_schema(query)
+    conn = await session.connection(bind_arguments=dict(clause=query))
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        data = bytearray()
+
+        async def _write(chunk: bytes):
+            data.extend(chunk)
+
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_from_query(
+            literal_sql(conn.dialect, query, params), output=_write, format="csv"
+        )
+        return _read_csv(bytes(data), schema)
+    return await session.run_sync(to_arrow, query, params, batch_size)
+
+
+########################################3
+# NUMPY
+
+
+def to_numpy(table) -> dict[str, Any]:
+    """Column name -> ndarray, dictionary columns become their int32 codes (see categories())."""
+    pa = _pyarrow()
+    _numpy()
+    arrays = {}
+    for name, column in zip(table.column_names, table.columns):
+        column = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+        if pa.types.is_dictionary(column.type):
+            column = column.indices
+        arrays[name] = column.to_numpy(zero_copy_only=False)
+    return arrays
+
+
+def categories(table, name: str) -> list[str]:
+    column = table.column(name).unify_dictionaries()
+    return column.chunk(0).dictionary.to_pylist() if column.num_chunks else []
+
+
+def avg_diff(columns: dict[str, Any]):
+    """compensation - avg compensation of its workload for every row, avg_diff of the CTE/window query."""
+    np = _numpy()
+    codes = columns["workload"].astype(np.int64)
+    compensation = columns["compensation"].astype(np.float64)  # NULL is NaN
+    known = ~np.isnan(compensation)
+    size = int(codes.max()) + 1 if codes.size else 0
+    totals = np.bincount(codes[known], weights=compensation[known], minlength=size)
+    counts = np.bincount(codes[known], minlength=size)
+    means = np.divide(totals, counts, out=np.full(totals.shape, np.nan), where=counts > 0)
+    return compensation - means[codes]
+
+
+def compensation_stats(table, percentiles=PERCENTILES) -> dict[str, dict]:
+    """avg, avg_diff range and percentiles of compensation per workload."""
+    np = _numpy()
+    table = table.unify_dictionaries()
+    columns = to_numpy(table)
+    diff = avg_diff(columns)
+    codes = columns["workload"]
+    compensation = columns["compensation"].astype(np.float64)
+    stats = {}
+    for code, workload in enumerate(categories(table, "workload")):
+        mask = (codes == code) & ~np.isnan(compensation)
+        if not mask.any():
+            continue
+        values = compensation[mask]
+        stats[workload] = dict(
+            count=int(values.size),
+            avg=int(values.mean()),
+            avg_diff_min=int(diff[mask].min()),
+            avg_diff_max=int(diff[mask].max()),
+            **{f"p{p}": int(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+        )
+    return stats
@@ -0,0 +1,121 @@
+"""
+Read path straight into DTOs.
+
+Selects exactly the DTO's columns and validates plain row mappings in bulk
+with a TypeAdapter, so no ORM instances, identity map or attribute
+instrumentation are involved. Nested DTOs are assembled from a second flat
+query grouped in Python, the same two round trips selectinload would do.
+"""
+
+from collections import defaultdict
+
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import ResumeOrm, WorkerOrm
+from schema import ResumeDTO, ResumeRelDTO, WorkerDTO, WorkersRelDTO
+
+_workers_adapter = TypeAdapter(list[WorkerDTO])
+_resumes_adapter = TypeAdapter(list[ResumeDTO])
+_workers_rel_adapter = TypeAdapter(list[WorkersRelDTO])
+_resumes_rel_adapter = TypeAdapter(list[ResumeRelDTO])
+
+
+def dto_columns(model, dto: type[BaseModel], prefix: str = ""):
+    # columns named like the DTO's scalar fields, nested DTO fields are skipped
+    return [
+        getattr(model, name).label(f"{prefix}{name}")
+        for name in dto.model_fields
+        if name in model.__table__.c
+    ]
+
+
+def workers_query() -> Select:
+    return select(*dto_columns(WorkerOrm, WorkerDTO)).order_by(WorkerOrm.id)
+
+
+def resumes_query(worker_ids: list[int] | None = None) -> Select:
+    query = select(*dto_columns(ResumeOrm, ResumeDTO)).order_by(ResumeOrm.id)
+    if worker_ids is not None:
+        query = query.filter(ResumeOrm.worker_id.in_(worker_ids))
+    return query
+
+
+def resumes_rel_query() -> Select:
+    return (
+        select(
+            *dto_columns(ResumeOrm, ResumeDTO),
+            *dto_columns(WorkerOrm, WorkerDTO, prefix="worker__"),
+        )
+        .join(WorkerOrm, ResumeOrm.worker_id == WorkerOrm.id)
+        .order_by(ResumeOrm.id)
+    )
+
+
+def _nest_resumes(workers: list[dict], resumes) -> list[dict]:
+    by_worker = defaultdict(list)
+    for resume in resumes:
+        by_worker[resume["worker_id"]].append(resume)
+    for worker in workers:
+        worker["resumes"] = by_worker.get(worker["id"], [])
+    return workers
+
+
+def _nest_worker(rows) -> list[dict]:
+    worker_fields = WorkerDTO.model_fields
+    resumes = []
+    for row in rows:
+        resume = dict(row)
+        resume["worker"] = {name: resume.pop(f"worker__{name}") for name in worker_fields}
+        resumes.append(resume)
+    return resumes
+
+
+########################################3
+# SYNC
+
+
+def select_workers_dto(session: Session) -> list[WorkerDTO]:
+    return _workers_adapter.validate_python(session.execute(workers_query()).mappings().all())
+
+
+def select_resumes_dto(session: Session) -> list[ResumeDTO]:
+    return _resumes_adapter.validate_python(session.execute(resumes_query()).mappings().all())
+
+
+def select_workers_rel_dto(session: Session) -> list[WorkersRelDTO]:
+    workers = [dict(row) for row in session.execute(workers_query()).mappings()]
+    resumes = session.execute(resumes_query()).mappings()
+    return _workers_rel_adapter.validate_python(_nest_resumes(workers, resumes))
+
+
+def select_resumes_rel_dto(session: Session) -> list[ResumeRelDTO]:
+    rows = session.execute(resumes_rel_query()).mappings()
+    return _resumes_rel_adapter.validate_python(_nest_worker(rows))
+
+
+########################################3
+# ASYNC
+
+
+async def select_workers_dto_async(session: AsyncSession) -> list[WorkerDTO]:
+    result = await session.execute(workers_query())
+    return _workers_adapter.validate_python(result.mappings().all())
+
+
+async def select_resumes_dto_async(session: AsyncSession) -> list[ResumeDTO]:
+    result = await session.execute(resumes_query())
+    return _resumes_adapter.validate_python(result.mappings().all())
+
+
+async def select_workers_rel_dto_async(session: AsyncSession) -> list[WorkersRelDTO]:
+    workers = [dict(row) for row in (await session.execute(workers_query())).mappings()]
+    resumes = (await session.execute(resumes_query())).mappings()
+    return _workers_rel_adapter.validate_python(_nest_resumes(workers, resumes))
+
+
+async def select_resumes_rel_dto_async(session: AsyncSession) -> list[ResumeRelDTO]:
+    rows = (await session.execute(resumes_rel_query())).mappings()
+    return _resumes_rel_adapter.validate_python(_nest_worker(rows))
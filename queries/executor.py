@@ -0,0 +1,198 @@
+"""
+Run independent read queries concurrently.
+
+    results = await AsyncQueryExecutor(concurrency=5).run({
+        "python": ReadQuery(avg_stmt, dict(like_language="Python", ...)),
+        "java": ReadQuery(avg_stmt, dict(like_language="Java", ...), timeout=2),
+    })
+
+Every query gets its own session (and pooled connection), at most
+`concurrency` run at once. A query that fails or times out is reported in
+its QueryResult and does not affect the others unless fail_fast=True.
+
+Timeouts count from the moment a query gets one of the `concurrency` slots
+(the semaphore, a pool thread) to the end of its execution, connection
+checkout included: waiting behind other queries for a slot is not counted.
+A thread can't be interrupted, postgres cancels it with statement_timeout and
+run() gives up on it a second later; queries still queued when every thread
+is held by such an abandoned query time out without running.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Mapping
+
+from sqlalchemy import Executable, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import config
+import database
+
+
+@dataclass
+class ReadQuery:
+    # a statement (result is .all()) or a callable taking the session
+    statement: Executable | Callable[[Any], Any]
+    params: dict | None = None
+    timeout: float | None = None  # seconds, None - executor default
+
+
+@dataclass
+class QueryResult:
+    name: str
+    value: Any = None
+    error: BaseException | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _as_read_query(query: ReadQuery | Executable) -> ReadQuery:
+    return query if isinstance(query, ReadQuery) else ReadQuery(query)
+
+
+class AsyncQueryExecutor:
+    def __init__(
+        self,
+        session_factory=None,  # database.async_session_factory
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        fail_fast: bool = False,
+    ):
+        self.session_factory = session_factory or database.async_session_factory
+        # more concurrent queries than pooled connections only queue on the pool
+        self.concurrency = concurrency or config.settings.DB_POOL_SIZE
+        self.timeout = timeout
+        self.fail_fast = fail_fast
+
+    async def _execute(self, session: AsyncSession, query: ReadQuery):
+        if callable(query.statement) and not isinstance(query.statement, Executable):
+            return await query.statement(session)
+        result = await session.execute(query.statement, query.params)
+        return result.all()
+
+    async def _run_one(self, name: str, query: ReadQuery, semaphore: asyncio.Semaphore) -> QueryResult:
+        timeout = query.timeout if query.timeout is not None else self.timeout
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with self.session_factory() as session:
+                    # the session connects on the first execute, inside the timeout
+                    value = await asyncio.wait_for(self._execute(session, query), timeout)
+            except Exception as e:
+                if self.fail_fast:
+                    raise
+                return QueryResult(name, error=e, elapsed=time.perf_counter() - start)
+            return QueryResult(name, value, elapsed=time.perf_counter() - start)
+
+    async def run(self, queries: Mapping[str, ReadQuery | Executable]) -> dict[str, QueryResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = {
+            name: asyncio.create_task(self._run_one(name, _as_read_query(query), semaphore))
+            for name, query in queries.items()
+        }
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            # fail_fast or the caller was cancelled: don't leave queries running
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+
+class ThreadPoolQueryExecutor:
+    ## sync counterpart, threads only wait on the network so the GIL is not a problem
+    def __init__(
+        self,
+        session_factory=None,  # database.session_factory
+        concurrency: int | None = None,
+        timeout: float | None = None,
+        fail_fast: bool = False,
+    ):
+        self.session_factory = session_factory or database.session_factory
+        self.concurrency = concurrency or config.settings.DB_POOL_SIZE
+        self.timeout = timeout
+        self.fail_fast = fail_fast
+
+    def _run_one(self, name: str, query: ReadQuery, timeout: float | None) -> QueryResult:
+        start = time.perf_counter()
+        try:
+            with self.session_factory() as session:
+                if timeout is not None and session.get_bind().dialect.name == "postgresql":
+                    # a thread can't be interrupted, so the server cancels the query instead
+                    session.execute(
+                        select(func.set_config("statement_timeout", f"{int(timeout * 1000)}", True))
+                    )
+                if callable(query.statement) and not isinstance(query.statement, Executable):
+                    value = query.statement(session)
+                else:
+                    value = session.execute(query.statement, query.params).all()
+        except Exception as e:
+            if self.fail_fast:
+                raise
+            return QueryResult(name, error=e, elapsed=time.perf_counter() - start)
+        return QueryResult(name, value, elapsed=time.perf_counter() - start)
+
+    def _run_started(self, name: str, query: ReadQuery, timeout: float | None, started: dict, changed):
+        with changed:
+            started[name] = time.monotonic()
+            changed.notify_all()
+        return self._run_one(name, query, timeout)
+
+    def run(self, queries: Mapping[str, ReadQuery | Executable]) -> dict[str, QueryResult]:
+        results = {}
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        changed = threading.Condition()  # a query started or finished
+        started: dict[str, float] = {}  # name -> monotonic time a thread picked it up
+        timed_out = []  # futures given up on, their threads may still run
+        abandoned = False  # run() doesn't wait for those threads
+        try:
+            futures = {}
+            for name, query in queries.items():
+                query = _as_read_query(query)
+                timeout = query.timeout if query.timeout is not None else self.timeout
+                future = pool.submit(self._run_started, name, query, timeout, started, changed)
+                future.add_done_callback(lambda _: self._notify(changed))
+                futures[name] = (future, timeout)
+            for name, (future, timeout) in futures.items():
+                try:
+                    results[name] = future.result(self._remaining(name, future, timeout, started, changed, timed_out))
+                except FutureTimeoutError as e:
+                    abandoned = True
+                    if self.fail_fast:
+                        raise
+                    future.cancel()
+                    timed_out.append(future)
+                    results[name] = QueryResult(name, error=e)
+        except BaseException:
+            abandoned = True
+            raise
+        finally:
+            pool.shutdown(wait=not abandoned, cancel_futures=abandoned)
+        return results
+
+    @staticmethod
+    def _notify(changed):
+        with changed:
+            changed.notify_all()
+
+    def _remaining(self, name, future, timeout, started, changed, timed_out) -> float | None:
+        ## seconds future.result() may wait: the deadline counts from the start of the query
+        if timeout is None:
+            return None
+        with changed:
+            while name not in started and not future.done():
+                if sum(not f.done() for f in timed_out) >= self.concurrency:
+                    raise FutureTimeoutError()  # every thread is stuck, it would never start
+                changed.wait()
+            start = started.get(name, time.monotonic())
+        # small grace period over the server side statement_timeout
+        return max(start + timeout + 1 - time.monotonic(), 0)
@@ -0,0 +1,62 @@
+"""
+Frozen read-only entities for results that are never mutated.
+
+    workers = fetch_frozen(session, WorkerOrm)  # [FrozenWorkerOrm(id=1, username='Jack'), ...]
+    resumes = fetch_frozen(session, ResumeOrm, select_frozen(ResumeOrm).where(ResumeOrm.compensation > 100_000))
+
+A frozen class is a namedtuple of the model's column attributes, built once per
+model: no __dict__, no instance state, no identity map and no attribute
+instrumentation, a row becomes an object with one tuple.__new__. Attributes
+can't be set and relationships aren't there, so nothing can lazy load.
+repr is the model's one (database.repr_fields).
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import Select, inspect, select
+
+from database import repr_fields
+
+_classes = {}  # model -> frozen class
+
+
+def _frozen_repr(self) -> str:
+    cols = [f"{col}={getattr(self, col)}" for col in self._repr_fields]
+    return f"<{self.__class__.__name__}, {', '.join(cols)}>"
+
+
+def frozen_class(model) -> type:
+    try:
+        return _classes[model]
+    except KeyError:
+        pass
+    fields = tuple(prop.key for prop in inspect(model).column_attrs)
+    base = namedtuple(f"Frozen{model.__name__}", fields)
+    _classes[model] = cls = type(
+        base.__name__,
+        (base,),
+        dict(
+            __slots__=(),
+            __repr__=_frozen_repr,
+            __model__=model,
+            _repr_fields=tuple(f for f in repr_fields(model) if f in fields),
+        ),
+    )
+    return cls
+
+
+def select_frozen(model) -> Select:
+    # the columns in the frozen class' field order, add where()/order_by()/limit() as usual
+    return select(*(prop.columns[0] for prop in inspect(model).column_attrs))
+
+
+def fetch_frozen(session, model, query: Select | None = None, params: dict | None = None) -> list:
+    cls = frozen_class(model)
+    result = session.execute(query if query is not None else select_frozen(model), params or {})
+    return list(map(cls._make, result))
+
+
+async def fetch_frozen_async(session, model, query: Select | None = None, params: dict | None = None) -> list:
+    cls = frozen_class(model)
+    result = await session.execute(query if query is not None else select_frozen(model), params or {})
+    return list(map(cls._make, result))
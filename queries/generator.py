@@ -0,0 +1,336 @@
+"""
+Deterministic synthetic data at scale.
+
+    data = SyntheticData(workers=10_000_000, resumes=50_000_000, vacancies=100_000, replies=5_000_000)
+    for row in data.resume_stream():  # lazy stream of tuples in RESUME_COLUMNS order
+        ...
+    data.load(url, processes=8)  # COPY on psycopg, multi-row INSERT elsewhere
+
+    python -m queries.generator --url postgresql+psycopg://... --resumes 50000000 --recreate
+
+Rows are generated in fixed size shards, each one with its own Random seeded
+by (seed, table, shard): the same seed gives the same rows whatever the number
+of processes. Ids are generated too, so resumes point at their workers and
+replies at resumes without reading anything back, load() moves the id
+sequences past them afterwards.
+
+Distributions:
+    resumes per worker - power law, a minority of workers has most resumes, some have none
+    compensation - log-normal per Workload, fulltime around 150k, parttime around 70k
+    titles - english and russian, like test_data.py
+    replies per vacancy - power law, popular vacancies get most of them
+    created_at - uniform over `months` months before `until`
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import create_engine, pool, text
+
+from models import ResumeOrm, VacancyOrm, VacancyReplyOrm, WorkerOrm, Workload
+from partitions import add_months, current_month, ensure_partitions, is_partitioned
+from .orm import BulkLoadResult, bulk_load_sync
+from .upsert import MAX_BIND_PARAMS
+
+WORKER_COLUMNS = ("id", "username")
+RESUME_COLUMNS = ("id", "title", "compensation", "workload", "worker_id", "created_at")
+VACANCY_COLUMNS = ("id", "title", "compensation")
+REPLY_COLUMNS = ("resume_id", "vacancy_id", "cover_letter")
+
+WORKER_SHARD = 100_000  # workers a shard, their resumes go with them
+VACANCY_SHARD = 1_000  # vacancies a shard, their replies go with them
+COPY_CHUNK = 100_000  # rows a COPY transaction
+
+NAMES = ("Artem", "Roman", "Petr", "Jack", "Michael", "Анна", "Мария", "Иван", "Ольга", "Dmitry")
+LEVELS = ("Junior", "Middle", "Senior", "Lead")
+LEVELS_RU = ("Младший", "Старший", "Ведущий")
+ROLES = (
+    "Python Developer",
+    "Python Data Engineer",
+    "Data Scientist",
+    "Machine Learning Engineer",
+    "Python Analyst",
+    "Backend Developer",
+    "DevOps Engineer",
+)
+ROLES_RU = ("Python Разработчик", "Python программист", "Инженер данных", "Аналитик данных", "Backend Разработчик")
+COVER_LETTERS = (
+    "Hello, I am interested in this vacancy",
+    "Python is my favourite language",
+    "Здравствуйте, меня заинтересовала ваша вакансия",
+    "Готов приступить к работе через две недели",
+)
+
+## (median, sigma) of log-normal compensation
+COMPENSATION = {
+    Workload.fulltime: (150_000, 0.45),
+    Workload.parttime: (70_000, 0.5),
+}
+FULLTIME_SHARE = 0.75
+RUSSIAN_SHARE = 0.3
+
+
+def _title(rnd: random.Random) -> str:
+    if rnd.random() < RUSSIAN_SHARE:
+        return f"{rnd.choice(LEVELS_RU)} {rnd.choice(ROLES_RU)}"
+    return f"{rnd.choice(LEVELS)} {rnd.choice(ROLES)}"
+
+
+def _span(total: int, parts_total: int, start: int, stop: int) -> tuple[int, int]:
+    # rows [first, last) of `total` proportional to parts [start, stop) of `parts_total`, exact over all shards
+    return total * start // parts_total, total * stop // parts_total
+
+
+def _skewed_counts(rnd: random.Random, slots: int, items: int, skew: float) -> list[int]:
+    ## items over slots, P(rank < x) = x ** (1 / skew), ranks shuffled so counts don't follow ids
+    counts = [0] * slots
+    if not slots:
+        return counts
+    ranks = list(range(slots))
+    rnd.shuffle(ranks)
+    for _ in range(items):
+        counts[ranks[int(slots * rnd.random() ** skew)]] += 1
+    return counts
+
+
+@dataclass(frozen=True)
+class SyntheticData:
+    workers: int = 200_000
+    resumes: int = 1_000_000
+    vacancies: int = 2_000
+    replies: int = 100_000
+    seed: int = 42
+    skew: float = 2.0  # 1 - uniform, higher - more resumes on fewer workers
+    months: int = 12
+    # default start of this month: a rerun within a month gives the same rows
+    until: datetime = field(default_factory=lambda: datetime.combine(current_month(), datetime.min.time()))
+
+    def _random(self, table: str, shard: int) -> random.Random:
+        return random.Random(f"{self.seed}:{table}:{shard}")
+
+    ## shards
+
+    def worker_shards(self) -> range:
+        return range(math.ceil(self.workers / WORKER_SHARD))
+
+    def vacancy_shards(self) -> range:
+        return range(math.ceil(self.vacancies / VACANCY_SHARD))
+
+    def _workers_of(self, shard: int) -> tuple[int, int]:
+        return shard * WORKER_SHARD, min((shard + 1) * WORKER_SHARD, self.workers)
+
+    def _vacancies_of(self, shard: int) -> tuple[int, int]:
+        return shard * VACANCY_SHARD, min((shard + 1) * VACANCY_SHARD, self.vacancies)
+
+    def worker_rows(self, shard: int) -> Iterator[tuple]:
+        rnd = self._random("workers", shard)
+        first, last = self._workers_of(shard)
+        for worker_id in range(first + 1, last + 1):
+            yield worker_id, f"{rnd.choice(NAMES)} {worker_id}"
+
+    def resume_rows(self, shard: int) -> Iterator[tuple]:
+        rnd = self._random("resumes", shard)
+        first_worker, last_worker = self._workers_of(shard)
+        first, last = _span(self.resumes, self.workers, first_worker, last_worker)
+        counts = _skewed_counts(rnd, last_worker - first_worker, last - first, self.skew)
+        period = self.months * 30 * 86_400
+        resume_id = first
+        for offset, count in enumerate(counts):
+            seen = set()
+            for _ in range(count):
+                title = _title(rnd)
+                if title in seen:  # (worker_id, title) is unique
+                    title = f"{title} {len(seen)}"
+                seen.add(title)
+                workload = Workload.fulltime if rnd.random() < FULLTIME_SHARE else Workload.parttime
+                median, sigma = COMPENSATION[workload]
+                resume_id += 1
+                yield (
+                    resume_id,
+                    title,
+                    int(round(rnd.lognormvariate(math.log(median), sigma), -3)),
+                    workload,
+                    first_worker + offset + 1,
+                    self.until - timedelta(seconds=rnd.random() * period),
+                )
+
+    def vacancy_rows(self, shard: int) -> Iterator[tuple]:
+        rnd = self._random("vacancies", shard)
+        first, last = self._vacancies_of(shard)
+        for vacancy_id in range(first + 1, last + 1):
+            median, sigma = COMPENSATION[Workload.fulltime]
+            yield vacancy_id, _title(rnd), int(round(rnd.lognormvariate(math.log(median), sigma), -3))
+
+    def reply_rows(self, shard: int) -> Iterator[tuple]:
+        rnd = self._random("replies", shard)
+        first_vacancy, last_vacancy = self._vacancies_of(shard)
+        first, last = _span(self.replies, self.vacancies, first_vacancy, last_vacancy)
+        counts = _skewed_counts(rnd, last_vacancy - first_vacancy, last - first, self.skew)
+        for offset, count in enumerate(counts):
+            # (resume_id, vacancy_id) is the primary key, a vacancy can't get more replies than resumes
+            for resume_id in rnd.sample(range(1, self.resumes + 1), min(count, self.resumes)):
+                yield resume_id, first_vacancy + offset + 1, rnd.choice(COVER_LETTERS)
+
+    ## whole tables, lazily
+
+    def worker_stream(self) -> Iterator[tuple]:
+        for shard in self.worker_shards():
+            yield from self.worker_rows(shard)
+
+    def resume_stream(self) -> Iterator[tuple]:
+        for shard in self.worker_shards():
+            yield from self.resume_rows(shard)
+
+    def vacancy_stream(self) -> Iterator[tuple]:
+        for shard in self.vacancy_shards():
+            yield from self.vacancy_rows(shard)
+
+    def reply_stream(self) -> Iterator[tuple]:
+        for shard in self.vacancy_shards():
+            yield from self.reply_rows(shard)
+
+    def load(self, url: str, processes: int | None = None) -> dict:
+        """Write every table into empty tables at url, returns table -> BulkLoadResult."""
+        return load(self, url, processes)
+
+
+########################################3
+# LOADING
+
+## table, its columns, the SyntheticData method making a shard, the shards
+PHASES = (
+    (WorkerOrm.__table__, WORKER_COLUMNS, "worker_rows", "worker_shards"),
+    (ResumeOrm.__table__, RESUME_COLUMNS, "resume_rows", "worker_shards"),
+    (VacancyOrm.__table__, VACANCY_COLUMNS, "vacancy_rows", "vacancy_shards"),
+    (VacancyReplyOrm.__table__, REPLY_COLUMNS, "reply_rows", "vacancy_shards"),
+)
+
+_engines = {}  # url -> engine, one per process
+
+
+def _engine(url: str):
+    if url not in _engines:
+        _engines[url] = create_engine(url, poolclass=pool.NullPool)
+    return _engines[url]
+
+
+def _load_shard(task: tuple) -> BulkLoadResult:
+    url, data, phase, shard = task
+    table, columns, rows, _ = PHASES[phase]
+    engine = _engine(url)
+    use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg"
+    chunk_size = COPY_CHUNK if use_copy else MAX_BIND_PARAMS // len(columns)
+    return bulk_load_sync(table, getattr(data, rows)(shard), columns, chunk_size, engine=engine)
+
+
+def _prepare(engine, data: SyntheticData):
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        if is_partitioned(conn, ResumeOrm.__tablename__):
+            # inserts fail without a partition for their month
+            ensure_partitions(conn, ResumeOrm.__tablename__, start=add_months(data.until.date(), -data.months))
+
+
+def _finish(engine):
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            ## ids were generated, the next INSERT must not collide with them
+            for table in (WorkerOrm.__table__, ResumeOrm.__table__, VacancyOrm.__table__):
+                conn.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                        f"coalesce(max(id), 0) + 1, false) FROM {table.name}"
+                    )
+                )
+        conn.execute(text("ANALYZE"))  # fresh statistics for the planner and pagination estimates
+
+
+def load(data: SyntheticData, url: str, processes: int | None = None) -> dict:
+    engine = _engine(url)
+    if engine.dialect.name == "sqlite":
+        processes = 1  # one writer at a time
+    processes = processes or os.cpu_count() or 1
+    _prepare(engine, data)
+    results = {}
+    ctx = multiprocessing.get_context("spawn")  # no engines or connections inherited by a fork
+    with (ctx.Pool(processes) if processes > 1 else _InProcess()) as executor:
+        ## tables one after another for the foreign keys, shards of a table in parallel
+        for phase, (table, _, _, shards) in enumerate(PHASES):
+            start = time.perf_counter()
+            tasks = [(url, data, phase, shard) for shard in getattr(data, shards)()]
+            loaded = list(executor.imap_unordered(_load_shard, tasks))
+            results[table.name] = BulkLoadResult(
+                table.name,
+                sum(r.rows for r in loaded),
+                sum(r.chunks for r in loaded),
+                time.perf_counter() - start,
+            )
+    _finish(engine)
+    return results
+
+
+class _InProcess:
+    ## Pool's imap_unordered without processes
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap_unordered(self, fn, tasks):
+        return map(fn, tasks)
+
+
+def main():
+    import config
+    from database import Base
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=config.settings.DATABASE_URL_psycopg)
+    parser.add_argument("--resumes", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, help="default resumes / 5")
+    parser.add_argument("--vacancies", type=int, help="default resumes / 500")
+    parser.add_argument("--replies", type=int, help="default resumes / 10")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=2.0)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--recreate", action="store_true", help="drop and create all tables first")
+    args = parser.parse_args()
+
+    data = SyntheticData(
+        workers=args.workers or max(args.resumes // 5, 1),
+        resumes=args.resumes,
+        vacancies=args.vacancies if args.vacancies is not None else max(args.resumes // 500, 1),
+        replies=args.replies if args.replies is not None else args.resumes // 10,
+        seed=args.seed,
+        skew=args.skew,
+        months=args.months,
+    )
+    if args.recreate:
+        engine = _engine(args.url)
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+    results = data.load(args.url, args.processes)
+    print(
+        json.dumps(
+            {
+                name: dict(rows=r.rows, chunks=r.chunks, seconds=round(r.elapsed, 1), rows_per_second=round(r.rows_per_second))
+                for name, r in results.items()
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,293 @@
-from sqlalchemy import Integer, and_, insert, select, func, cast
-from sqlalchemy.orm import aliased, joinedload, selectinload, contains_eager
+import asyncio
+import enum
+import functools
+import itertools
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Iterator, Mapping, Sequence
+
+from sqlalchemy import Enum, Table, insert, select
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
+from cache import second_level_cache
+from partitions import current_month, scanned_partitions
+from prepared import prepared_metrics
+from write_mode import flush_reports
+import database
 from database import Base
-from database import session_factory, sync_engine, async_engine, async_session_factory
 from models import ResumeOrm, VacancyOrm, WorkerOrm, Workload
+from .aggregates import (
+    mark_stale_for,
+    refresh_compensation_summary,
+    select_avg_compensation,
+    select_avg_compensation_async,
+)
+from .columnar import compensation_query, compensation_stats, to_arrow, to_arrow_async
+from .dto import (
+    select_resumes_rel_dto,
+    select_resumes_rel_dto_async,
+    select_workers_rel_dto,
+    select_workers_rel_dto_async,
+)
+from .frozen import fetch_frozen, fetch_frozen_async, select_frozen
+from .executor import AsyncQueryExecutor, ReadQuery, ThreadPoolQueryExecutor
+from .pagination import Page, paginate, paginate_async
+from .plans import check_plans
+from .replies import NOTHING, Reply, ReplyBulkResult, add_replies, add_replies_async
+from .search import AUTO, explain, search_query, uses_index
+from .streaming import stream_batches, stream_batches_async
+from .statements import (
+    build_avg_compensation_for_workload,
+    build_cte_subquery_window_func,
+    build_resumes_avg_compensation,
+    build_workers_and_resumes_with_limit,
+    CompiledCacheStats,
+    statement_cache,
+    track_compiled_cache,
+)
+from .upsert import upsert_workers_with_resumes, upsert_workers_with_resumes_async
 from .test_data import resumes, additional_resumes, additional_workers
 
+sync_compiled_cache = CompiledCacheStats()
+async_compiled_cache = CompiledCacheStats()
+database.on_build("sync_engine", functools.partial(track_compiled_cache, stats=sync_compiled_cache))
+database.on_build("async_engine", functools.partial(track_compiled_cache, stats=async_compiled_cache))
+
+
+########################################3
+# BULK LOADING
+# COPY ... FROM STDIN skips the identity map and per-row INSERT round trips,
+# other dialects fall back to multi-row insert().values() batches
+
+WORKER_COPY_COLUMNS = ("username",)
+RESUME_COPY_COLUMNS = ("title", "compensation", "workload", "worker_id")
+
+
+@dataclass
+class BulkLoadResult:
+    table: str
+    rows: int
+    chunks: int
+    elapsed: float  # seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _chunked(iterable: Iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _enum_coercers(table: Table, columns: Sequence[str]) -> dict[int, type[enum.Enum]]:
+    ## position in row -> enum class, for columns like ResumeOrm.workload
+    return {
+        i: table.c[col].type.enum_class
+        for i, col in enumerate(columns)
+        if isinstance(table.c[col].type, Enum) and table.c[col].type.enum_class
+    }
+
+
+def _coerce_enum(enum_class: type[enum.Enum], value: Any) -> str | None:
+    # sqlalchemy Enum stores member NAMES, so "fulltime" and Workload.fulltime both become "fulltime"
+    if value is None:
+        return None
+    if isinstance(value, enum_class):
+        return value.name
+    if value in enum_class.__members__:
+        return value
+    return enum_class(value).name  # lookup by value, raises ValueError for garbage
+
+
+def _prepare_rows(
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    columns: Sequence[str],
+    coercers: dict[int, type[enum.Enum]],
+):
+    for row in rows:
+        if isinstance(row, Mapping):
+            values = [row.get(col) for col in columns]
+        else:
+            values = list(row)
+            if len(values) != len(columns):
+                raise ValueError(f"expected {len(columns)} values {columns}, got {row!r}")
+        for i, enum_class in coercers.items():
+            values[i] = _coerce_enum(enum_class, values[i])
+        yield tuple(values)
+
+
+def _copy_sql(conn, table: Table, columns: Sequence[str]) -> str:
+    preparer = conn.dialect.identifier_preparer
+    cols = ", ".join(preparer.quote(col) for col in columns)
+    return f"COPY {preparer.format_table(table)} ({cols}) FROM STDIN"
+
+
+def bulk_load_sync(
+    table: Table,
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    columns: Sequence[str],
+    chunk_size: int = 10_000,
+    engine=None,
+) -> BulkLoadResult:
+    engine = engine or database.sync_engine
+    prepared = _prepare_rows(rows, columns, _enum_coercers(table, columns))
+    total = chunks = 0
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        use_copy = conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg"
+        copy_sql = _copy_sql(conn, table, columns) if use_copy else None
+        with conn.begin():
+            mark_stale_for(conn, table)  # COPY skips the ORM events maintaining aggregates
+        for chunk in _chunked(prepared, chunk_size):
+            with conn.begin():  # every chunk is its own transaction
+                if use_copy:
+                    dbapi_conn = conn.connection.driver_connection  # raw psycopg.Connection
+                    with dbapi_conn.cursor() as cursor:
+                        with cursor.copy(copy_sql) as copy:
+                            for record in chunk:
+                                copy.write_row(record)
+                else:
+                    conn.execute(insert(table).values([dict(zip(columns, r)) for r in chunk]))
+            total += len(chunk)
+            chunks += 1
+    return BulkLoadResult(table.name, total, chunks, time.perf_counter() - start)
+
+
+async def bulk_load_async(
+    table: Table,
+    rows: Iterable[Mapping[str, Any] | Sequence[Any]],
+    columns: Sequence[str],
+    chunk_size: int = 10_000,
+    engine=None,
+) -> BulkLoadResult:
+    engine = engine or database.async_engine
+    prepared = _prepare_rows(rows, columns, _enum_coercers(table, columns))
+    total = chunks = 0
+    start = time.perf_counter()
+    async with engine.connect() as conn:
+        use_copy = conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg"
+        async with conn.begin():
+            await conn.run_sync(mark_stale_for, table)
+        for chunk in _chunked(prepared, chunk_size):
+            if use_copy:
+                raw = await conn.get_raw_connection()
+                # asyncpg runs COPY outside of the sqlalchemy transaction, so it autocommits per chunk
+                await raw.driver_connection.copy_records_to_table(
+                    table.name,
+                    records=chunk,
+                    columns=list(columns),
+                    schema_name=table.schema,
+                )
+            else:
+                async with conn.begin():
+                    await conn.execute(insert(table).values([dict(zip(columns, r)) for r in chunk]))
+            total += len(chunk)
+            chunks += 1
+    return BulkLoadResult(table.name, total, chunks, time.perf_counter() - start)
+########################################3
+
 
 class SyncOrm:
 
     @staticmethod
     def create_tables():
-        sync_engine.echo = False
-        Base.metadata.drop_all(sync_engine)
-        Base.metadata.create_all(sync_engine)
-        sync_engine.echo = True
+        ## wipes every table, only for a scratch database - use migrate() to keep the data
+        database.sync_engine.echo = False
+        Base.metadata.drop_all(database.sync_engine)
+        Base.metadata.create_all(database.sync_engine)
+        database.sync_engine.echo = True
+
+    @staticmethod
+    def migrate(revision: str = "head"):
+        import migrations  # alembic is a third of the import time, only migrations need it
+
+        with database.sync_engine.connect() as conn:
+            migrations.upgrade(revision, connection=conn)
+            conn.commit()
+            print(f"schema at {migrations.current(conn)}")
+
+    @staticmethod
+    def rollback_migration(revision: str = "-1"):
+        import migrations
+
+        with database.sync_engine.connect() as conn:
+            migrations.downgrade(revision, connection=conn)
+            conn.commit()
+            print(f"schema at {migrations.current(conn)}")
+
+    @staticmethod
+    def schema_diff():
+        ## empty when the database matches models.py
+        import migrations
+
+        with database.sync_engine.connect() as conn:
+            diff = migrations.schema_diff(conn)
+        print(diff)
+        return diff
+
+    @staticmethod
+    def cache_stats() -> dict:
+        ## prebuilt statements + sqlalchemy compiled cache + server side prepared statements on both engines
+        return dict(
+            statements=statement_cache.stats(),
+            sync_compiled=sync_compiled_cache.stats(),
+            async_compiled=async_compiled_cache.stats(),
+            second_level=second_level_cache.stats(),
+            # engines not used yet aren't built for this
+            sync_prepared=prepared_metrics(database.sync_engine) if database.is_built("sync_engine") else {},
+            async_prepared=prepared_metrics(database.async_engine) if database.is_built("async_engine") else {},
+        )
 
     @staticmethod
     def toggle_echo():
-        sync_engine.echo = not sync_engine.echo
-        print(f"{sync_engine.echo=}")
+        database.sync_engine.echo = not database.sync_engine.echo
+        print(f"{database.sync_engine.echo=}")
 
     @staticmethod
     def insert_data():
         worker_michel = WorkerOrm(username="Michel")
         worker_john = WorkerOrm(username="John")
-        with session_factory() as session:
+        with database.write_session_factory() as session:
             # session.add(worker_michel)
             # session.add(worker_john)
             session.add_all([worker_michel, worker_john])
             session.commit()
+        print([report.report() for report in flush_reports(session)])
 
     @staticmethod
     def insert_resumes():
-        with session_factory() as session:
+        ## one INSERT ... RETURNING id a DB_WRITE_BATCH_SIZE resumes, summary deltas in one statement
+        with database.write_session_factory() as session:
             orm_resumes = [ResumeOrm(**item) for item in resumes]
             session.add_all([*orm_resumes])
             session.commit()
+        print([report.report() for report in flush_reports(session)])
+
+    @staticmethod
+    def copy_workers(
+        rows: Iterable[Mapping[str, Any] | Sequence[Any]] = additional_workers,
+        chunk_size: int = 10_000,
+    ) -> BulkLoadResult:
+        ## rows are dicts or tuples in WORKER_COPY_COLUMNS order
+        result = bulk_load_sync(WorkerOrm.__table__, rows, WORKER_COPY_COLUMNS, chunk_size)
+        print(result)
+        return result
+
+    @staticmethod
+    def copy_resumes(
+        rows: Iterable[Mapping[str, Any] | Sequence[Any]] = resumes,
+        chunk_size: int = 10_000,
+    ) -> BulkLoadResult:
+        ## rows are dicts or tuples in RESUME_COPY_COLUMNS order, workload can be Workload or its name
+        result = bulk_load_sync(ResumeOrm.__table__, rows, RESUME_COPY_COLUMNS, chunk_size)
+        print(result)
+        return result
 
     @staticmethod
     def select_workers():
-        with session_factory() as session:
+        with database.session_factory() as session:
             # worker_id = 1
             # worker_bober = session.get(WorkerOrm, worker_id) # (WorkerOrm, {"id": worker_id}) # returns only one record
             query = select(WorkerOrm)
@@ -47,10 +295,70 @@ class SyncOrm:
             workers = result.scalars().all()
             print(f"{workers=}")
 
+    @staticmethod
+    def select_resumes_frozen(min_compensation: int = 0) -> list:
+        ## read only namedtuples, no identity map or instrumentation, see queries/frozen.py
+        query = select_frozen(ResumeOrm).filter(ResumeOrm.compensation >= min_compensation)
+        with database.session_factory() as session:
+            resumes = fetch_frozen(session, ResumeOrm, query)
+        print(f"{resumes=}")
+        return resumes
+
+    @staticmethod
+    def stream_workers(batch_size: int = 1000) -> Iterator[list[WorkerOrm]]:
+        ## bounded memory variant of select_workers, yields lists of batch_size workers with resumes
+        query = select(WorkerOrm).order_by(WorkerOrm.id)
+        with database.session_factory() as session:
+            yield from stream_batches(session, query, batch_size, load=[selectinload(WorkerOrm.resumes)])
+
+    @staticmethod
+    def stream_resumes(batch_size: int = 1000) -> Iterator[list[ResumeOrm]]:
+        ## bounded memory variant of select_resume_with_all_relationship
+        query = (
+            select(ResumeOrm)
+            .options(joinedload(ResumeOrm.worker))  # many to one, safe to join while streaming
+            .order_by(ResumeOrm.id)
+        )
+        with database.session_factory() as session:
+            # one IN query per batch
+            yield from stream_batches(session, query, batch_size, load=[selectinload(ResumeOrm.vacancies_replied)])
+
+    @staticmethod
+    def select_workers_with_resumes_dto():
+        ## columns straight into WorkersRelDTO, no ORM objects are built, see queries/dto.py
+        with database.session_factory() as session:
+            result = select_workers_rel_dto(session)
+        print(result)
+        return result
+
+    @staticmethod
+    def select_resumes_with_worker_dto():
+        with database.session_factory() as session:
+            result = select_resumes_rel_dto(session)
+        print(result)
+        return result
+
+    @staticmethod
+    def select_workers_page(limit: int = 50, cursor: str | None = None) -> Page:
+        with database.session_factory() as session:
+            page = paginate(session, WorkerOrm, "id", limit, cursor, with_total=True)
+        print(page)
+        return page
+
+    @staticmethod
+    def select_resumes_page(
+        order: str = "id", limit: int = 50, cursor: str | None = None
+    ) -> Page:
+        ## order - "id", "compensation" or "created_at", pass page.next_cursor / page.prev_cursor to move
+        with database.session_factory() as session:
+            page = paginate(session, ResumeOrm, order, limit, cursor, with_total=True)
+        print(page)
+        return page
+
     @staticmethod
     def update_worker(worker_id: int = 1, new_username: str = "Michanya"):
-        with session_factory() as session:
-            worker_michel = session.get(WorkerOrm, worker_id)
+        with database.session_factory() as session:
+            worker_michel = second_level_cache.get(session, WorkerOrm, worker_id)
             worker_michel.username = new_username
             session.flush()  # to send records to database without commit!
             # session.expire(worker_michel) # to rollback all changes for one object
@@ -59,43 +367,120 @@ class SyncOrm:
             session.commit()  # commit will close transaction
 
     @staticmethod
-    def select_avg_compensation_for_workload(like_language: str = "Python"):
+    def select_avg_compensation_for_workload(
+        like_language: str = "Python",
+        min_compensation: int = 40000,
+        min_avg_compensation: int = 70000,
+    ):
         """
         SELECT workload, AVG(compensation)::int as avg_compensation FROM resumes # ::int - type casting to int from float
         WHERE title LIKE %python% and compensation > 40000
         GROUP BY workload
         """
-        query = (
-            select(
-                ResumeOrm.workload,
-                cast(func.avg(ResumeOrm.compensation), Integer).label(
-                    "avg_compensation"
-                ),
-            )
-            .select_from(ResumeOrm)
-            .filter(
-                and_(
-                    ResumeOrm.title.icontains(like_language),
-                    ResumeOrm.compensation >= 40000,
-                )
-            )
-            .group_by(ResumeOrm.workload)
-            .having(cast(func.avg(ResumeOrm.compensation), Integer) > 70000)
-        )
+        ## statement is built once with bindparam() placeholders, see queries/statements.py
+        query = statement_cache.get(build_avg_compensation_for_workload)
         # print(query.compile(compile_kwargs={"literal_binds": True}))
-        with session_factory() as session:
-            result = session.execute(query)
-            result = result.all()
+        params = dict(
+            like_language=like_language,
+            min_compensation=min_compensation,
+            min_avg_compensation=min_avg_compensation,
+        )
+        with database.routing_session_factory() as session:  # read only, goes to a replica when there are any
+            ## from resumes_compensation_summary when it's fresh, see queries/aggregates.py
+            result = select_avg_compensation(session, query, params)
             print(result)
 
+    @staticmethod
+    def refresh_compensation_summary():
+        with database.sync_engine.begin() as conn:
+            refresh_compensation_summary(conn)
+
+    @staticmethod
+    def select_avg_compensation_for_languages(
+        languages: Sequence[str] = ("Python", "Data", "Machine Learning"),
+        concurrency: int | None = None,
+        timeout: float | None = 10,
+    ):
+        ## same report for several languages at once, one pooled connection per query
+        query = statement_cache.get(build_avg_compensation_for_workload)
+
+        def report(params):
+            return lambda session: select_avg_compensation(session, query, params)
+
+        results = ThreadPoolQueryExecutor(
+            database.routing_session_factory, concurrency=concurrency, timeout=timeout
+        ).run(
+            {
+                language: ReadQuery(
+                    report(dict(like_language=language, min_compensation=40000, min_avg_compensation=70000))
+                )
+                for language in languages
+            }
+        )
+        for language, result in results.items():
+            print(language, result.value if result.ok else result.error)
+        return results
+
+    @staticmethod
+    def search_resumes(q: str = "python", mode: str = AUTO, limit: int = 20):
+        ## mode - prefix, trigram, fuzzy, fulltext or auto, see queries/search.py
+        with database.routing_session_factory() as session:
+            result = session.execute(search_query(ResumeOrm, q, mode, limit)).all()
+        for resume, rank in result:
+            print(f"{rank:.3f}", resume)
+        return result
+
+    @staticmethod
+    def search_vacancies(q: str = "python", mode: str = AUTO, limit: int = 20):
+        with database.routing_session_factory() as session:
+            result = session.execute(search_query(VacancyOrm, q, mode, limit)).all()
+        for vacancy, rank in result:
+            print(f"{rank:.3f}", vacancy)
+        return result
+
+    @staticmethod
+    def explain_title_search(q: str = "python", mode: str = "trigram") -> bool:
+        ## checks that the search is served by the title GIN index instead of a seq scan
+        index_name = "resumes_title_tsv_index" if mode == "fulltext" else "resumes_title_trgm_index"
+        with database.session_factory() as session:
+            plan = explain(session, search_query(ResumeOrm, q, mode), force_index=True)
+            session.rollback()
+        print(*plan, sep="\n")
+        return uses_index(plan, index_name)
+
+    @staticmethod
+    def explain_resumes_partitions(since: datetime | None = None) -> set[str]:
+        ## with DB_PARTITION_RESUMES only partitions from `since` on show up in the plan
+        since = since or datetime.combine(current_month(), datetime.min.time())
+        query = (
+            select(ResumeOrm)
+            .filter(ResumeOrm.created_at >= since, ResumeOrm.compensation > 40000)
+            .order_by(ResumeOrm.created_at.desc())
+        )
+        with database.session_factory() as session:
+            plan = explain(session, query)
+        print(*plan, sep="\n")
+        scanned = scanned_partitions(plan)
+        print(f"{scanned=}")
+        return scanned
+
+    @staticmethod
+    def check_query_plans(update: bool = False) -> list[str]:
+        ## EXPLAINs the report queries against queries/plan_baseline.json, update rewrites it
+        with database.session_factory() as session:
+            report = check_plans(session, update=update)
+        for name, entry in report["queries"].items():
+            print(name, entry["total_cost"], entry["seq_scans"], entry.get("problems", []))
+        return report["failed"]
+
     @staticmethod
     def insert_additional_workers_with_resumes():
-        with session_factory() as session:
-            insert_workers = insert(WorkerOrm).values(additional_workers)
-            insert_resumes = insert(ResumeOrm).values(additional_resumes)
-            session.execute(insert_workers)
-            session.execute(insert_resumes)
+        ## safe to re-run: workers upserted by username, resumes by (worker_id, title)
+        ## (only the missing ones inserted on a partitioned resumes, see queries/upsert.py)
+        with database.session_factory() as session:
+            result = upsert_workers_with_resumes(session, additional_workers, additional_resumes)
             session.commit()
+        print(result)
         print("addition insertion ended")
 
     @staticmethod
@@ -113,43 +498,26 @@ class SyncOrm:
         SELECT * FROM helper2
         ORDER BY avg_diff DESC
         """
-        r = aliased(ResumeOrm)
-        w = aliased(WorkerOrm)
-        subq = (
-            select(
-                r,
-                w,
-                func.avg(r.compensation)
-                .over(partition_by=r.workload)
-                .cast(Integer)
-                .label("avg_workload_compensation"),
-            )
-            # .select_from(r) # not working here!!!
-            .join(
-                r, r.worker_id == w.id
-            ).subquery(  # on_default - INNER JOIN, full=True - FULL JOIN, isouter = True - LEFT JOIN, RIGHT JOIN - not implemented
-                "helper1"
-            )
-        )
-        cte = select(
-            subq.c.worker_id,
-            subq.c.username,
-            subq.c.compensation,
-            subq.c.workload,
-            subq.c.avg_workload_compensation,
-            (subq.c.compensation - subq.c.avg_workload_compensation).label("avg_diff"),
-        ).cte("helper2")
-        query = select(cte).order_by(cte.c.avg_diff.desc())
+        query = statement_cache.get(build_cte_subquery_window_func)
         # print(query.compile(dialect=sqlalchemy.dialects.mysql.dialect()))
-        with session_factory() as session:
+        with database.routing_session_factory() as session:
             result = session.execute(query)
             result = result.all()
         print(*result, sep="\n")
 
+    @staticmethod
+    def compensation_stats_columnar():
+        ## same numbers as join_cte_subquery_window_func without a Row per resume, needs pyarrow and numpy
+        with database.routing_session_factory() as session:
+            table = to_arrow(session, compensation_query())
+        stats = compensation_stats(table)
+        print(stats)
+        return stats
+
     @staticmethod
     def select_workers_with_lazy_relationship():  # lazyload - not good for all relations
         query = select(WorkerOrm)
-        with session_factory() as session:
+        with database.session_factory() as session:
             res = session.execute(query)
             result = res.scalars().all()  # UNIQUE
             resume1 = result[0].resumes
@@ -162,7 +530,7 @@ class SyncOrm:
         query = select(WorkerOrm).options(
             joinedload(WorkerOrm.resumes)
         )  ## too match same data in traffic
-        with session_factory() as session:
+        with database.session_factory() as session:
             res = session.execute(query)
             result = res.unique().scalars().all()
             resume1 = result[0].resumes
@@ -175,7 +543,7 @@ class SyncOrm:
         query = select(WorkerOrm).options(
             selectinload(WorkerOrm.resumes)
         )  ## it's like prefetch_related, make 2 requests first to mother entities and seconde filtered by first ids
-        with session_factory() as session:  ## careful to data traffic between db and app
+        with database.session_factory() as session:  ## careful to data traffic between db and app
             res = session.execute(query)
             result = res.unique().scalars().all()
             resume1 = result[0].resumes
@@ -186,7 +554,7 @@ class SyncOrm:
     @staticmethod
     def select_workers_with_condition_relationship():
         query = select(WorkerOrm).options(selectinload(WorkerOrm.resumes_parttime))
-        with session_factory() as session:
+        with database.session_factory() as session:
             res = session.execute(query)
             result = res.scalars().all()
         for worker in result:
@@ -205,7 +573,7 @@ class SyncOrm:
                 contains_eager(WorkerOrm.resumes)
             )  # contains eager convert table to included objects, using already existing joins!
         )
-        with session_factory() as session:
+        with database.session_factory() as session:
             res = session.execute(query)
             result = res.unique().scalars().all()
         for worker in result:
@@ -214,24 +582,11 @@ class SyncOrm:
                 print("\t", resume)
 
     @staticmethod
-    def select_workers_and_resumes_with_limit():
-        subq = (
-            select(ResumeOrm.id.label("parttime_resume_id"))
-            .filter(ResumeOrm.worker_id == WorkerOrm.id)
-            .order_by(WorkerOrm.id.desc(), ResumeOrm.compensation.desc())
-            .limit(3)
-            .scalar_subquery()  # because it's only one item in request not [(id), (id)] but [id, id]
-            .correlate(WorkerOrm)
-        )
+    def select_workers_and_resumes_with_limit(resumes_limit: int = 3):
+        query = statement_cache.get(build_workers_and_resumes_with_limit)
 
-        query = (
-            select(WorkerOrm)
-            .join(ResumeOrm, ResumeOrm.id.in_(subq))
-            .options(contains_eager(WorkerOrm.resumes))
-        )
-
-        with session_factory() as session:
-            res = session.execute(query)
+        with database.session_factory() as session:
+            res = session.execute(query, dict(resumes_limit=resumes_limit))
             result = res.unique().scalars().all()
 
         for worker in result:
@@ -241,16 +596,30 @@ class SyncOrm:
 
     @staticmethod
     def add_vacancies_and_replies():
-        with session_factory() as session:
+        with database.session_factory() as session:
             new_vacancy = VacancyOrm(
                 title="junior Python Developer", compensation=100000
             )
-            resume_1 = session.get(ResumeOrm, 1)
-            resume_2 = session.get(ResumeOrm, 2)
-            resume_1.vacancies_replied.append(new_vacancy)
-            resume_2.vacancies_replied.append(new_vacancy)
+            session.add(new_vacancy)
+            session.flush()
+            ## no resumes loaded, replies go in with one INSERT ... ON CONFLICT
+            add_replies(
+                session,
+                [
+                    (1, new_vacancy.id, "Hello, I am interested in this vacancy"),
+                    (2, new_vacancy.id, "Python is my favourite language"),
+                ],
+            )
             session.commit()
 
+    @staticmethod
+    def add_replies(replies: Iterable[Reply], on_conflict: str = NOTHING) -> ReplyBulkResult:
+        with database.session_factory() as session:
+            result = add_replies(session, replies, on_conflict)
+            session.commit()
+        print(result)
+        return result
+
     @staticmethod
     def select_resume_with_all_relationship():
         query = (
@@ -259,7 +628,7 @@ class SyncOrm:
             .options(selectinload(ResumeOrm.vacancies_replied))
             # .options(selectinload(ResumeOrm.vacancies_replied).load_only(<fields_names>))
         )
-        with session_factory() as session:
+        with database.session_factory() as session:
             res = session.execute(query)
             result_orm = res.unique().scalars().all()
         print(result_orm)
@@ -271,45 +640,162 @@ class AsyncOrm:
     # Асинхронный вариант, не показанный в видео
     @staticmethod
     async def create_tables():
-        async with async_engine.begin() as conn:
+        async with database.async_engine.begin() as conn:
             await conn.run_sync(Base.metadata.drop_all)
             await conn.run_sync(Base.metadata.create_all)
 
+    @staticmethod
+    async def migrate(revision: str = "head"):
+        # alembic is sync, it runs on the sync facade of the asyncpg connection
+        import migrations
+
+        async with database.async_engine.connect() as conn:
+            await conn.run_sync(lambda sync_conn: migrations.upgrade(revision, connection=sync_conn))
+            await conn.commit()
+            print(f"schema at {await conn.run_sync(migrations.current)}")
+
     @staticmethod
     async def insert_workers():
-        async with async_session_factory() as session:
+        async with database.async_write_session_factory() as session:
             worker_jack = WorkerOrm(username="Jack")
             worker_michael = WorkerOrm(username="Michael")
             session.add_all([worker_jack, worker_michael])
             # flush взаимодействует с БД, поэтому пишем await
             await session.flush()
             await session.commit()
+        print([report.report() for report in flush_reports(session)])
 
     @staticmethod
     async def select_workers():
-        async with async_session_factory() as session:
+        async with database.async_session_factory() as session:
             query = select(WorkerOrm)
             result = await session.execute(query)
             workers = result.scalars().all()
             print(f"{workers=}")
 
+    @staticmethod
+    async def select_workers_with_awaited_resumes():
+        ## worker.resumes raises here (raise_on_sql), awaited loads of one tick share one IN query
+        async with database.async_session_factory() as session:
+            workers = (await session.scalars(select(WorkerOrm))).all()
+            resumes = await asyncio.gather(*(w.awaitable_attrs.resumes for w in workers))
+        for worker, worker_resumes in zip(workers, resumes):
+            print(worker, worker_resumes)
+
+    @staticmethod
+    async def select_resumes_frozen(min_compensation: int = 0) -> list:
+        query = select_frozen(ResumeOrm).filter(ResumeOrm.compensation >= min_compensation)
+        async with database.async_session_factory() as session:
+            resumes = await fetch_frozen_async(session, ResumeOrm, query)
+        print(f"{resumes=}")
+        return resumes
+
+    @staticmethod
+    async def stream_workers(batch_size: int = 1000) -> AsyncIterator[list[WorkerOrm]]:
+        query = select(WorkerOrm).order_by(WorkerOrm.id)
+        async with database.async_session_factory() as session:
+            async for batch in stream_batches_async(
+                session, query, batch_size, load=[selectinload(WorkerOrm.resumes)]
+            ):
+                yield batch
+
+    @staticmethod
+    async def stream_resumes(batch_size: int = 1000) -> AsyncIterator[list[ResumeOrm]]:
+        query = (
+            select(ResumeOrm)
+            .options(joinedload(ResumeOrm.worker))
+            .order_by(ResumeOrm.id)
+        )
+        async with database.async_session_factory() as session:
+            async for batch in stream_batches_async(
+                session, query, batch_size, load=[selectinload(ResumeOrm.vacancies_replied)]
+            ):
+                yield batch
+
+    @staticmethod
+    async def select_workers_with_resumes_dto():
+        async with database.async_session_factory() as session:
+            result = await select_workers_rel_dto_async(session)
+        print(result)
+        return result
+
+    @staticmethod
+    async def select_resumes_with_worker_dto():
+        async with database.async_session_factory() as session:
+            result = await select_resumes_rel_dto_async(session)
+        print(result)
+        return result
+
+    @staticmethod
+    async def select_workers_page(limit: int = 50, cursor: str | None = None) -> Page:
+        async with database.async_session_factory() as session:
+            page = await paginate_async(session, WorkerOrm, "id", limit, cursor, with_total=True)
+        print(page)
+        return page
+
+    @staticmethod
+    async def select_resumes_page(
+        order: str = "id", limit: int = 50, cursor: str | None = None
+    ) -> Page:
+        async with database.async_session_factory() as session:
+            page = await paginate_async(session, ResumeOrm, order, limit, cursor, with_total=True)
+        print(page)
+        return page
+
     @staticmethod
     async def update_worker(worker_id: int = 2, new_username: str = "Misha"):
-        async with async_session_factory() as session:
-            worker_michael = await session.get(WorkerOrm, worker_id)
+        async with database.async_session_factory() as session:
+            worker_michael = await second_level_cache.get_async(session, WorkerOrm, worker_id)
             worker_michael.username = new_username
-            await session.refresh(worker_michael)
+            # no refresh() here: it reloads the row and drops the new username before the flush
             await session.commit()
 
     @staticmethod
     async def insert_resumes():
-        async with async_session_factory() as session:
+        async with database.async_session_factory() as session:
             orm_resumes = [ResumeOrm(**item) for item in resumes]
             session.add_all([*orm_resumes])
             await session.commit()
 
     @staticmethod
-    async def select_resumes_avg_compensation(like_language: str = "Python"):
+    async def insert_additional_workers_with_resumes():
+        async with database.async_session_factory() as session:
+            result = await upsert_workers_with_resumes_async(session, additional_workers, additional_resumes)
+            await session.commit()
+        print(result)
+
+    @staticmethod
+    async def add_replies(replies: Iterable[Reply], on_conflict: str = NOTHING) -> ReplyBulkResult:
+        async with database.async_session_factory() as session:
+            result = await add_replies_async(session, replies, on_conflict)
+            await session.commit()
+        print(result)
+        return result
+
+    @staticmethod
+    async def copy_workers(
+        rows: Iterable[Mapping[str, Any] | Sequence[Any]] = additional_workers,
+        chunk_size: int = 10_000,
+    ) -> BulkLoadResult:
+        result = await bulk_load_async(WorkerOrm.__table__, rows, WORKER_COPY_COLUMNS, chunk_size)
+        print(result)
+        return result
+
+    @staticmethod
+    async def copy_resumes(
+        rows: Iterable[Mapping[str, Any] | Sequence[Any]] = resumes,
+        chunk_size: int = 10_000,
+    ) -> BulkLoadResult:
+        result = await bulk_load_async(ResumeOrm.__table__, rows, RESUME_COPY_COLUMNS, chunk_size)
+        print(result)
+        return result
+
+    @staticmethod
+    async def select_resumes_avg_compensation(
+        like_language: str = "Python",
+        min_compensation: int = 40000,
+        min_avg_compensation: int = 70000,
+    ):
         """
         select workload, avg(compensation)::int as avg_compensation
         from resumes
@@ -317,28 +803,89 @@ class AsyncOrm:
         group by workload
         having avg(compensation) > 70000
         """
-        async with async_session_factory() as session:
-            query = (
-                select(
-                    ResumeOrm.workload,
-                    # 1 вариант использования cast
-                    # cast(func.avg(ResumeOrm.compensation), Integer).label("avg_compensation"),
-                    # 2 вариант использования cast (предпочтительный способ)
-                    func.avg(ResumeOrm.compensation)
-                    .cast(Integer)
-                    .label("avg_compensation"),
-                )
-                .select_from(ResumeOrm)
-                .filter(
-                    and_(
-                        ResumeOrm.title.contains(like_language),
-                        ResumeOrm.compensation > 40000,
-                    )
-                )
-                .group_by(ResumeOrm.workload)
-                .having(func.avg(ResumeOrm.compensation) > 70000)
+        async with database.async_routing_session_factory() as session:
+            query = statement_cache.get(build_resumes_avg_compensation)
+            # print(query.compile(compile_kwargs={"literal_binds": True}))
+            res = await session.execute(
+                query,
+                dict(
+                    like_language=like_language,
+                    min_compensation=min_compensation,
+                    min_avg_compensation=min_avg_compensation,
+                ),
             )
-            print(query.compile(compile_kwargs={"literal_binds": True}))
-            res = await session.execute(query)
             result = res.all()
             print(result[0].avg_compensation)
+
+    @staticmethod
+    async def compensation_stats_columnar():
+        async with database.async_routing_session_factory() as session:
+            table = await to_arrow_async(session, compensation_query())
+        stats = compensation_stats(table)
+        print(stats)
+        return stats
+
+    @staticmethod
+    async def select_avg_compensation_for_workload(
+        like_language: str = "Python",
+        min_compensation: int = 40000,
+        min_avg_compensation: int = 70000,
+    ):
+        ## same semantics as SyncOrm one (icontains, >=), served from the summary when fresh
+        query = statement_cache.get(build_avg_compensation_for_workload)
+        params = dict(
+            like_language=like_language,
+            min_compensation=min_compensation,
+            min_avg_compensation=min_avg_compensation,
+        )
+        async with database.async_routing_session_factory() as session:
+            result = await select_avg_compensation_async(session, query, params)
+        print(result)
+        return result
+
+    @staticmethod
+    async def refresh_compensation_summary():
+        async with database.async_engine.begin() as conn:
+            await conn.run_sync(refresh_compensation_summary)
+
+    @staticmethod
+    async def search_resumes(q: str = "python", mode: str = AUTO, limit: int = 20):
+        async with database.async_routing_session_factory() as session:
+            result = (await session.execute(search_query(ResumeOrm, q, mode, limit))).all()
+        for resume, rank in result:
+            print(f"{rank:.3f}", resume)
+        return result
+
+    @staticmethod
+    async def search_vacancies(q: str = "python", mode: str = AUTO, limit: int = 20):
+        async with database.async_routing_session_factory() as session:
+            result = (await session.execute(search_query(VacancyOrm, q, mode, limit))).all()
+        for vacancy, rank in result:
+            print(f"{rank:.3f}", vacancy)
+        return result
+
+    @staticmethod
+    async def select_avg_compensation_for_languages(
+        languages: Sequence[str] = ("Python", "Data", "Machine Learning"),
+        concurrency: int | None = None,
+        timeout: float | None = 10,
+    ):
+        query = statement_cache.get(build_resumes_avg_compensation)
+        results = await AsyncQueryExecutor(
+            database.async_routing_session_factory, concurrency=concurrency, timeout=timeout
+        ).run(
+            {
+                language: ReadQuery(
+                    query,
+                    dict(like_language=language, min_compensation=40000, min_avg_compensation=70000),
+                )
+                for language in languages
+            }
+        )
+        for language, result in results.items():
+            print(language, result.value if result.ok else result.error)
+        return results
+
+    @staticmethod
+    def cache_stats() -> dict:
+        return SyncOrm.cache_stats()
@@ -0,0 +1,200 @@
+"""
+Keyset (seek) pagination.
+
+    page = paginate(session, ResumeOrm, order="compensation", limit=50)
+    page = paginate(session, ResumeOrm, order="compensation", cursor=page.next_cursor)
+
+Pages are found with WHERE (compensation, id) > (:last_compensation, :last_id)
+instead of OFFSET, so every page costs the same index range scan no matter
+how deep it is. Cursors are opaque url-safe tokens carrying the order and
+the key values of the row they point from.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Select, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import ResumeOrm, WorkerOrm
+
+## model -> order name -> key columns, the last column must be unique
+ORDERINGS = {
+    WorkerOrm: {
+        "id": ("id",),
+    },
+    ResumeOrm: {
+        "id": ("id",),
+        "compensation": ("compensation", "id"),  # rows with NULL compensation are not paged
+        "created_at": ("created_at", "id"),
+    },
+}
+
+FORWARD = "after"
+BACKWARD = "before"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+    estimated_total: int | None = None
+    order: str = "id"
+    limit: int = 50
+
+
+def _key_columns(model, order: str):
+    try:
+        names = ORDERINGS[model][order]
+    except KeyError:
+        raise ValueError(f"{model.__name__} can't be paged by {order!r}") from None
+    return [getattr(model, name) for name in names]
+
+
+def encode_cursor(order: str, direction: str, values) -> str:
+    payload = dict(
+        o=order,
+        d=direction,
+        v=[v.isoformat() if isinstance(v, datetime) else v for v in values],
+    )
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order: str, columns) -> tuple[str, list[Any]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction, values = payload["d"], payload["v"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("malformed cursor") from e
+    if payload.get("o") != order:
+        raise InvalidCursor(f"cursor was issued for order {payload.get('o')!r}, not {order!r}")
+    if direction not in (FORWARD, BACKWARD) or len(values) != len(columns):
+        raise InvalidCursor("malformed cursor")
+    values = [
+        datetime.fromisoformat(v) if col.type.python_type is datetime and v is not None else v
+        for col, v in zip(columns, values)
+    ]
+    return direction, values
+
+
+def build_page_query(
+    model,
+    order: str = "id",
+    limit: int = 50,
+    cursor: str | None = None,
+    query: Select | None = None,
+) -> tuple[Select, str]:
+    ## query can carry filters and loader options, e.g. select(WorkerOrm).options(selectinload(...))
+    columns = _key_columns(model, order)
+    query = select(model) if query is None else query
+    direction = FORWARD
+    if len(columns) > 1:
+        query = query.filter(*(col.is_not(None) for col in columns[:-1]))
+    if cursor is not None:
+        direction, values = decode_cursor(cursor, order, columns)
+        key, bound = tuple_(*columns), tuple_(*values)
+        query = query.filter(key > bound if direction == FORWARD else key < bound)
+    if direction == FORWARD:
+        query = query.order_by(*columns)
+    else:
+        query = query.order_by(*(col.desc() for col in columns))
+    # one extra row tells whether there is a page after this one
+    return query.limit(limit + 1), direction
+
+
+def _make_page(items: list, model, order: str, limit: int, cursor, direction: str) -> Page:
+    names = ORDERINGS[model][order]
+    has_more = len(items) > limit
+    items = items[:limit]
+    if direction == BACKWARD:
+        items.reverse()
+
+    def key(item):
+        return [getattr(item, name) for name in names]
+
+    next_cursor = prev_cursor = None
+    if items:
+        if (direction == FORWARD and has_more) or direction == BACKWARD:
+            next_cursor = encode_cursor(order, FORWARD, key(items[-1]))
+        if (direction == BACKWARD and has_more) or (direction == FORWARD and cursor is not None):
+            prev_cursor = encode_cursor(order, BACKWARD, key(items[0]))
+    return Page(items, next_cursor, prev_cursor, order=order, limit=limit)
+
+
+########################################3
+# ROW COUNT ESTIMATE
+# planner statistics instead of COUNT(*), refreshed by autovacuum/ANALYZE
+
+## a partitioned table has no rows of its own, its partitions are summed (see partitions.py)
+_RELTUPLES = text(
+    "SELECT CASE WHEN max(reltuples) < 0 THEN -1 ELSE sum(greatest(reltuples, 0)) END::bigint FROM pg_class "
+    "WHERE (oid = to_regclass(:table_name) AND relkind = 'r') "
+    "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:table_name))"
+)
+
+
+def _reltuples_result(value) -> int | None:
+    # -1 means the table was never vacuumed or analyzed
+    return int(value) if value is not None and value >= 0 else None
+
+
+def estimate_count(session: Session, model) -> int | None:
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    value = session.execute(_RELTUPLES, dict(table_name=model.__tablename__)).scalar()
+    return _reltuples_result(value)
+
+
+async def estimate_count_async(session: AsyncSession, model) -> int | None:
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    value = (await session.execute(_RELTUPLES, dict(table_name=model.__tablename__))).scalar()
+    return _reltuples_result(value)
+
+
+########################################3
+
+
+def paginate(
+    session: Session,
+    model,
+    order: str = "id",
+    limit: int = 50,
+    cursor: str | None = None,
+    query: Select | None = None,
+    with_total: bool = False,
+) -> Page:
+    stmt, direction = build_page_query(model, order, limit, cursor, query)
+    items = list(session.execute(stmt).unique().scalars())
+    page = _make_page(items, model, order, limit, cursor, direction)
+    if with_total:
+        page.estimated_total = estimate_count(session, model)
+    return page
+
+
+async def paginate_async(
+    session: AsyncSession,
+    model,
+    order: str = "id",
+    limit: int = 50,
+    cursor: str | None = None,
+    query: Select | None = None,
+    with_total: bool = False,
+) -> Page:
+    stmt, direction = build_page_query(model, order, limit, cursor, query)
+    items = list((await session.execute(stmt)).unique().scalars())
+    page = _make_page(items, model, order, limit, cursor, direction)
+    if with_total:
+        page.estimated_total = await estimate_count_async(session, model)
+    return page
@@ -0,0 +1,296 @@
+"""
+Query plans of the report queries and a guard against plan regressions.
+
+    python -m queries.generator --resumes 1000000 --recreate  # seed a local postgres first
+    python -m queries.plans --update   # EXPLAIN every registered query, write the baseline
+    python -m queries.plans            # compare with the baseline, exit 1 on a regression
+
+No baseline is shipped, plans depend on the data and the server: generate it
+with --update on the documented seed before the first check and commit
+queries/plan_baseline.json.
+
+Every query SyncOrm/AsyncOrm sends for reports, pages and searches is
+registered here with @planned and its parameters. A check runs
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) on each in a rolled back transaction
+and fails when
+  - the query has no baseline yet (a new @planned query, no baseline file)
+  - a relation is read by a Seq Scan that the baseline plan didn't seq scan
+  - the plan's total cost grew past the baseline's by more than cost_threshold
+Timings are reported per node (self time without the children, loops
+included) but never fail a check, they are too noisy for that. Partitions
+count as their parent table, so the monthly ones don't change the plan shape.
+Plans are the server's, the same for both engines: they are taken on psycopg.
+"""
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import Executable, select
+
+from models import ResumeOrm
+from partitions import current_month, parent_table
+
+from .aggregates import SUMMARY_MIN_COMPENSATION, summary_query
+from .columnar import compensation_query
+from .pagination import build_page_query
+from .search import FULLTEXT, TRIGRAM, run_explain, search_query
+from .statements import (
+    build_avg_compensation_for_workload,
+    build_cte_subquery_window_func,
+    build_resumes_avg_compensation,
+    build_workers_and_resumes_with_limit,
+    statement_cache,
+)
+
+BASELINE_PATH = Path(__file__).with_name("plan_baseline.json")
+COST_THRESHOLD = 0.5  # +50% of the baseline's total cost is a regression
+REPORT_PARAMS = dict(like_language="Python", min_compensation=SUMMARY_MIN_COMPENSATION, min_avg_compensation=70_000)
+
+
+@dataclass(frozen=True)
+class PlannedQuery:
+    name: str
+    build: Callable[[], Executable]
+    params: dict = field(default_factory=dict)
+
+
+PLANNED_QUERIES: dict[str, PlannedQuery] = {}
+
+
+def planned(**params):
+    ## registers a function building the statement, params are bound when it's explained
+    def register(build):
+        PLANNED_QUERIES[build.__name__] = PlannedQuery(build.__name__, build, params)
+        return build
+
+    return register
+
+
+########################################3
+# REGISTERED QUERIES
+
+
+@planned(**REPORT_PARAMS)
+def avg_compensation_for_workload():
+    return statement_cache.get(build_avg_compensation_for_workload)
+
+
+@planned(**REPORT_PARAMS)
+def resumes_avg_compensation():
+    return statement_cache.get(build_resumes_avg_compensation)
+
+
+@planned()
+def cte_subquery_window_func():
+    return statement_cache.get(build_cte_subquery_window_func)
+
+
+@planned(resumes_limit=3)
+def workers_and_resumes_with_limit():
+    return statement_cache.get(build_workers_and_resumes_with_limit)
+
+
+@planned()
+def compensation_summary():
+    return summary_query("python", REPORT_PARAMS["min_avg_compensation"])
+
+
+@planned()
+def compensation_columns():
+    return compensation_query()
+
+
+@planned()
+def resumes_page_by_compensation():
+    return build_page_query(ResumeOrm, "compensation", 50)[0]
+
+
+@planned()
+def resumes_page_by_created_at():
+    return build_page_query(ResumeOrm, "created_at", 50)[0]
+
+
+@planned()
+def search_resumes_trigram():
+    return search_query(ResumeOrm, "python", TRIGRAM)
+
+
+@planned()
+def search_resumes_fulltext():
+    return search_query(ResumeOrm, "python developer", FULLTEXT)
+
+
+@planned()
+def resumes_this_month():
+    since = current_month()
+    return (
+        select(ResumeOrm)
+        .filter(ResumeOrm.created_at >= since, ResumeOrm.compensation > 40000)
+        .order_by(ResumeOrm.created_at.desc())
+    )
+
+
+########################################3
+# PLANS
+
+
+@dataclass
+class PlanSummary:
+    name: str
+    total_cost: float
+    planning_ms: float
+    execution_ms: float
+    seq_scans: list[str]  # relations read by a Seq Scan, partitions as their parent
+    nodes: list[dict]  # slowest first
+    plan: dict = field(repr=False)
+
+    def as_baseline(self) -> dict:
+        return dict(total_cost=self.total_cost, seq_scans=self.seq_scans, plan=self.plan)
+
+
+def explain_json(session, query, params: dict | None = None) -> dict:
+    [value] = run_explain(session, query, "(ANALYZE, BUFFERS, FORMAT JSON)", params)
+    if isinstance(value, str):
+        value = json.loads(value)  # asyncpg doesn't decode json
+    return value[0]
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _walk(child)
+
+
+def _node_ms(node: dict) -> float:
+    return node.get("Actual Total Time", 0.0) * node.get("Actual Loops", 1)
+
+
+def plan_nodes(plan: dict) -> list[dict]:
+    nodes = []
+    for node in _walk(plan["Plan"]):
+        total = _node_ms(node)
+        relation = node.get("Relation Name")
+        nodes.append(
+            dict(
+                node=node["Node Type"],
+                relation=parent_table(relation) if relation else None,
+                index=node.get("Index Name"),
+                loops=node.get("Actual Loops", 1),
+                rows=node.get("Actual Rows", 0) * node.get("Actual Loops", 1),
+                total_ms=round(total, 3),
+                self_ms=round(total - sum(_node_ms(child) for child in node.get("Plans", ())), 3),
+                shared_hit=node.get("Shared Hit Blocks", 0),
+                shared_read=node.get("Shared Read Blocks", 0),
+            )
+        )
+    return sorted(nodes, key=lambda n: -n["self_ms"])
+
+
+def summarize(name: str, plan: dict) -> PlanSummary:
+    nodes = plan_nodes(plan)
+    return PlanSummary(
+        name=name,
+        total_cost=plan["Plan"]["Total Cost"],
+        planning_ms=plan.get("Planning Time", 0.0),
+        execution_ms=plan.get("Execution Time", 0.0),
+        seq_scans=sorted({n["relation"] for n in nodes if n["node"] == "Seq Scan" and n["relation"]}),
+        nodes=nodes,
+        plan=plan,
+    )
+
+
+def capture(session, query: PlannedQuery) -> PlanSummary:
+    ## ANALYZE runs the query, the transaction is rolled back whatever it does
+    try:
+        return summarize(query.name, explain_json(session, query.build(), query.params))
+    finally:
+        session.rollback()
+
+
+def regressions(baseline: dict, current: PlanSummary, cost_threshold: float = COST_THRESHOLD) -> list[str]:
+    problems = [
+        f"seq scan on {relation}, the baseline didn't scan it"
+        for relation in current.seq_scans
+        if relation not in baseline["seq_scans"]
+    ]
+    limit = baseline["total_cost"] * (1 + cost_threshold)
+    if current.total_cost > limit:
+        problems.append(
+            f"total cost {current.total_cost:.0f} > {limit:.0f} (baseline {baseline['total_cost']:.0f} +{cost_threshold:.0%})"
+        )
+    return problems
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def check_plans(
+    session,
+    names: list[str] | None = None,
+    baseline_path: Path = BASELINE_PATH,
+    cost_threshold: float = COST_THRESHOLD,
+    update: bool = False,
+    top_nodes: int = 5,
+) -> dict:
+    """Explain the registered queries, compare them with the baseline (or replace it with update)."""
+    baseline = load_baseline(baseline_path)
+    report = dict(failed=[], queries={})
+    for name in names or list(PLANNED_QUERIES):
+        summary = capture(session, PLANNED_QUERIES[name])
+        entry = dict(
+            total_cost=summary.total_cost,
+            planning_ms=summary.planning_ms,
+            execution_ms=summary.execution_ms,
+            seq_scans=summary.seq_scans,
+            slowest_nodes=summary.nodes[:top_nodes],
+        )
+        if update:
+            baseline[name] = summary.as_baseline()
+        elif name not in baseline:
+            entry["problems"] = ["no baseline, run with update"]
+        else:
+            entry["baseline_cost"] = baseline[name]["total_cost"]
+            entry["problems"] = regressions(baseline[name], summary, cost_threshold)
+        if entry.get("problems"):
+            report["failed"].append(name)
+        report["queries"][name] = entry
+    if update:
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+    return report
+
+
+def main():
+    import config
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default=config.settings.DATABASE_URL_psycopg)
+    parser.add_argument("--queries", nargs="+", choices=list(PLANNED_QUERIES))
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--cost-threshold", type=float, default=COST_THRESHOLD, help="0.5 - +50%%")
+    parser.add_argument("--update", action="store_true", help="write the current plans as the baseline")
+    parser.add_argument("--top-nodes", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if engine.dialect.name != "postgresql":
+        parser.error("plans are postgres EXPLAIN output, --url must be postgresql")
+    try:
+        with Session(engine) as session:
+            report = check_plans(
+                session, args.queries, args.baseline, args.cost_threshold, args.update, args.top_nodes
+            )
+    finally:
+        engine.dispose()
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Bulk ingestion of vacancy replies.
+
+    add_replies(session, [(resume_id, vacancy_id, "cover letter"), ...], on_conflict=UPDATE)
+
+One INSERT ... VALUES (...), (...) ON CONFLICT per batch, neither resumes nor
+vacancies are loaded. The rows bypass the session: vacancies_replied /
+resumes_replied collections already loaded in it don't see them until expired.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from models import VacancyReplyOrm
+from .upsert import dialect_insert
+
+NOTHING = "nothing"  # keep the first cover letter
+UPDATE = "update"  # the latest cover letter wins
+
+REPLY_BATCH_SIZE = 5_000  # 3 bind parameters a row, postgres allows 65535 a statement
+
+replies_table = VacancyReplyOrm.__table__
+
+Reply = tuple[int, int, str]  # resume_id, vacancy_id, cover_letter
+
+
+@dataclass
+class ReplyBulkResult:
+    rows: int  # sent, after dropping duplicates within a batch
+    written: int  # inserted or updated, conflicts skipped by DO NOTHING are not counted
+    batches: int
+    elapsed: float  # seconds
+
+
+def _batches(replies: Iterable[Reply], batch_size: int, on_conflict: str = NOTHING) -> Iterator[list[dict]]:
+    ## ON CONFLICT can't touch one row twice in a statement: the first duplicate of a batch wins
+    ## with NOTHING, the last one with UPDATE, as they would one statement a reply
+    batch: dict[tuple[int, int], dict] = {}
+    for resume_id, vacancy_id, cover_letter in replies:
+        row = dict(resume_id=resume_id, vacancy_id=vacancy_id, cover_letter=cover_letter)
+        if on_conflict == NOTHING:
+            batch.setdefault((resume_id, vacancy_id), row)
+        else:
+            batch[resume_id, vacancy_id] = row
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def replies_insert(dialect_name: str, rows: list[dict], on_conflict: str = NOTHING):
+    if on_conflict not in (NOTHING, UPDATE):
+        raise ValueError(f"unknown on_conflict {on_conflict!r}, expected {NOTHING!r} or {UPDATE!r}")
+    stmt = dialect_insert(dialect_name, replies_table).values(rows)
+    if on_conflict == NOTHING:
+        return stmt.on_conflict_do_nothing(index_elements=[replies_table.c.resume_id, replies_table.c.vacancy_id])
+    return stmt.on_conflict_do_update(
+        index_elements=[replies_table.c.resume_id, replies_table.c.vacancy_id],
+        set_=dict(cover_letter=stmt.excluded.cover_letter),
+    )
+
+
+def add_replies(
+    session,
+    replies: Iterable[Reply],
+    on_conflict: str = NOTHING,
+    batch_size: int = REPLY_BATCH_SIZE,
+) -> ReplyBulkResult:
+    """Write replies in the session's transaction, the caller commits."""
+    start = time.perf_counter()
+    dialect_name = session.get_bind().dialect.name
+    rows = written = batches = 0
+    for batch in _batches(replies, batch_size, on_conflict):
+        result = session.execute(replies_insert(dialect_name, batch, on_conflict))
+        rows += len(batch)
+        written += max(result.rowcount, 0)
+        batches += 1
+    return ReplyBulkResult(rows, written, batches, time.perf_counter() - start)
+
+
+async def add_replies_async(
+    session,
+    replies: Iterable[Reply],
+    on_conflict: str = NOTHING,
+    batch_size: int = REPLY_BATCH_SIZE,
+) -> ReplyBulkResult:
+    start = time.perf_counter()
+    dialect_name = session.get_bind().dialect.name
+    rows = written = batches = 0
+    for batch in _batches(replies, batch_size, on_conflict):
+        result = await session.execute(replies_insert(dialect_name, batch, on_conflict))
+        rows += len(batch)
+        written += max(result.rowcount, 0)
+        batches += 1
+    return ReplyBulkResult(rows, written, batches, time.perf_counter() - start)
@@ -0,0 +1,116 @@
+"""
+Ranked title search for resumes and vacancies.
+
+modes:
+    prefix   - title ILIKE 'q%', shortest titles first
+    trigram  - title ILIKE '%q%' (what icontains() does) ranked by similarity(title, q)
+    fuzzy    - title % q, tolerates typos, ranked by similarity
+    fulltext - to_tsvector('simple', title) @@ websearch_to_tsquery('simple', q), ranked by ts_rank
+    auto     - prefix for 1-2 chars (no trigrams yet), fulltext for several words, trigram otherwise
+
+trigram/fuzzy are served by the *_title_trgm_index GIN index and fulltext by
+*_title_tsv_index, see title_search_indexes() in models.py.
+"""
+
+from sqlalchemy import Select, func, literal, select, text
+from sqlalchemy.orm import Session
+
+from models import ResumeOrm, VacancyOrm
+
+PREFIX = "prefix"
+TRIGRAM = "trigram"
+FUZZY = "fuzzy"
+FULLTEXT = "fulltext"
+AUTO = "auto"
+MODES = (PREFIX, TRIGRAM, FUZZY, FULLTEXT, AUTO)
+
+TS_CONFIG = "simple"  # must match the index expression
+
+
+def choose_mode(q: str) -> str:
+    q = q.strip()
+    if len(q) < 3:
+        return PREFIX
+    if len(q.split()) > 1:
+        return FULLTEXT
+    return TRIGRAM
+
+
+def _tsvector(model):
+    # literal config so the expression matches the index to_tsvector('simple', title)
+    return func.to_tsvector(literal(TS_CONFIG, literal_execute=True), model.title)
+
+
+def search_query(model, q: str, mode: str = AUTO, limit: int = 20) -> Select:
+    if model not in (ResumeOrm, VacancyOrm):
+        raise ValueError(f"{model.__name__} has no title search")
+    if mode not in MODES:
+        raise ValueError(f"unknown search mode {mode!r}, expected one of {MODES}")
+    if mode == AUTO:
+        mode = choose_mode(q)
+    q = q.strip()
+
+    if mode == PREFIX:
+        rank = -func.length(model.title)
+        condition = model.title.istartswith(q, autoescape=True)
+    elif mode == TRIGRAM:
+        rank = func.similarity(model.title, q)
+        condition = model.title.icontains(q, autoescape=True)
+    elif mode == FUZZY:
+        rank = func.similarity(model.title, q)
+        condition = model.title.op("%")(q)
+    else:
+        tsquery = func.websearch_to_tsquery(literal(TS_CONFIG, literal_execute=True), q)
+        rank = func.ts_rank(_tsvector(model), tsquery)
+        condition = _tsvector(model).op("@@")(tsquery)
+
+    return (
+        select(model, rank.label("rank"))
+        .filter(condition)
+        .order_by(rank.desc(), model.id)
+        .limit(limit)
+    )
+
+
+########################################3
+# EXPLAIN
+
+
+def _driver_params(compiled, dialect):
+    ## compiled.params as the driver gets them from execute(): through the bind processors, e.g. enums to names
+    names = {escaped: name for name, escaped in compiled.escaped_bind_names.items()}
+    values = {}
+    for key, value in compiled.params.items():
+        name = names.get(key, key)
+        if name not in compiled.binds:
+            name = name.rpartition("_")[0]  # IN (...) values are <name>_<n>
+        bind = compiled.binds[name]
+        process = bind.type.dialect_impl(dialect).bind_processor(dialect)
+        values[key] = process(value) if process else value
+    if compiled.positional:
+        return tuple(values[key] for key in compiled.positiontup)
+    return values
+
+
+def run_explain(session: Session, query, options: str = "", params: dict | None = None) -> list:
+    ## EXPLAIN [options] of a statement with bound parameters, sent as is by the driver:
+    ## literal_binds in a text() would double the % of LIKE patterns and the % operator, and read :word as a bind
+    if params:
+        query = query.params(**params)
+    conn = session.connection(bind_arguments=dict(clause=query))
+    compiled = query.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    prefix = f"EXPLAIN {options} " if options else "EXPLAIN "
+    return conn.exec_driver_sql(prefix + str(compiled), _driver_params(compiled, conn.dialect)).scalars().all()
+
+
+def explain(session: Session, query, analyze: bool = False, force_index: bool = False) -> list[str]:
+    ## postgres only, force_index disables seq scans for this transaction so tiny tables still show the index
+    if force_index:
+        session.execute(text("SET LOCAL enable_seqscan = off"))
+    return run_explain(session, query, "(ANALYZE, BUFFERS)" if analyze else "")
+
+
+def uses_index(plan: list[str], index_name: str) -> bool:
+    return any(index_name in line for line in plan) and not any(
+        "Seq Scan" in line for line in plan
+    )
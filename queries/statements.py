@@ -0,0 +1,166 @@
+"""
+Prebuilt report statements.
+
+Statement trees are built once per process with bindparam() placeholders, so
+a call only binds parameters: no aliased()/subquery()/cte() construction and
+no cache key generation (it is memoized on the statement object) before
+SQLAlchemy's compiled cache lookup.
+"""
+
+from sqlalchemy import Integer, and_, bindparam, cast, event, func, select
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.orm import aliased, contains_eager
+
+from models import ResumeOrm, WorkerOrm
+
+
+class StatementCache:
+    def __init__(self):
+        self._statements = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, build):
+        try:
+            statement = self._statements[build]
+        except KeyError:
+            self.misses += 1
+            statement = self._statements[build] = build()
+        else:
+            self.hits += 1
+        return statement
+
+    def clear(self):
+        self._statements.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        return dict(size=len(self._statements), hits=self.hits, misses=self.misses)
+
+
+statement_cache = StatementCache()
+
+
+## builders, called once per process through statement_cache.get(...)
+def build_avg_compensation_for_workload():
+    avg_compensation = cast(func.avg(ResumeOrm.compensation), Integer)
+    return (
+        select(
+            ResumeOrm.workload,
+            avg_compensation.label("avg_compensation"),
+        )
+        .select_from(ResumeOrm)
+        .filter(
+            and_(
+                ResumeOrm.title.icontains(bindparam("like_language")),
+                ResumeOrm.compensation >= bindparam("min_compensation"),
+            )
+        )
+        .group_by(ResumeOrm.workload)
+        .having(avg_compensation > bindparam("min_avg_compensation"))
+    )
+
+
+def build_resumes_avg_compensation():
+    # async variant: case sensitive contains and strict bounds
+    return (
+        select(
+            ResumeOrm.workload,
+            # 1 вариант использования cast
+            # cast(func.avg(ResumeOrm.compensation), Integer).label("avg_compensation"),
+            # 2 вариант использования cast (предпочтительный способ)
+            func.avg(ResumeOrm.compensation).cast(Integer).label("avg_compensation"),
+        )
+        .select_from(ResumeOrm)
+        .filter(
+            and_(
+                ResumeOrm.title.contains(bindparam("like_language")),
+                ResumeOrm.compensation > bindparam("min_compensation"),
+            )
+        )
+        .group_by(ResumeOrm.workload)
+        .having(func.avg(ResumeOrm.compensation) > bindparam("min_avg_compensation"))
+    )
+
+
+def build_cte_subquery_window_func():
+    r = aliased(ResumeOrm)
+    w = aliased(WorkerOrm)
+    subq = (
+        select(
+            r,
+            w,
+            func.avg(r.compensation)
+            .over(partition_by=r.workload)
+            .cast(Integer)
+            .label("avg_workload_compensation"),
+        )
+        # .select_from(r) # not working here!!!
+        .join(
+            r, r.worker_id == w.id
+        ).subquery(  # on_default - INNER JOIN, full=True - FULL JOIN, isouter = True - LEFT JOIN, RIGHT JOIN - not implemented
+            "helper1"
+        )
+    )
+    cte = select(
+        subq.c.worker_id,
+        subq.c.username,
+        subq.c.compensation,
+        subq.c.workload,
+        subq.c.avg_workload_compensation,
+        (subq.c.compensation - subq.c.avg_workload_compensation).label("avg_diff"),
+    ).cte("helper2")
+    return select(cte).order_by(cte.c.avg_diff.desc())
+
+
+def build_workers_and_resumes_with_limit():
+    subq = (
+        select(ResumeOrm.id.label("parttime_resume_id"))
+        .filter(ResumeOrm.worker_id == WorkerOrm.id)
+        .order_by(WorkerOrm.id.desc(), ResumeOrm.compensation.desc())
+        .limit(bindparam("resumes_limit", type_=Integer))
+        .scalar_subquery()  # because it's only one item in request not [(id), (id)] but [id, id]
+        .correlate(WorkerOrm)
+    )
+    return (
+        select(WorkerOrm)
+        .join(ResumeOrm, ResumeOrm.id.in_(subq))
+        .options(contains_eager(WorkerOrm.resumes))
+    )
+
+
+########################################3
+# SQLALCHEMY COMPILED CACHE COUNTERS
+
+
+class CompiledCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0  # text(), DDL, caching disabled
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            uncached=self.uncached,
+            hit_rate=self.hits / total if total else 0.0,
+        )
+
+
+def track_compiled_cache(engine, stats: CompiledCacheStats | None = None) -> CompiledCacheStats:
+    engine = getattr(engine, "sync_engine", engine)
+    stats = stats if stats is not None else CompiledCacheStats()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        cache_hit = getattr(context, "cache_hit", None)
+        if cache_hit is CACHE_HIT:
+            stats.hits += 1
+        elif cache_hit is CACHE_MISS:
+            stats.misses += 1
+        else:
+            stats.uncached += 1
+
+    return stats
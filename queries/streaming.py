@@ -0,0 +1,54 @@
+"""
+Batch streaming for large selects.
+
+yield_per turns on stream_results (a server-side cursor for psycopg, a
+cursor-backed stream for asyncpg), so only one batch of rows and ORM
+objects is in memory at a time. Collections are loaded per batch with `load`:
+
+    stream_batches(session, select(WorkerOrm), 1000, load=[selectinload(WorkerOrm.resumes)])
+
+one SELECT of the batch by primary key with the options (the objects are
+already in the identity map, only the relationships get filled) and their
+IN queries. selectinload in the streamed query itself breaks on sqlalchemy
+2.0.29 as soon as a session has a do_orm_execute listener ("Can't use the
+ORM yield_per feature in conjunction with unique()"). joinedload is fine for
+many-to-one only (collections need the whole result).
+The session identity map holds objects weakly, so a batch is freed once the
+caller drops it (as long as nothing in it was modified).
+"""
+
+from typing import AsyncIterator, Iterator, Sequence
+
+from sqlalchemy import Select, inspect, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+
+def batch_load_query(batch: list, load: Sequence) -> Select:
+    ## the batch again by primary key, with the loader options
+    mapper = inspect(batch[0]).mapper
+    identities = [inspect(obj).identity for obj in batch]
+    pk = mapper.primary_key
+    if len(pk) == 1:
+        where = pk[0].in_([identity[0] for identity in identities])
+    else:
+        where = tuple_(*pk).in_(identities)
+    return select(mapper).where(where).options(*load)
+
+
+def stream_batches(session: Session, query: Select, batch_size: int = 1000, load: Sequence = ()) -> Iterator[list]:
+    result = session.scalars(query.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        if load:
+            session.scalars(batch_load_query(batch, load)).all()
+        yield batch
+
+
+async def stream_batches_async(
+    session: AsyncSession, query: Select, batch_size: int = 1000, load: Sequence = ()
+) -> AsyncIterator[list]:
+    result = await session.stream_scalars(query.execution_options(yield_per=batch_size))
+    async for batch in result.partitions():
+        if load:
+            (await session.scalars(batch_load_query(batch, load))).all()
+        yield batch
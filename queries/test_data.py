@@ -28,39 +28,40 @@ resumes = [
 ]
 
 additional_workers = [
-    {"username": "Artem"},  # id 3
-    {"username": "Roman"},  # id 4
-    {"username": "Petr"},  # id 5
+    {"username": "Artem"},
+    {"username": "Roman"},
+    {"username": "Petr"},
 ]
+## "worker" is the worker's username, its id comes back from the workers upsert
 additional_resumes = [
     {
         "title": "Python программист",
         "compensation": 60000,
         "workload": "fulltime",
-        "worker_id": 3,
+        "worker": "Artem",
     },
     {
         "title": "Machine Learning Engineer",
         "compensation": 70000,
         "workload": "parttime",
-        "worker_id": 3,
+        "worker": "Artem",
     },
     {
         "title": "Python Data Scientist",
         "compensation": 80000,
         "workload": "parttime",
-        "worker_id": 4,
+        "worker": "Roman",
     },
     {
         "title": "Python Analyst",
         "compensation": 90000,
         "workload": "fulltime",
-        "worker_id": 4,
+        "worker": "Roman",
     },
     {
         "title": "Python Junior Developer",
         "compensation": 100000,
         "workload": "fulltime",
-        "worker_id": 5,
+        "worker": "Petr",
     },
 ]
@@ -0,0 +1,263 @@
+"""
+Batched upserts keyed on natural keys.
+
+    workers = upsert(session, WorkerOrm, [{"username": "Artem"}, ...])
+    workers.ids  # {"Artem": 3, ...}
+    upsert(session, ResumeOrm, [{"title": ..., "worker_id": workers.ids["Artem"]}, ...])
+
+One INSERT ... VALUES ... ON CONFLICT (<natural key>) DO UPDATE ... RETURNING
+per batch. DO UPDATE instead of DO NOTHING so existing rows come back in
+RETURNING too: re-running a feed returns the same ids without a SELECT.
+Natural keys need a unique index, see NATURAL_KEYS: workers_username_key makes
+usernames unique, tables keyed otherwise pass conflict_target. Rows are read
+lazily, a batch ends at batch_size rows or MAX_BIND_PARAMS bind parameters,
+so a generator feed is never held in memory whole. On a partitioned resumes
+table (DB_PARTITION_RESUMES) unique indexes must contain created_at, so
+resumes can't be upserted by (worker_id, title) there: insert_missing() adds
+the ones whose key isn't in the table yet (SELECT, then INSERT), existing
+rows are left as they are and concurrent writers may still duplicate a key.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, Mapping, Sequence
+
+from sqlalchemy import Table, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import PARTITION_RESUMES, ResumeOrm, WorkerOrm
+from .aggregates import mark_stale_for
+
+RESUME_KEY = ("worker_id", "title")
+## conflict target by default, each one has a unique index in models.py
+NATURAL_KEYS = {
+    "workers": ("username",),
+    # a partitioned resumes has no unique index without created_at
+    **({} if PARTITION_RESUMES else {"resumes": RESUME_KEY}),
+}
+
+UPSERT_BATCH_SIZE = 1_000
+MAX_BIND_PARAMS = 32_767  # half of postgres' 65535 a statement, leaves room for the rest
+
+
+@dataclass
+class UpsertResult:
+    table: str
+    rows: int  # sent, after dropping duplicate keys within a batch
+    batches: int
+    elapsed: float  # seconds
+    # natural key -> primary key, key is a scalar for one column targets and a tuple otherwise
+    ids: dict[Any, int] = field(default_factory=dict, repr=False)
+
+
+def dialect_insert(dialect_name: str, table: Table):
+    # both dialects have INSERT ... ON CONFLICT with the same API
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    return dialect.insert(table)
+
+
+def _table(model_or_table) -> Table:
+    return model_or_table if isinstance(model_or_table, Table) else model_or_table.__table__
+
+
+def _key(row: Mapping, conflict_target: Sequence[str]):
+    key = tuple(row[c] for c in conflict_target)
+    return key[0] if len(key) == 1 else key
+
+
+def _batches(rows: Iterable[Mapping], conflict_target: Sequence[str], batch_size: int) -> Iterator[list[dict]]:
+    ## ON CONFLICT DO UPDATE can't touch one row twice in a statement, the last duplicate wins;
+    ## bind parameters are counted per row, rows of a feed may differ in width
+    batch: dict[Any, dict] = {}
+    params = 0
+    for row in rows:
+        row = dict(row)
+        key = _key(row, conflict_target)
+        if key not in batch and (len(batch) >= batch_size or params + len(row) > MAX_BIND_PARAMS):
+            yield list(batch.values())
+            batch, params = {}, 0
+        params += len(row) - len(batch.get(key, ()))
+        batch[key] = row
+    if batch:
+        yield list(batch.values())
+
+
+def upsert_statement(
+    dialect_name: str,
+    table: Table,
+    rows: list[dict],
+    conflict_target: Sequence[str],
+    update_columns: Sequence[str] | None = None,
+):
+    """update_columns: None - every inserted column but the key, () - touch nothing, just return ids."""
+    stmt = dialect_insert(dialect_name, table).values(rows)
+    if update_columns is None:
+        update_columns = [c for c in rows[0] if c not in conflict_target]
+    # a no-op assignment still locks and returns the existing row
+    set_ = {c: stmt.excluded[c] for c in update_columns} or {
+        conflict_target[0]: stmt.excluded[conflict_target[0]]
+    }
+    pk = table.primary_key.columns.values()
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[c] for c in conflict_target], set_=set_
+    ).returning(*pk, *(table.c[c] for c in conflict_target))
+
+
+def _prepare(model_or_table, conflict_target) -> tuple[Table, tuple[str, ...]]:
+    table = _table(model_or_table)
+    return table, tuple(conflict_target or NATURAL_KEYS[table.name])
+
+
+def _collect(result, conflict_target, ids: dict):
+    for row in result:
+        ids[_key(row._mapping, conflict_target)] = row[0]
+
+
+def upsert(
+    session,
+    model_or_table,
+    rows: Iterable[Mapping[str, Any]],
+    conflict_target: Sequence[str] | None = None,
+    update_columns: Sequence[str] | None = None,
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> UpsertResult:
+    """Insert or update rows in the session's transaction, the caller commits."""
+    start = time.perf_counter()
+    table, conflict_target = _prepare(model_or_table, conflict_target)
+    result = UpsertResult(table.name, 0, 0, 0.0)
+    dialect_name = session.get_bind().dialect.name
+    for batch in _batches(rows, conflict_target, batch_size):
+        stmt = upsert_statement(dialect_name, table, batch, conflict_target, update_columns)
+        _collect(session.execute(stmt), conflict_target, result.ids)
+        result.rows += len(batch)
+        result.batches += 1
+    if result.batches:
+        # core statements skip the ORM events keeping the compensation summary up to date
+        mark_stale_for(session.connection(bind_arguments=dict(clause=stmt)), table)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def upsert_async(
+    session,
+    model_or_table,
+    rows: Iterable[Mapping[str, Any]],
+    conflict_target: Sequence[str] | None = None,
+    update_columns: Sequence[str] | None = None,
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> UpsertResult:
+    start = time.perf_counter()
+    table, conflict_target = _prepare(model_or_table, conflict_target)
+    result = UpsertResult(table.name, 0, 0, 0.0)
+    dialect_name = session.get_bind().dialect.name
+    for batch in _batches(rows, conflict_target, batch_size):
+        stmt = upsert_statement(dialect_name, table, batch, conflict_target, update_columns)
+        _collect(await session.execute(stmt), conflict_target, result.ids)
+        result.rows += len(batch)
+        result.batches += 1
+    if result.batches:
+        conn = await session.connection(bind_arguments=dict(clause=stmt))
+        await conn.run_sync(mark_stale_for, table)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+########################################3
+# WITHOUT A UNIQUE INDEX
+
+
+def _existing_query(table: Table, batch: list[dict], key_columns: Sequence[str]):
+    columns = [table.c[c] for c in key_columns]
+    keys = {tuple(row[c] for c in key_columns) for row in batch}
+    return select(table.primary_key.columns.values()[0], *columns).where(tuple_(*columns).in_(keys))
+
+
+def _insert_new(dialect_name: str, table: Table, batch: list[dict], key_columns: Sequence[str], ids: dict):
+    ## None when every key of the batch is in ids already
+    new = [row for row in batch if _key(row, key_columns) not in ids]
+    if not new:
+        return None
+    pk = table.primary_key.columns.values()[0]
+    return dialect_insert(dialect_name, table).values(new).returning(pk, *(table.c[c] for c in key_columns))
+
+
+def insert_missing(
+    session,
+    model_or_table,
+    rows: Iterable[Mapping[str, Any]],
+    key_columns: Sequence[str],
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> UpsertResult:
+    """upsert() with DO NOTHING semantics for a key without a unique index, the caller commits."""
+    start = time.perf_counter()
+    table, key_columns = _prepare(model_or_table, key_columns)
+    result = UpsertResult(table.name, 0, 0, 0.0)
+    dialect_name = session.get_bind().dialect.name
+    for batch in _batches(rows, key_columns, batch_size):
+        _collect(session.execute(_existing_query(table, batch, key_columns)), key_columns, result.ids)
+        stmt = _insert_new(dialect_name, table, batch, key_columns, result.ids)
+        if stmt is not None:
+            _collect(session.execute(stmt), key_columns, result.ids)
+        result.rows += len(batch)
+        result.batches += 1
+    if result.batches:
+        mark_stale_for(session.connection(bind_arguments=dict(clause=table.insert())), table)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def insert_missing_async(
+    session,
+    model_or_table,
+    rows: Iterable[Mapping[str, Any]],
+    key_columns: Sequence[str],
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> UpsertResult:
+    start = time.perf_counter()
+    table, key_columns = _prepare(model_or_table, key_columns)
+    result = UpsertResult(table.name, 0, 0, 0.0)
+    dialect_name = session.get_bind().dialect.name
+    for batch in _batches(rows, key_columns, batch_size):
+        _collect(await session.execute(_existing_query(table, batch, key_columns)), key_columns, result.ids)
+        stmt = _insert_new(dialect_name, table, batch, key_columns, result.ids)
+        if stmt is not None:
+            _collect(await session.execute(stmt), key_columns, result.ids)
+        result.rows += len(batch)
+        result.batches += 1
+    if result.batches:
+        conn = await session.connection(bind_arguments=dict(clause=table.insert()))
+        await conn.run_sync(mark_stale_for, table)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+########################################3
+# WORKERS WITH RESUMES
+
+
+def resumes_with_worker_ids(resumes: Iterable[Mapping], worker_ids: Mapping[str, int]) -> Iterator[dict]:
+    ## resumes refer to their worker by "worker" (username), swapped for worker_id from the upsert
+    for resume in resumes:
+        resume = dict(resume)
+        resume["worker_id"] = worker_ids[resume.pop("worker")]
+        yield resume
+
+
+def upsert_workers_with_resumes(session, workers: Iterable[Mapping], resumes: Iterable[Mapping]) -> dict:
+    worker_result = upsert(session, WorkerOrm, workers)
+    resumes = resumes_with_worker_ids(resumes, worker_result.ids)
+    if "resumes" in NATURAL_KEYS:
+        resume_result = upsert(session, ResumeOrm, resumes)
+    else:
+        resume_result = insert_missing(session, ResumeOrm, resumes, RESUME_KEY)
+    return dict(workers=worker_result, resumes=resume_result)
+
+
+async def upsert_workers_with_resumes_async(session, workers: Iterable[Mapping], resumes: Iterable[Mapping]) -> dict:
+    worker_result = await upsert_async(session, WorkerOrm, workers)
+    resumes = resumes_with_worker_ids(resumes, worker_result.ids)
+    if "resumes" in NATURAL_KEYS:
+        resume_result = await upsert_async(session, ResumeOrm, resumes)
+    else:
+        resume_result = await insert_missing_async(session, ResumeOrm, resumes, RESUME_KEY)
+    return dict(workers=worker_result, resumes=resume_result)
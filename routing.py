@@ -0,0 +1,189 @@
+"""
+Read replica routing.
+
+RoutingSession.get_bind() sends flushes, INSERT/UPDATE/DELETE, SELECT ...
+FOR UPDATE and non-SELECT text() to the primary and plain SELECTs to a
+replica. After the first write a transaction sticks to the primary until it
+ends, so it always reads its own writes. One replica is picked per
+transaction, so a transaction never holds connections to several replicas.
+
+    replicas = ReplicaSet([create_engine(url1), create_engine(url2)])
+    factory = sessionmaker(class_=RoutingSession, primary=primary_engine, replicas=replicas)
+    async_factory = async_sessionmaker(
+        sync_session_class=RoutingSession, primary=async_primary.sync_engine, replicas=async_replicas
+    )
+"""
+
+import asyncio
+import itertools
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import Delete, Engine, Insert, Select, TextClause, Update, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = "round_robin"
+LEAST_CONNECTIONS = "least_connections"
+
+_READ_ONLY_TEXT = re.compile(r"^\s*(SELECT|WITH|SHOW|EXPLAIN)\b(?!.*\bFOR\s+(UPDATE|SHARE)\b)", re.I | re.S)
+_PING = text("SELECT 1")
+
+
+class ReplicaSet:
+    def __init__(
+        self,
+        engines: list[Engine | AsyncEngine],
+        strategy: str = ROUND_ROBIN,
+        retry_after: float = 30.0,
+    ):
+        if strategy not in (ROUND_ROBIN, LEAST_CONNECTIONS):
+            raise ValueError(f"unknown replica strategy {strategy!r}")
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.retry_after = retry_after  # seconds an evicted replica is left out, then it's tried again
+        self._evicted: dict[int, float] = {}  # index -> evicted at
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for i, engine in enumerate(self.engines):
+            self._evict_on_disconnect(i, engine)
+
+    def __len__(self):
+        return len(self.engines)
+
+    @staticmethod
+    def _sync(engine) -> Engine:
+        return getattr(engine, "sync_engine", engine)
+
+    def _evict_on_disconnect(self, index: int, engine):
+        @event.listens_for(self._sync(engine), "handle_error")
+        def _on_error(context):
+            # no connection: it failed to connect
+            if context.is_disconnect or context.connection is None:
+                self.evict(index, context.original_exception)
+
+    def evict(self, index: int, reason=None):
+        with self._lock:
+            if index not in self._evicted:
+                logger.warning("evicting replica %s: %s", self._sync(self.engines[index]).url, reason)
+            self._evicted[index] = time.monotonic()
+
+    def restore(self, index: int):
+        with self._lock:
+            if self._evicted.pop(index, None) is not None:
+                logger.warning("replica %s is back", self._sync(self.engines[index]).url)
+
+    def _readmit(self):
+        ## evicted replicas are tried again after retry_after, health checks running or not:
+        ## one still failing is evicted again by its next error
+        with self._lock:
+            for i in [i for i in self._evicted if self._due(i)]:
+                del self._evicted[i]
+                logger.warning("retrying replica %s", self._sync(self.engines[i]).url)
+
+    def healthy(self) -> list[Engine]:
+        self._readmit()
+        return [self._sync(e) for i, e in enumerate(self.engines) if i not in self._evicted]
+
+    def choose(self) -> Engine | None:
+        ## None when every replica is evicted, the caller falls back to the primary
+        engines = self.healthy()
+        if not engines:
+            return None
+        if self.strategy == LEAST_CONNECTIONS:
+            # pools without a checked out counter (NullPool, StaticPool) count as idle
+            return min(engines, key=lambda e: getattr(e.pool, "checkedout", lambda: 0)())
+        return engines[next(self._counter) % len(engines)]
+
+    ########################################3
+    # HEALTH CHECKS
+
+    def _due(self, index: int) -> bool:
+        evicted_at = self._evicted.get(index)
+        return evicted_at is None or time.monotonic() - evicted_at >= self.retry_after
+
+    def check_health(self):
+        for i, engine in enumerate(self.engines):
+            if not self._due(i):
+                continue
+            try:
+                with self._sync(engine).connect() as conn:
+                    conn.execute(_PING)
+            except (exc.DBAPIError, exc.TimeoutError, OSError) as e:
+                self.evict(i, e)
+            else:
+                self.restore(i)
+
+    async def check_health_async(self):
+        for i, engine in enumerate(self.engines):
+            if not self._due(i):
+                continue
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(_PING)
+            except (exc.DBAPIError, exc.TimeoutError, OSError) as e:
+                self.evict(i, e)
+            else:
+                self.restore(i)
+
+    def start_health_checks(self, interval: float = 10.0) -> threading.Event:
+        # daemon thread for sync engines, set() the returned event to stop it
+        stop = threading.Event()
+
+        def _loop():
+            while not stop.wait(interval):
+                self.check_health()
+
+        threading.Thread(target=_loop, name="replica-health", daemon=True).start()
+        return stop
+
+    async def run_health_checks(self, interval: float = 10.0):
+        # for async engines: asyncio.create_task(replicas.run_health_checks())
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health_async()
+
+
+def is_write(clause) -> bool:
+    if isinstance(clause, (Insert, Update, Delete)):
+        return True
+    if isinstance(clause, Select):
+        return clause._for_update_arg is not None
+    if isinstance(clause, TextClause):
+        return not _READ_ONLY_TEXT.match(clause.text)
+    return clause is not None and not getattr(clause, "is_select", False)
+
+
+class RoutingSession(Session):
+    def __init__(self, primary: Engine, replicas: ReplicaSet | None = None, **kw):
+        super().__init__(**kw)
+        self.primary = primary
+        self.replicas = replicas
+        self._replica: Engine | None = None  # picked for the current transaction
+        self._sticky_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or is_write(clause):
+            self._sticky_primary = True
+        if self._sticky_primary or not self.replicas:
+            return self.primary
+        if self._replica is None:
+            self._replica = self.replicas.choose()
+            if self._replica is None:
+                return self.primary
+        return self._replica
+
+    def use_primary(self):
+        # route reads to the primary until the transaction ends, e.g. right after another session wrote
+        self._sticky_primary = True
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session._replica = None
+        session._sticky_primary = False
@@ -0,0 +1,82 @@
+"""
+Behavior tests on SQLite files, no server needed:
+
+    python -m pytest -q
+
+Tests marked postgres (EXPLAIN plans, GIN indexes) run against
+TEST_POSTGRES_URL=postgresql+psycopg://... and are skipped without it.
+"""
+
+import os
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+import models  # noqa: F401 - registers every table on Base.metadata
+from database import Base
+from models import ResumeOrm, WorkerOrm, Workload
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs a postgres database at TEST_POSTGRES_URL")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.environ.get("TEST_POSTGRES_URL"):
+        return
+    skip = pytest.mark.skip(reason="TEST_POSTGRES_URL is not set")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # a file, not :memory:, several engines and connections see the same data
+    return tmp_path / "test.sqlite"
+
+
+@pytest.fixture
+def engine(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def session(session_factory):
+    with session_factory() as session:
+        yield session
+
+
+def count_statements(engine) -> list[int]:
+    counter = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):
+        counter[0] += 1
+
+    return counter
+
+
+def add_workers(session: Session, resume_counts: list[int], compensation: int = 50_000) -> list[int]:
+    """Worker i gets resume_counts[i] resumes titled "Python developer <n>", returns worker ids."""
+    ids = []
+    for i, count in enumerate(resume_counts):
+        worker = WorkerOrm(username=f"worker{i}")
+        worker.resumes = [
+            ResumeOrm(title=f"Python developer {n}", compensation=compensation, workload=Workload.fulltime)
+            for n in range(count)
+        ]
+        session.add(worker)
+        session.flush()
+        ids.append(worker.id)
+    session.commit()
+    return ids
@@ -0,0 +1,90 @@
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+
+from database import session_class
+from models import ResumeOrm, WorkerOrm, Workload
+from queries.aggregates import refresh_compensation_summary, stale_flag_query, summary_query, track_bulk_writes
+from write_mode import write_session_options
+
+from .conftest import add_workers
+
+
+def summary(session, keyword="python") -> dict:
+    rows = session.execute(summary_query(keyword, 0)).all()
+    return {workload: avg for workload, avg in rows}
+
+
+def fresh_summary(session):
+    refresh_compensation_summary(session.connection())
+    session.commit()
+
+
+def test_flushes_update_the_summary(session):
+    add_workers(session, [2], compensation=50_000)
+    fresh_summary(session)
+    assert summary(session) == {Workload.fulltime: 50_000}
+
+    resume = ResumeOrm(title="Python engineer", compensation=80_000, workload=Workload.parttime, worker_id=1)
+    session.add(resume)
+    session.commit()
+    assert summary(session) == {Workload.fulltime: 50_000, Workload.parttime: 80_000}
+
+    resume.compensation = 60_000
+    session.commit()  # expires resume, the change below loads the old values
+    resume.workload = Workload.fulltime
+    session.commit()
+    assert summary(session) == {Workload.fulltime: 160_000 // 3}
+
+    session.delete(resume)
+    session.commit()
+    assert summary(session) == {Workload.fulltime: 50_000}
+    assert session.execute(stale_flag_query()).scalar() is False
+
+
+def test_summary_matches_a_refresh(session):
+    add_workers(session, [3, 1], compensation=45_000)
+    fresh_summary(session)
+    session.add(ResumeOrm(title="Data analyst", compensation=70_000, workload=Workload.parttime, worker_id=2))
+    session.add(ResumeOrm(title="Java developer", compensation=30_000, workload=Workload.parttime, worker_id=2))
+    session.commit()
+    incremental = {keyword: summary(session, keyword) for keyword in ("python", "data", "developer", "java")}
+
+    fresh_summary(session)
+    assert {keyword: summary(session, keyword) for keyword in incremental} == incremental
+
+
+def test_changes_of_expired_resumes(session):
+    add_workers(session, [2])
+    fresh_summary(session)
+    first, second = session.scalars(select(ResumeOrm).order_by(ResumeOrm.id)).all()
+    session.expire(first)
+    first.compensation = 90_000  # loads the old value
+    session.commit()
+    assert summary(session) == {Workload.fulltime: 70_000}
+    assert session.execute(stale_flag_query()).scalar() is False
+
+    session.delete(second)  # expired by the commit
+    session.commit()
+    assert summary(session) == {Workload.fulltime: 90_000}
+    assert session.execute(stale_flag_query()).scalar() is False
+
+
+def test_bulk_insert_marks_stale_on_tracked_sessions_only(engine):
+    plain = sessionmaker(bind=engine)
+    write = sessionmaker(bind=engine, **write_session_options())
+    track_bulk_writes(session_class(write))
+    track_bulk_writes(session_class(write))  # once per class
+
+    row = dict(title="Python developer", compensation=50_000, workload=Workload.fulltime)
+    with plain() as session:
+        session.add(WorkerOrm(username="worker"))
+        session.commit()
+        fresh_summary(session)
+        session.execute(insert(ResumeOrm), [dict(row, worker_id=1)])
+        session.commit()
+        assert session.execute(stale_flag_query()).scalar() is False
+
+    with write() as session:
+        session.execute(insert(ResumeOrm), [dict(row, title="Python engineer", worker_id=1)])
+        session.commit()
+        assert session.execute(stale_flag_query()).scalar() is True
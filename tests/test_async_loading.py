@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from sqlalchemy import exc, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from async_loading import refuse_implicit_lazy_loads
+from database import _own_session_class, session_class
+from models import WorkerOrm
+
+from .conftest import add_workers
+
+
+def run_with_session(db_path, fn, **factory_kw):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        try:
+            async with async_sessionmaker(engine, **factory_kw)() as session:
+                return await fn(session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def lazy_load_in_run_sync(session):
+    worker = (await session.scalars(select(WorkerOrm).order_by(WorkerOrm.id))).first()
+    return await session.run_sync(lambda _: len(worker.resumes))
+
+
+def test_factory_sessions_refuse_lazy_loads(session, db_path):
+    add_workers(session, [2])
+    factory_kw = dict(sync_session_class=_own_session_class())
+    refuse_implicit_lazy_loads(factory_kw["sync_session_class"])
+
+    with pytest.raises(exc.InvalidRequestError, match="don't lazy load"):
+        run_with_session(db_path, lazy_load_in_run_sync, **factory_kw)
+
+    async def awaited(session):
+        worker = (await session.scalars(select(WorkerOrm))).one()
+        return len(await worker.awaitable_attrs.resumes)
+
+    assert run_with_session(db_path, awaited, **factory_kw) == 2
+
+
+def test_other_sessions_are_not_hooked(session, db_path):
+    add_workers(session, [2])
+    refuse_implicit_lazy_loads(_own_session_class())
+    assert run_with_session(db_path, lazy_load_in_run_sync) == 2
+    assert session_class(async_sessionmaker()) is AsyncSession.sync_session_class
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from cache import LRUBackend, SecondLevelCache
+from database import session_class
+from models import WorkerOrm
+
+from .conftest import add_workers, count_statements
+
+
+@pytest.fixture
+def cache(engine, session_factory):
+    return SecondLevelCache(LRUBackend()).install(engine, session_class=session_class(session_factory))
+
+
+def cached_username(cache, session_factory, worker_id: int) -> str:
+    with session_factory() as session:
+        return cache.get(session, WorkerOrm, worker_id).username
+
+
+def test_get_reads_the_cache(cache, engine, session_factory):
+    with session_factory() as session:
+        [worker_id] = add_workers(session, [0])
+    assert cached_username(cache, session_factory, worker_id) == "worker0"
+    statements = count_statements(engine)
+    assert cached_username(cache, session_factory, worker_id) == "worker0"
+    assert statements[0] == 0
+    assert cache.stats()["entity"] == dict(hits=1, misses=1, stores=1, hit_rate=0.5)
+
+
+def test_flushed_update_invalidates_after_commit(cache, session_factory):
+    with session_factory() as session:
+        [worker_id] = add_workers(session, [0])
+    cached_username(cache, session_factory, worker_id)
+
+    with session_factory() as session:
+        session.get(WorkerOrm, worker_id).username = "renamed"
+        session.flush()
+        # not committed yet, other sessions still get the committed row
+        assert cached_username(cache, session_factory, worker_id) == "worker0"
+        session.commit()
+    assert cached_username(cache, session_factory, worker_id) == "renamed"
+
+
+def test_bulk_update_invalidates(cache, session_factory):
+    with session_factory() as session:
+        worker_ids = add_workers(session, [0, 0])
+    for worker_id in worker_ids:
+        cached_username(cache, session_factory, worker_id)
+
+    with session_factory() as session:
+        session.execute(update(WorkerOrm).values(username=WorkerOrm.username + "!"))
+        session.commit()
+    assert [cached_username(cache, session_factory, worker_id) for worker_id in worker_ids] == [
+        "worker0!",
+        "worker1!",
+    ]
+
+
+def test_query_results_invalidate_after_commit(cache, session_factory):
+    query = select(WorkerOrm.username).order_by(WorkerOrm.id)
+    with session_factory() as session:
+        add_workers(session, [0])
+        assert cache.execute(session, query) == [("worker0",)]
+
+    with session_factory() as session:
+        session.add(WorkerOrm(username="added"))
+        session.flush()
+        # rows this session wrote aren't committed, they are not stored
+        assert cache.execute(session, query) == [("worker0",), ("added",)]
+        session.rollback()
+        assert cache.execute(session, query) == [("worker0",)]
+        session.add(WorkerOrm(username="added"))
+        session.commit()
+        assert cache.execute(session, query) == [("worker0",), ("added",)]
+
+
+def test_no_listeners_on_every_session(cache, session_factory):
+    import queries.orm  # noqa: F401 - imports the modules listening on ORM executes
+
+    assert len(Session().dispatch.do_orm_execute) == 0
+    assert len(session_factory().dispatch.do_orm_execute) == 1
+    cache.install_sessions(session_class(session_factory))  # once per class
+    assert len(session_factory().dispatch.do_orm_execute) == 1
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models import WorkerOrm
+from queries.executor import AsyncQueryExecutor, ReadQuery, ThreadPoolQueryExecutor
+
+from .conftest import add_workers
+
+
+def sleeping(seconds: float, value=None):
+    def query(session):
+        time.sleep(seconds)
+        return value
+
+    return ReadQuery(query)
+
+
+def test_thread_timeouts_dont_count_the_wait_for_a_thread(session_factory):
+    # 1s queries, each well within timeout + grace period once started, the second starts after 1s
+    executor = ThreadPoolQueryExecutor(session_factory, concurrency=1, timeout=0.5)
+    results = executor.run(dict(first=sleeping(1.0, 1), second=sleeping(1.0, 2)))
+    assert {name: (result.value, result.error) for name, result in results.items()} == dict(
+        first=(1, None), second=(2, None)
+    )
+
+
+def test_thread_queries_behind_abandoned_ones_time_out(session, session_factory):
+    add_workers(session, [0])
+    executor = ThreadPoolQueryExecutor(session_factory, concurrency=1, timeout=0.1)
+    start = time.monotonic()
+    results = executor.run(dict(hung=sleeping(3.0), queued=ReadQuery(select(WorkerOrm.username))))
+    assert time.monotonic() - start < 2
+    assert isinstance(results["hung"].error, FutureTimeoutError)
+    assert isinstance(results["queued"].error, FutureTimeoutError)
+
+
+def test_async_timeouts_dont_count_the_wait_for_a_slot(db_path, engine):
+    async def sleep(session, seconds=0.3):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        try:
+            executor = AsyncQueryExecutor(async_sessionmaker(async_engine), concurrency=1, timeout=0.5)
+            return await executor.run(
+                dict(
+                    first=ReadQuery(sleep),
+                    second=ReadQuery(sleep),
+                    slow=ReadQuery(lambda session: sleep(session, 1.0), timeout=0.2),
+                )
+            )
+        finally:
+            await async_engine.dispose()
+
+    results = asyncio.run(run())
+    assert [results[name].value for name in ("first", "second")] == [0.3, 0.3]
+    assert isinstance(results["slow"].error, asyncio.TimeoutError)
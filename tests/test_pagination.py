@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import ResumeOrm, WorkerOrm, Workload
+from queries.pagination import InvalidCursor, encode_cursor, paginate
+
+COMPENSATIONS = [70_000, 50_000, None, 50_000, 90_000, 50_000, 60_000]
+
+
+@pytest.fixture
+def resumes(session):
+    worker = WorkerOrm(username="worker")
+    start = datetime(2024, 1, 1, 12, 30)
+    worker.resumes = [
+        ResumeOrm(
+            title=f"resume {i}",
+            compensation=compensation,
+            workload=Workload.fulltime,
+            created_at=start + timedelta(days=i % 3, minutes=i),
+        )
+        for i, compensation in enumerate(COMPENSATIONS)
+    ]
+    session.add(worker)
+    session.commit()
+    return worker.resumes
+
+
+def all_pages(session, order: str, limit: int) -> list[list]:
+    pages = [paginate(session, ResumeOrm, order=order, limit=limit)]
+    while pages[-1].next_cursor:
+        pages.append(paginate(session, ResumeOrm, order=order, limit=limit, cursor=pages[-1].next_cursor))
+    return [page.items for page in pages]
+
+
+def test_pages_by_compensation_with_ties(session, resumes):
+    pages = all_pages(session, "compensation", limit=2)
+    expected = sorted((r for r in resumes if r.compensation is not None), key=lambda r: (r.compensation, r.id))
+    assert [len(items) for items in pages] == [2, 2, 2]
+    assert [item for items in pages for item in items] == expected  # NULL compensation is not paged
+
+
+def test_pages_by_created_at(session, resumes):
+    pages = all_pages(session, "created_at", limit=3)
+    assert [item for items in pages for item in items] == sorted(resumes, key=lambda r: (r.created_at, r.id))
+
+
+def test_prev_cursor_goes_back(session, resumes):
+    first = paginate(session, ResumeOrm, order="compensation", limit=2)
+    second = paginate(session, ResumeOrm, order="compensation", limit=2, cursor=first.next_cursor)
+    assert first.prev_cursor is None
+    back = paginate(session, ResumeOrm, order="compensation", limit=2, cursor=second.prev_cursor)
+    assert back.items == first.items
+    assert back.prev_cursor is None
+    assert paginate(session, ResumeOrm, order="compensation", limit=2, cursor=back.next_cursor).items == second.items
+
+
+def test_last_page(session, resumes):
+    page = paginate(session, ResumeOrm, order="id", limit=len(resumes))
+    assert page.items == resumes
+    assert page.next_cursor is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not a cursor", encode_cursor("compensation", "after", [1, 2]), encode_cursor("id", "sideways", [1])],
+)
+def test_invalid_cursors(session, resumes, cursor):
+    with pytest.raises(InvalidCursor):
+        paginate(session, ResumeOrm, order="id", cursor=cursor)
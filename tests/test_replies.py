@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import select
+
+from models import VacancyOrm, VacancyReplyOrm
+from queries.replies import NOTHING, UPDATE, add_replies
+
+from .conftest import add_workers
+
+
+@pytest.fixture(autouse=True)
+def resumes_and_vacancies(session):
+    # resumes 1, 2 and vacancies 1, 2
+    add_workers(session, [2])
+    session.add_all([VacancyOrm(title="Python developer"), VacancyOrm(title="Data engineer")])
+    session.commit()
+
+
+def cover_letters(session) -> dict:
+    rows = session.execute(select(VacancyReplyOrm.resume_id, VacancyReplyOrm.vacancy_id, VacancyReplyOrm.cover_letter))
+    return {(resume_id, vacancy_id): letter for resume_id, vacancy_id, letter in rows}
+
+
+def test_duplicates_in_a_batch_keep_the_first_with_nothing(session):
+    result = add_replies(session, [(1, 1, "first"), (1, 2, "other"), (1, 1, "second")], on_conflict=NOTHING)
+    session.commit()
+    assert (result.rows, result.written, result.batches) == (2, 2, 1)
+    assert cover_letters(session) == {(1, 1): "first", (1, 2): "other"}
+
+
+def test_duplicates_in_a_batch_keep_the_last_with_update(session):
+    result = add_replies(session, [(1, 1, "first"), (1, 1, "second")], on_conflict=UPDATE)
+    session.commit()
+    assert (result.rows, result.written) == (1, 1)
+    assert cover_letters(session) == {(1, 1): "second"}
+
+
+@pytest.mark.parametrize("on_conflict, letter", [(NOTHING, "first"), (UPDATE, "third")])
+def test_duplicates_across_batches_and_calls(session, on_conflict, letter):
+    replies = [(1, 1, "first"), (2, 1, "a"), (1, 1, "second"), (2, 2, "b")]
+    result = add_replies(session, replies, on_conflict=on_conflict, batch_size=2)
+    assert result.batches == 2
+    add_replies(session, [(1, 1, "third")], on_conflict=on_conflict)
+    session.commit()
+    assert cover_letters(session) == {(1, 1): letter, (2, 1): "a", (2, 2): "b"}
+
+
+def test_written_doesnt_count_skipped_conflicts(session):
+    add_replies(session, [(1, 1, "first")])
+    result = add_replies(session, [(1, 1, "again"), (2, 2, "new")], on_conflict=NOTHING)
+    assert (result.rows, result.written) == (2, 1)
+
+
+def test_unknown_on_conflict(session):
+    with pytest.raises(ValueError, match="unknown on_conflict"):
+        add_replies(session, [(1, 1, "letter")], on_conflict="replace")
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import create_engine, exc, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import WorkerOrm
+from routing import ReplicaSet, RoutingSession
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    ## two SQLite files, each with one worker named after it
+    engines = []
+    for name in ("replica0", "replica1"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}.sqlite")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(WorkerOrm.__table__.insert().values(username=name))
+        engines.append(engine)
+    yield ReplicaSet(engines)
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def factory(engine, replicas):
+    return sessionmaker(class_=RoutingSession, primary=engine, replicas=replicas)
+
+
+def read_username(session) -> str | None:
+    return session.scalars(select(WorkerOrm.username)).first()
+
+
+def test_round_robin(replicas):
+    assert [replicas.choose() for _ in range(4)] == [*replicas.engines, *replicas.engines]
+
+
+def test_reads_go_to_one_replica_per_transaction(factory):
+    with factory() as session:
+        assert read_username(session) == read_username(session) == "replica0"
+        session.commit()
+        assert read_username(session) == "replica1"
+
+
+def test_evicted_replicas_are_skipped(factory, replicas):
+    replicas.evict(0)
+    assert {replicas.choose() for _ in range(3)} == {replicas.engines[1]}
+    replicas.evict(1)
+    assert replicas.choose() is None
+    with factory() as session:
+        assert read_username(session) is None  # the primary has no workers
+
+
+def test_replica_failing_to_connect_is_evicted(tmp_path, replicas):
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.sqlite'}")
+    replicas = ReplicaSet([broken, replicas.engines[1]])
+    with pytest.raises(exc.OperationalError):
+        with replicas.choose().connect():
+            pass
+    assert replicas.healthy() == [replicas.engines[1]]
+    replicas.check_health()
+    assert replicas.healthy() == [replicas.engines[1]]
+
+
+def test_evicted_replica_comes_back_after_retry_after(replicas, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("routing.time.monotonic", lambda: now[0])
+    replicas.retry_after = 30.0
+    replicas.evict(0)
+    assert replicas.healthy() == [replicas.engines[1]]
+    now[0] += 30.0
+    # without any health check running
+    assert replicas.healthy() == replicas.engines
+
+
+def test_reads_stick_to_the_primary_after_a_write(factory):
+    with factory() as session:
+        session.add(WorkerOrm(username="primary"))
+        session.flush()
+        assert read_username(session) == "primary"
+        session.commit()
+        assert read_username(session) == "replica0"  # a new transaction
+        session.commit()
+        session.use_primary()
+        assert read_username(session) == "primary"
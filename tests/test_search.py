@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from sqlalchemy import bindparam, create_engine, select
+from sqlalchemy.orm import Session
+
+from models import ResumeOrm, WorkerOrm
+from queries.search import FULLTEXT, FUZZY, TRIGRAM, explain, run_explain, search_query, uses_index
+
+from .conftest import add_workers
+
+
+def test_explain_binds_values(session):
+    # inlined into a text() ':b' was a bind and '50%' got its % doubled
+    add_workers(session, [1])
+    query = select(WorkerOrm).filter(WorkerOrm.username.in_(["a:b", "50%"]), WorkerOrm.id > bindparam("min_id"))
+    plan = run_explain(session, query, "QUERY PLAN", dict(min_id=0))
+    assert plan
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize("mode", [TRIGRAM, FUZZY, FULLTEXT])
+def test_title_search_uses_the_gin_index(mode):
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    index_name = "resumes_title_tsv_index" if mode == FULLTEXT else "resumes_title_trgm_index"
+    try:
+        with Session(engine) as session:
+            plan = explain(session, search_query(ResumeOrm, "50% python", mode), force_index=True)
+            session.rollback()
+    finally:
+        engine.dispose()
+    assert uses_index(plan, index_name), plan
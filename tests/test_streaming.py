@@ -0,0 +1,56 @@
+import asyncio
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+import database
+from models import WorkerOrm
+from queries.orm import AsyncOrm, SyncOrm
+from queries.streaming import stream_batches
+
+from .conftest import add_workers, count_statements
+
+RESUME_COUNTS = [0, 1, 2, 3, 4]
+
+
+def test_stream_workers_with_resumes_over_batches(engine, session_factory, monkeypatch):
+    # the app's sessions, with every listener installed on them
+    monkeypatch.setattr(database, "session_factory", session_factory, raising=False)
+    with session_factory() as session:
+        add_workers(session, RESUME_COUNTS)
+    statements = count_statements(engine)
+
+    batches = list(SyncOrm.stream_workers(batch_size=2))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    # resumes came with the batch, len() didn't lazy load them
+    assert [len(worker.resumes) for batch in batches for worker in batch] == RESUME_COUNTS
+    assert statements[0] == 1 + 2 * len(batches)  # the stream, a batch by id and its resumes
+
+
+def test_stream_batches_with_a_do_orm_execute_listener(engine, session_factory):
+    event.listen(session_factory, "do_orm_execute", lambda orm_execute_state: None)
+    with session_factory() as session:
+        add_workers(session, RESUME_COUNTS)
+        query = select(WorkerOrm).order_by(WorkerOrm.id)
+        batches = list(stream_batches(session, query, 3, load=[selectinload(WorkerOrm.resumes)]))
+        assert [[len(w.resumes) for w in batch] for batch in batches] == [[0, 1, 2], [3, 4]]
+
+
+def test_stream_workers_async(engine, session_factory, db_path, monkeypatch):
+    with session_factory() as session:
+        add_workers(session, RESUME_COUNTS)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    monkeypatch.setattr(database, "async_session_factory", async_sessionmaker(async_engine), raising=False)
+
+    async def stream():
+        try:
+            return [
+                [len(worker.resumes) for worker in batch]
+                async for batch in AsyncOrm.stream_workers(batch_size=2)
+            ]
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(stream()) == [[0, 1], [2, 3], [4]]
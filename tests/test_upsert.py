@@ -0,0 +1,83 @@
+from sqlalchemy import event, func, select
+
+from models import ResumeOrm, WorkerOrm, Workload
+from queries import upsert as upsert_module
+from queries.upsert import RESUME_KEY, insert_missing, upsert, upsert_workers_with_resumes
+
+
+def feed(workers: int, resumes_each: int):
+    workers_rows = [dict(username=f"worker{i}") for i in range(workers)]
+    resume_rows = [
+        dict(worker=f"worker{i}", title=f"Python developer {n}", compensation=50_000 + n, workload=Workload.fulltime)
+        for i in range(workers)
+        for n in range(resumes_each)
+    ]
+    return workers_rows, resume_rows
+
+
+def counts(session) -> tuple[int, int]:
+    return (
+        session.scalar(select(func.count()).select_from(WorkerOrm)),
+        session.scalar(select(func.count()).select_from(ResumeOrm)),
+    )
+
+
+def test_rerunning_a_feed_returns_the_same_ids(session):
+    first = upsert_workers_with_resumes(session, *feed(3, 2))
+    session.commit()
+    again = upsert_workers_with_resumes(session, *feed(3, 2))
+    session.commit()
+
+    assert counts(session) == (3, 6)
+    assert again["workers"].ids == first["workers"].ids
+    assert again["resumes"].ids == first["resumes"].ids
+    workers = dict(session.execute(select(WorkerOrm.username, WorkerOrm.id)).all())
+    assert first["workers"].ids == workers
+    resumes = session.execute(select(ResumeOrm.id, ResumeOrm.worker_id, ResumeOrm.title))
+    resumes = {(worker_id, title): id for id, worker_id, title in resumes}
+    assert first["resumes"].ids == resumes
+
+
+def test_update_columns(session):
+    upsert(session, ResumeOrm, [])  # nothing to send, no statement
+    [worker_id] = upsert(session, WorkerOrm, [dict(username="worker")]).ids.values()
+    row = dict(worker_id=worker_id, title="Python developer", compensation=50_000, workload=Workload.fulltime)
+    upsert(session, ResumeOrm, [row])
+    upsert(session, ResumeOrm, [dict(row, compensation=60_000)], update_columns=())
+    assert session.scalar(select(ResumeOrm.compensation)) == 50_000
+    upsert(session, ResumeOrm, [dict(row, compensation=70_000)])
+    assert session.scalar(select(ResumeOrm.compensation)) == 70_000
+
+
+def test_duplicate_keys_in_a_batch(session):
+    result = upsert(session, WorkerOrm, [dict(username="a"), dict(username="b"), dict(username="a")])
+    assert (result.rows, result.batches, len(result.ids)) == (2, 1, 2)
+
+
+def test_rows_are_streamed_in_batches_under_the_bind_limit(session, engine, monkeypatch):
+    monkeypatch.setattr(upsert_module, "MAX_BIND_PARAMS", 10)
+    consumed = []
+    consumed_at_statement = []
+    event.listen(engine, "before_cursor_execute", lambda *args: consumed_at_statement.append(len(consumed)))
+
+    def rows():
+        for i in range(12):
+            consumed.append(i)
+            yield dict(id=100 + i, username=f"worker{i}")  # 2 bind parameters a row
+
+    result = upsert(session, WorkerOrm, rows(), batch_size=1000)
+    assert (result.rows, result.batches) == (12, 3)
+    # a statement of 5 rows is sent once the 6th one is read, not after the whole feed
+    assert consumed_at_statement == [6, 11, 12]
+
+
+def test_insert_missing_leaves_existing_rows(session):
+    [worker_id] = upsert(session, WorkerOrm, [dict(username="worker")]).ids.values()
+    row = dict(worker_id=worker_id, title="Python developer", compensation=50_000, workload=Workload.fulltime)
+    first = insert_missing(session, ResumeOrm, [row], RESUME_KEY)
+    again = insert_missing(
+        session, ResumeOrm, [dict(row, compensation=60_000), dict(row, title="Data engineer")], RESUME_KEY
+    )
+    assert again.ids[worker_id, "Python developer"] == first.ids[worker_id, "Python developer"]
+    assert counts(session) == (1, 2)
+    assert session.scalar(select(ResumeOrm.compensation).filter(ResumeOrm.title == "Python developer")) == 50_000
@@ -0,0 +1,171 @@
+"""
+Write sessions: unit of work flushes of many objects.
+
+    with write_session_factory() as session:
+        session.add_all(resumes)
+        session.commit()
+    print(flush_reports(session))  # [FlushReport(objects=10000, statements={'INSERT resumes': 2, ...})]
+
+A write session (database.write_session_factory / async_write_session_factory)
+  - INSERTs DB_WRITE_BATCH_SIZE rows a statement: INSERT ... VALUES (...), (...)
+    RETURNING id is sent in pages of insertmanyvalues_page_size, 1000 by default.
+    The dialect still caps a page at its bind parameter limit (32767 on postgres)
+  - doesn't autoflush, a query between add_all()s doesn't flush half of a batch
+  - keeps a FlushReport of every flush: cursor executions and rows per
+    statement kind and table, rows / count is the batch size the flush got
+  - with DB_WRITE_ALIGN_UPDATES (or session.info[ALIGN_UPDATES]) pads dirty
+    objects of a mapper to one column set, see align_updates()
+
+INSERTs don't fetch server defaults back unless DB_EAGER_DEFAULTS (models.py).
+UPDATEs of one mapper with the same changed columns already go as one
+executemany. They fall back to a statement per row when a row needs RETURNING
+(eager defaults with a server onupdate, version_id_col) or a value is a SQL expression.
+"""
+
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import ExecuteStyle
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+import config
+
+WRITE_SESSION = "write_session"  # session.info, flush reports on
+ALIGN_UPDATES = "align_updates"  # session.info, overrides DB_WRITE_ALIGN_UPDATES
+FLUSH_REPORTS = "flush_reports"  # session.info, FlushReport list, newest last
+MAX_FLUSH_REPORTS = 100  # kept per session
+
+_current_flush: ContextVar["FlushReport | None"] = ContextVar("current_flush_report", default=None)
+
+
+@dataclass
+class FlushReport:
+    objects: int  # new, dirty and deleted objects at the start of the flush
+    statements: Counter = field(default_factory=Counter)  # "INSERT resumes" -> cursor executions
+    rows: Counter = field(default_factory=Counter)  # parameter sets sent with them
+    duration: float = 0.0  # seconds
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def total(self) -> int:
+        return sum(self.statements.values())
+
+    def report(self) -> dict:
+        return dict(
+            objects=self.objects,
+            statements=self.total,
+            ms=round(self.duration * 1000, 2),
+            by_statement={
+                key: dict(count=count, rows=self.rows[key])
+                for key, count in self.statements.most_common()
+            },
+        )
+
+
+def write_engine(engine):
+    ## same pool and events, bigger insertmanyvalues pages; works for AsyncEngine too
+    return engine.execution_options(insertmanyvalues_page_size=config.settings.DB_WRITE_BATCH_SIZE)
+
+
+def write_session_options() -> dict:
+    # sessionmaker / async_sessionmaker kwargs besides bind
+    return dict(autoflush=False, info={WRITE_SESSION: True})
+
+
+def flush_reports(session) -> list[FlushReport]:
+    # Session or AsyncSession, also after it was closed
+    session = getattr(session, "sync_session", session)
+    return session.info.get(FLUSH_REPORTS, [])
+
+
+########################################3
+# UPDATE COLUMN SETS
+
+
+def align_updates(session: Session):
+    """
+    Dirty objects of a mapper get every column changed on any of them flagged modified,
+    so the UPDATEs share one column set and one executemany instead of a group per set.
+    Only loaded values are padded, and a padded column is written back with the value
+    this session loaded: a concurrent change to it is lost. That's why it's opt in.
+    """
+    changed_by_mapper = defaultdict(list)
+    for obj in session.dirty:
+        state = inspect(obj)
+        changed = set(state.committed_state) & _updatable_keys(state.mapper)
+        if changed:
+            changed_by_mapper[state.mapper].append((state, changed))
+    for states in changed_by_mapper.values():
+        columns = set().union(*(changed for _, changed in states))
+        for state, changed in states:
+            for key in columns - changed:
+                if key in state.dict:
+                    flag_modified(state.obj(), key)
+
+
+def _updatable_keys(mapper) -> set[str]:
+    return {
+        prop.key
+        for prop in mapper.column_attrs
+        if not any(getattr(column, "primary_key", False) for column in prop.columns)
+    }
+
+
+########################################3
+# EVENT HOOKS
+
+
+@event.listens_for(Session, "before_flush")
+def _start_flush(session, flush_context, instances):
+    if not session.info.get(WRITE_SESSION):
+        return
+    if session.info.get(ALIGN_UPDATES, config.settings.DB_WRITE_ALIGN_UPDATES):
+        align_updates(session)
+    _current_flush.set(FlushReport(objects=len(session.new) + len(session.dirty) + len(session.deleted)))
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _end_flush(session, flush_context):
+    report = _current_flush.get()
+    if report is None or not session.info.get(WRITE_SESSION):
+        return
+    _current_flush.set(None)
+    report.duration = time.perf_counter() - report.started
+    reports = session.info.setdefault(FLUSH_REPORTS, [])
+    reports.append(report)
+    del reports[:-MAX_FLUSH_REPORTS]
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _failed_flush(session, previous_transaction):
+    # a failed flush never gets to after_flush_postexec
+    if session.info.get(WRITE_SESSION):
+        _current_flush.set(None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    report = _current_flush.get()
+    if report is None:
+        return
+    stmt = getattr(getattr(context, "compiled", None), "statement", None)
+    if getattr(stmt, "is_dml", False) and getattr(stmt, "table", None) is not None:
+        key = f"{stmt.__visit_name__.upper()} {stmt.table.name}"
+    else:
+        key = statement.split(None, 1)[0].upper()
+    report.statements[key] += 1
+    report.rows[key] += _rows(parameters, context, executemany)
+
+
+def _rows(parameters, context, executemany: bool) -> int:
+    if not executemany:
+        return 1
+    if context.execute_style is ExecuteStyle.INSERTMANYVALUES:
+        # one page, parameters of all its rows in one tuple / dict; a downgraded page has one row
+        return max(len(parameters) // max(len(context.compiled_parameters[0]), 1), 1)
+    return len(parameters)